@@ -74,5 +74,59 @@ runner_kwargs = dict(agent=root_agent, app_name="cymbal_agent", session_service=
 if memory_service:
     runner_kwargs["memory_service"] = memory_service
 
-runner = Runner(**runner_kwargs)
-__all__ = ["runner"]
\ No newline at end of file
+# --- Answer cache (optional): repeated first-turn questions are answered without running the agent ---
+from .tools import knowledge_search_tools
+
+if os.getenv("ANSWER_CACHE_ENABLED", "0") == "1":
+    from .utils.answer_cache import AnswerCache
+    from .utils.caching_runner import CachingRunner
+
+    answer_cache = AnswerCache(
+        embed=knowledge_search_tools.embed_query,
+        similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+        maxsize=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400")),
+        version=knowledge_search_tools.read_index_version,
+        version_check_seconds=float(os.getenv("ANSWER_CACHE_VERSION_CHECK_SECONDS", "60")),
+    )
+    runner = CachingRunner(
+        answer_cache=answer_cache,
+        cacheable_tools=os.getenv("ANSWER_CACHE_TOOLS", "retrieve_documents,retrieve_documents_batch").split(","),
+        first_turn_only=os.getenv("ANSWER_CACHE_FIRST_TURN_ONLY", "1") == "1",
+        **runner_kwargs,
+    )
+    print(f"[ADK] Answer cache ENABLED (similarity>={answer_cache.similarity})")
+else:
+    answer_cache = None
+    runner = Runner(**runner_kwargs)
+
+# --- Shared client warm-up: open connections/channels before the first tool call ---
+# Runs in a background thread so the heavy client libraries load off the import (cold-start) path;
+# "sync" warms before the import returns, "0" leaves every client to its first use.
+# The query embedding cache (QUERY_CACHE_WARM_FILE) is warmed after the clients, on the same thread.
+from .utils.clients import warm_clients
+
+_warm_mode = os.getenv("CLIENT_WARM_ON_STARTUP", "1")
+_warm_endpoint = (knowledge_search_tools.VECTOR_DEFAULT_API_ENDPOINT
+                  if knowledge_search_tools.VECTOR_SEARCH_BACKEND == "vertex" else None)
+
+def _warm_query_cache():
+    if not knowledge_search_tools.QUERY_CACHE_WARM_FILE:
+        return
+    try:
+        knowledge_search_tools.warm_query_embedding_cache_from_file(knowledge_search_tools.QUERY_CACHE_WARM_FILE)
+    except Exception as e:
+        print(f"[WARN] Query embedding cache warm-up failed: {e}")
+
+def _warm_up(clients: bool):
+    if clients:
+        warm_clients(_warm_endpoint)
+    _warm_query_cache()
+
+if _warm_mode == "sync":
+    _warm_up(clients=True)
+elif _warm_mode == "1" or knowledge_search_tools.QUERY_CACHE_WARM_FILE:
+    import threading
+    threading.Thread(target=_warm_up, args=(_warm_mode == "1",), name="warm-clients", daemon=True).start()
+
+__all__ = ["runner", "answer_cache"]
\ No newline at end of file
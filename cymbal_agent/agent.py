@@ -32,6 +32,7 @@ agent = Agent(
    Toolset:
    1. knowledge_search_tools (📄 Internal Knowledge)
       - retrieve_documents for policy/onboarding/architecture questions
+      - retrieve_documents_batch when a question needs several queries at once (one call, results merged)
       - upsert_docs (or equivalent) when content changes to keep the index fresh
 
    2. website_search_tools (🌐 Web)
@@ -43,7 +44,7 @@ agent = Agent(
 
    Operating Rules:
    1) QUERY DOCUMENTS (KNOWLEDGE SEARCH)
-      - Run retrieve_documents with a focused query.
+      - Run retrieve_documents with a focused query; if you need several angles, pass them all to retrieve_documents_batch in one call.
       - Read all chunks, synthesize a clear answer grounded in those chunks.
       - If chunks don’t answer the question, state that internal info is insufficient and continue with Website Search.
       - Include “Sources & Trace” with internal doc titles/IDs.
@@ -81,6 +82,7 @@ agent = Agent(
     tools=[
         # RAG query tools
         knowledge_search_tools.query_documents_tool,
+        knowledge_search_tools.query_documents_batch_tool,
       #   knowledge_search_tools.build_and_upsert,
         website_search_tools.google_search_tool,
         website_search_tools.fetch_search_pages_tool,
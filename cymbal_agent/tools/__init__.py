@@ -4,6 +4,7 @@ from .datetime_tools import (
 
 from .knowledge_search_tools import (
     query_documents_tool,
+    query_documents_batch_tool,
 )
 
 from .website_search_tools import (
@@ -5,17 +5,45 @@ This module ingests and queries enterprise documents using Google Cloud Vertex A
 and is designed to be wrapped as ADK tools/actions.
 """
 
-import os, io, uuid
-import json, hashlib
-from typing import List, Dict, Tuple
-import vertexai
-
-from google.cloud import aiplatform_v1
-# from google.genai import Client as GenAIClient
-from google import genai
-from google.genai.types import EmbedContentConfig
+import os, uuid, time, shutil
+import json, hashlib, itertools, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Type, TypeVar
+
+import numpy as np
+
+# google.cloud.aiplatform / google.genai are imported where they are used (first call),
+# so importing this module stays off the cold-start path
 from google.adk.tools import ToolContext, FunctionTool
 
+from ..utils import local_vector_index
+from ..utils.clients import get_genai_client, get_match_client, get_matching_engine_index, get_storage_client
+from ..utils.local_vector_index import Neighbor
+from ..utils.ivf_index import IvfConfig
+from ..utils.vector_compression import CompressionConfig
+from ..utils.ttl_cache import LRUTTLCache
+from ..utils.embedding_store import EmbeddingStore, embedding_key
+from ..utils.ingest_manifest import IngestManifest
+from ..utils.embed_batching import ThroughputStats, estimate_tokens, pack_batches, pack_by_size
+from ..utils.adaptive_control import AdaptiveControl, AimdLimit
+from ..utils.text_extractors import ExtractorRegistry
+from ..utils.extracted_text_store import ExtractedTextStore
+from ..utils.pipeline import Stage, run_pipeline
+from ..utils.ingest_checkpoint import IngestCheckpoint
+from ..utils.chunk_store import ChunkStore
+from ..utils.sqlite_sidecar import SqliteSidecar
+from ..utils.mapping_store import JsonMappingStore, SegmentedMappingStore
+from ..utils.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from ..utils.near_dup import NearDupIndex
+from ..utils.content_chunking import content_chunk_id, content_defined_chunks
+from ..utils.gcs_listing import iter_objects
+from ..utils.ingest_shards import GcsLeaseBackend, LeaseKeeper, LeaseLost, LocalLeaseBackend, ShardLeases, shard_of
+from ..utils.result_shaping import apply_token_budget, filter_by_score, mmr
+
+if TYPE_CHECKING:
+    from google.cloud.aiplatform import MatchingEngineIndex
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -28,57 +56,373 @@ VECTOR_DEFAULT_EMBED_DIM = int(os.getenv("VECTOR_DEFAULT_EMBED_DIM"))
 VECTOR_DEFAULT_INDEX_ENDPOINT = os.getenv("VECTOR_DEFAULT_INDEX_ENDPOINT")
 VECTOR_DEFAULT_DEPLOYED_ID = os.getenv("VECTOR_DEFAULT_DEPLOYED_ID")
 VECTOR_DEFAULT_API_ENDPOINT = os.getenv("VECTOR_DEFAULT_API_ENDPOINT")
+# Distance measure the Vertex index was created with; used to turn distances into similarities
+VECTOR_DISTANCE_MEASURE = os.getenv("VECTOR_DISTANCE_MEASURE", "DOT_PRODUCT_DISTANCE")
+
+# Retrieval backend: "vertex" (Vector Search endpoint) or "local" (memory-mapped index on disk)
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "vertex").lower()
+VECTOR_LOCAL_INDEX_DIR = os.getenv("VECTOR_LOCAL_INDEX_DIR")
+VECTOR_LOCAL_RELOAD_SECONDS = float(os.getenv("VECTOR_LOCAL_RELOAD_SECONDS", "30"))
+# Coarse-to-fine local search: "int8", "binary" or "float32" codes, an optional Matryoshka prefix
+# and the rescore factor (candidates per result). Unset = exact search over the full vectors.
+VECTOR_LOCAL_COMPRESSION = CompressionConfig.parse(":".join([
+    os.getenv("VECTOR_LOCAL_COMPRESSION", "none"),
+    os.getenv("VECTOR_LOCAL_PREFIX_DIM", "0"),
+    os.getenv("VECTOR_LOCAL_RESCORE_FACTOR", "10"),
+]))
+# Approximate local search: "ivf" clusters the vectors into NLIST lists (0 = ~4*sqrt(rows)) and scores
+# only the NPROBE closest lists per query. Lists are maintained by build_and_upsert.
+VECTOR_LOCAL_ANN = IvfConfig(
+    nlist=int(os.getenv("VECTOR_LOCAL_IVF_NLIST", "0")),
+    nprobe=int(os.getenv("VECTOR_LOCAL_IVF_NPROBE", "16")),
+) if os.getenv("VECTOR_LOCAL_ANN", "none").lower() == "ivf" else None
+
+# Retrieval mode: "vector", "hybrid" (BM25 + vector fused by reciprocal rank) or "auto"
+# (BM25 alone when the lexical match is confident, hybrid otherwise). BM25 modes need LEXICAL_INDEX_URI.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+LEXICAL_INDEX_URI = os.getenv("LEXICAL_INDEX_URI")
+LEXICAL_RELOAD_SECONDS = float(os.getenv("LEXICAL_RELOAD_SECONDS", "300"))
+LEXICAL_CONFIDENT_SCORE = float(os.getenv("LEXICAL_CONFIDENT_SCORE", "0.6"))
+LEXICAL_CONFIDENT_MAX_TERMS = int(os.getenv("LEXICAL_CONFIDENT_MAX_TERMS", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Chunk-text store (SQLite, optionally mirrored to GCS). When set, Vector Search returns
+# IDs/distances only and texts come from here; datapoints stop carrying text in restricts.
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH")
+CHUNK_STORE_GCS_URI = os.getenv("CHUNK_STORE_GCS_URI")
+CHUNK_STORE_REFRESH_SECONDS = float(os.getenv("CHUNK_STORE_REFRESH_SECONDS", "300"))
+VECTOR_TEXT_IN_RESTRICTS = os.getenv("VECTOR_TEXT_IN_RESTRICTS", "0" if CHUNK_STORE_PATH else "1") == "1"
+
+# embed_texts request packing and concurrency
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "250"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "20000"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+
+# Vector Search upserts: payload cap per request (bytes: vector, ID and, in the legacy layout, chunk text),
+# datapoints per request, concurrent requests
+VECTOR_UPSERT_MAX_BYTES = int(os.getenv("VECTOR_UPSERT_MAX_BYTES", "3500000"))
+VECTOR_UPSERT_MAX_DATAPOINTS = int(os.getenv("VECTOR_UPSERT_MAX_DATAPOINTS", "1000"))
+VECTOR_UPSERT_MAX_CONCURRENCY = int(os.getenv("VECTOR_UPSERT_MAX_CONCURRENCY", "4"))
+
+# Retries of embedding / upsert calls on quota, deadline and transient errors (full-jitter exponential backoff).
+# Concurrency and batch budgets adapt (AIMD) between a floor and the maxima above.
+API_RETRY_MAX_ATTEMPTS = int(os.getenv("API_RETRY_MAX_ATTEMPTS", "6"))
+API_RETRY_BASE_SECONDS = float(os.getenv("API_RETRY_BASE_SECONDS", "1"))
+API_RETRY_MAX_SECONDS = float(os.getenv("API_RETRY_MAX_SECONDS", "60"))
+
+# PDF extraction: parallel worker processes, per-file wall clock / memory caps, page fan-out
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS") or os.cpu_count() or 1)
+PDF_EXTRACT_TIMEOUT_SECONDS = float(os.getenv("PDF_EXTRACT_TIMEOUT_SECONDS", "300"))
+PDF_EXTRACT_MAX_MEMORY_MB = int(os.getenv("PDF_EXTRACT_MAX_MEMORY_MB", "2048"))
+PDF_SPLIT_PAGES = int(os.getenv("PDF_SPLIT_PAGES", "200"))
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS") or os.cpu_count() or 1)
+
+# Text-extraction engine per file extension (text | pypdf2 | pymupdf | html | docx); only these
+# extensions are ingested. Extracted text is cached per object URI + generation + engine
+# (SQLite file, optionally mirrored to GCS), so an object version is parsed once.
+TEXT_EXTRACTORS = ExtractorRegistry.from_spec(
+    os.getenv("TEXT_EXTRACTORS", ".pdf=pypdf2,.txt=text"),
+    options={"pypdf2": {
+        "timeout": PDF_EXTRACT_TIMEOUT_SECONDS,
+        "max_memory_mb": PDF_EXTRACT_MAX_MEMORY_MB,
+        "split_pages": PDF_SPLIT_PAGES,
+        "page_workers": PDF_PAGE_WORKERS,
+    }},
+)
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH")
+EXTRACT_CACHE_GCS_URI = os.getenv("EXTRACT_CACHE_GCS_URI")
+
+# GCS listing: concurrent listers, and how many "/" levels below the prefix are split into separately listed parts
+GCS_LIST_WORKERS = int(os.getenv("GCS_LIST_WORKERS", "8"))
+GCS_LIST_PARTITION_DEPTH = int(os.getenv("GCS_LIST_PARTITION_DEPTH", "1"))
+
+# Streaming ingestion: batch size (chunks), stage parallelism and queue depth between stages
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "250"))
+INGEST_DOWNLOAD_WORKERS = int(os.getenv("INGEST_DOWNLOAD_WORKERS", "8"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+# Progress checkpoint (gs:// or local path; defaults to <mapping>.checkpoint.json) and flush interval in batches
+INGEST_CHECKPOINT_URI = os.getenv("INGEST_CHECKPOINT_URI")
+INGEST_CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "10"))
+# Datapoint IDs: "path" (file path + chunk position) or "content" (hash of the chunk text, content-defined
+# chunk boundaries; renamed/moved files and unchanged chunks of edited files are not re-embedded)
+INGEST_ID_MODE = os.getenv("INGEST_ID_MODE", "path").strip().lower()
+# Sharded ingestion: work area for plans, shard manifests and partial mappings (defaults to <mapping>shards/),
+# lease records (gs:// prefix or a local directory; defaults to the plan's leases/ folder) and lease lifetime
+INGEST_SHARD_WORK_URI = os.getenv("INGEST_SHARD_WORK_URI")
+INGEST_SHARD_LEASE_URI = os.getenv("INGEST_SHARD_LEASE_URI")
+INGEST_SHARD_LEASE_SECONDS = float(os.getenv("INGEST_SHARD_LEASE_SECONDS", "600"))
+
+# Near-duplicate chunk suppression (MinHash + LSH); enabled by setting where its index is kept
+NEAR_DUP_INDEX_URI = os.getenv("NEAR_DUP_INDEX_URI")
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+
+# Knowledge index version marker (gs:// or local path), rewritten after every ingest that changed the index;
+# consumers such as the answer cache drop state derived from an older version
+KNOWLEDGE_INDEX_VERSION_URI = os.getenv("KNOWLEDGE_INDEX_VERSION_URI")
+
+# Segmented mapping (mapping URIs ending in "/"): entries per segment, compact past this many segments
+MAPPING_SEGMENT_MAX_ENTRIES = int(os.getenv("MAPPING_SEGMENT_MAX_ENTRIES", "50000"))
+MAPPING_MAX_SEGMENTS = int(os.getenv("MAPPING_MAX_SEGMENTS", "32"))
+
+# Query-embedding cache (LRU + TTL); optional newline-delimited warm-up file
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "86400"))
+QUERY_CACHE_WARM_FILE = os.getenv("QUERY_CACHE_WARM_FILE")
+
+# Query embeddings (cache misses of retrieve_documents): parallel requests and a short retry budget, with
+# AIMD state separate from ingestion so a bulk run's throttling never queues or slows user queries
+QUERY_EMBED_MAX_CONCURRENCY = int(os.getenv("QUERY_EMBED_MAX_CONCURRENCY", "8"))
+QUERY_EMBED_MAX_ATTEMPTS = int(os.getenv("QUERY_EMBED_MAX_ATTEMPTS", "2"))
+QUERY_EMBED_MAX_RETRY_SECONDS = float(os.getenv("QUERY_EMBED_MAX_RETRY_SECONDS", "1"))
+
+# retrieve_documents_batch: most queries accepted per call
+RETRIEVE_BATCH_MAX_QUERIES = int(os.getenv("RETRIEVE_BATCH_MAX_QUERIES", "10"))
 
+# Result shaping: similarity floor, adaptive k (cut at a score drop larger than the gap), MMR
+# diversification (lambda in [0, 1], unset = off) over a larger candidate pool, and a token budget
+RESULT_MIN_SCORE = float(os.getenv("RESULT_MIN_SCORE")) if os.getenv("RESULT_MIN_SCORE") else None
+RESULT_SCORE_GAP = float(os.getenv("RESULT_SCORE_GAP")) if os.getenv("RESULT_SCORE_GAP") else None
+RESULT_MMR_LAMBDA = float(os.getenv("RESULT_MMR_LAMBDA")) if os.getenv("RESULT_MMR_LAMBDA") else None
+RESULT_CANDIDATE_FACTOR = int(os.getenv("RESULT_CANDIDATE_FACTOR", "3"))
+RESULT_TOKEN_BUDGET = int(os.getenv("RESULT_TOKEN_BUDGET", "4000"))
 
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-# genai_client = GenAIClient(api_key=VERTEX_API_KEY)
-genai_client = genai.Client(vertexai=True)
+# Persistent chunk-embedding cache for ingestion (SQLite file, optionally mirrored to GCS)
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")
+EMBED_CACHE_GCS_URI = os.getenv("EMBED_CACHE_GCS_URI")
 
-def embed_texts(texts: List[str], dim: int = VECTOR_DEFAULT_EMBED_DIM) -> List[List[float]]:
-    """Generate embeddings for a list of texts using Gemini embedding model."""
-    resp = genai_client.models.embed_content(
+
+_embed_stats = ThroughputStats()
+
+
+def _adaptive_control(name: str, max_concurrency: int, max_batch: int) -> AdaptiveControl:
+    """Start at half of each maximum, grow additively on success, halve on throttling (floor: 1 / max_batch/16)."""
+    max_concurrency, max_batch = max(max_concurrency, 1), max(max_batch, 1)
+    return AdaptiveControl(
+        name,
+        concurrency=AimdLimit(initial=max(max_concurrency // 2, 1), minimum=1, maximum=max_concurrency, step=1),
+        batch=AimdLimit(initial=max(max_batch // 2, 1), minimum=max(max_batch // 16, 1), maximum=max_batch,
+                        step=max(max_batch // 10, 1)),
+        max_attempts=API_RETRY_MAX_ATTEMPTS,
+        base_delay=API_RETRY_BASE_SECONDS,
+        max_delay=API_RETRY_MAX_SECONDS,
+    )
+
+
+# batch budgets: estimated tokens per embed request, payload bytes per upsert request
+_embed_control = _adaptive_control("embed_content", EMBED_MAX_CONCURRENCY, EMBED_BATCH_MAX_TOKENS)
+_upsert_control = _adaptive_control("upsert_datapoints", VECTOR_UPSERT_MAX_CONCURRENCY, VECTOR_UPSERT_MAX_BYTES)
+# queries: at most ~QUERY_EMBED_MAX_RETRY_SECONDS of backoff in total, no batch budget (one small request per call)
+_query_embed_control = AdaptiveControl(
+    "embed_query",
+    concurrency=AimdLimit(initial=max(QUERY_EMBED_MAX_CONCURRENCY, 1), minimum=1,
+                          maximum=max(QUERY_EMBED_MAX_CONCURRENCY, 1), step=1),
+    max_attempts=QUERY_EMBED_MAX_ATTEMPTS,
+    base_delay=QUERY_EMBED_MAX_RETRY_SECONDS / 4,
+    max_delay=QUERY_EMBED_MAX_RETRY_SECONDS,
+)
+
+
+def _embed_batch(texts: List[str], dim: int) -> np.ndarray:
+    """One embed_content call -> float32 array (len(texts) x dim)."""
+    from google.genai.types import EmbedContentConfig
+
+    resp = get_genai_client().models.embed_content(
         model=VECTOR_DEFAULT_MODEL_NAME,
         contents=texts,
         config=EmbedContentConfig(
-            task_type="RETRIEVAL_DOCUMENT",
-            output_dimensionality=dim
+            task_type="RETRIEVAL_DOCUMENT",  # good default for RAG docs/queries
+            output_dimensionality=dim       # 3072 / 1536 / 768
         ),
     )
-    return [e.values for e in resp.embeddings]
+    # copy row by row so the response's Python float lists are only alive for one request
+    out = np.empty((len(resp.embeddings), dim), dtype=np.float32)
+    for i, e in enumerate(resp.embeddings):
+        out[i] = e.values
+    return out
+
+
+def embed_texts(texts: List[str], dim: int = VECTOR_DEFAULT_EMBED_DIM) -> np.ndarray:
+    """
+    Generate embeddings for a list of texts using Gemini embedding model.
+
+    Texts are packed into requests by count (EMBED_BATCH_MAX_TEXTS) and an
+    estimated-token budget that adapts up to EMBED_BATCH_MAX_TOKENS; up to
+    EMBED_MAX_CONCURRENCY requests run at once (fewer after throttling), and
+    quota/deadline/transient errors are retried with backoff. Results come back
+    in input order as one contiguous float32 array (len(texts) x dim): 4 bytes
+    per value instead of a ~32-byte Python float.
+    """
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    batches = pack_batches(texts, EMBED_BATCH_MAX_TEXTS, _embed_control.batch_limit())
+
+    def run(idx: List[int]) -> np.ndarray:
+        return _embed_control.call(_embed_batch, [texts[i] for i in idx], dim)
+
+    start = time.perf_counter()
+    out = np.empty((len(texts), dim), dtype=np.float32)
+    workers = min(_embed_control.max_concurrency, len(batches))
+    if workers <= 1:
+        results = map(run, batches)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+        results = pool.map(run, batches)
+    try:
+        for idx, vecs in zip(batches, results):
+            out[idx] = vecs
+    finally:
+        if workers > 1:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    _embed_stats.record(
+        texts=len(texts),
+        tokens=sum(estimate_tokens(t) for t in texts),
+        requests=len(batches),
+        seconds=time.perf_counter() - start,
+    )
+    return out
+
+
+def embedding_throughput_stats() -> Dict:
+    """Cumulative embed_texts throughput (texts/s, estimated tokens/s) and the adaptive limits/retries."""
+    return {**_embed_stats.snapshot(), "control": _embed_control.snapshot(),
+            "query_control": _query_embed_control.snapshot()}
+
+
+def vector_upsert_stats() -> Dict:
+    """Adaptive limits and retry counters of Vector Search upsert/remove calls."""
+    return _upsert_control.snapshot()
+
+
+# ========= QUERY EMBEDDING CACHE =========
+_query_embedding_cache = LRUTTLCache(maxsize=QUERY_CACHE_MAX_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _query_cache_key(query: str, dim: int) -> Tuple[str, str, int]:
+    return (_normalize_query(query), VECTOR_DEFAULT_MODEL_NAME, dim)
+
+
+def embed_query(query: str, dim: int = VECTOR_DEFAULT_EMBED_DIM) -> np.ndarray:
+    """Embed a search query, served from the LRU/TTL cache when possible."""
+    return embed_queries([query], dim=dim)[0]
+
+
+def embed_queries(queries: List[str], dim: int = VECTOR_DEFAULT_EMBED_DIM) -> List[np.ndarray]:
+    """
+    Embed several search queries; cache misses go out in one request (per
+    EMBED_BATCH_MAX_TEXTS) through the query controller, not embed_texts:
+    a user query fails fast instead of waiting out ingestion backoff.
+    """
+    keys = [_query_cache_key(q, dim) for q in queries]
+    vecs = [_query_embedding_cache.get(key) for key in keys]
+    misses: Dict[Tuple[str, str, int], List[int]] = {}
+    for i, (key, vec) in enumerate(zip(keys, vecs)):
+        if vec is None:
+            misses.setdefault(key, []).append(i)
+    if misses:
+        texts = [queries[idx[0]] for idx in misses.values()]
+        fresh = np.concatenate([
+            _query_embed_control.call(_embed_batch, texts[i:i + EMBED_BATCH_MAX_TEXTS], dim)
+            for i in range(0, len(texts), EMBED_BATCH_MAX_TEXTS)
+        ])
+        for (key, idx), vec in zip(misses.items(), fresh):
+            _query_embedding_cache.set(key, vec)
+            for i in idx:
+                vecs[i] = vec
+    return vecs
+
+
+def warm_query_embedding_cache(queries: List[str], dim: int = VECTOR_DEFAULT_EMBED_DIM) -> int:
+    """Pre-embed known frequent queries in one call. Returns how many were added."""
+    pending, seen = [], set()
+    for q in queries:
+        key = _query_cache_key(q, dim)
+        if key[0] and key not in seen and not _query_embedding_cache.peek(key):
+            seen.add(key)
+            pending.append((key, q))
+    if not pending:
+        return 0
+    vecs = embed_texts([q for _, q in pending], dim=dim)
+    for (key, _), vec in zip(pending, vecs):
+        _query_embedding_cache.set(key, vec)
+    return len(pending)
+
+
+def warm_query_embedding_cache_from_file(path: str) -> int:
+    """Warm the query cache from a newline-delimited file of queries (blank lines and #comments skipped)."""
+    with open(path, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    added = warm_query_embedding_cache(queries)
+    print(f"[INFO] Query embedding cache warmed with {added} queries from {path}")
+    return added
+
+
+def query_embedding_cache_stats() -> Dict:
+    """Hit/miss counters and occupancy of the query embedding cache."""
+    return _query_embedding_cache.stats()
 
 
 def _execute_vector_search(query_embedding: List[float], k: int):
     """Execute a vector search query against the index."""
-    client_options = {"api_endpoint": VECTOR_DEFAULT_API_ENDPOINT}
-    vector_search_client = aiplatform_v1.MatchServiceClient(
-        client_options=client_options,
-    )
-    
-    datapoint = aiplatform_v1.IndexDatapoint(feature_vector=query_embedding)
+    return _execute_vector_search_many([query_embedding], k)
+
+
+def _execute_vector_search_many(query_embeddings: List[List[float]], k: int):
+    """Execute several vector search queries against the index in one FindNeighbors request."""
+    from google.cloud import aiplatform_v1
+
+    vector_search_client = get_match_client(VECTOR_DEFAULT_API_ENDPOINT)
     
-    query = aiplatform_v1.FindNeighborsRequest.Query(
-        datapoint=datapoint,
-        neighbor_count=k
-    )
+    queries = [
+        aiplatform_v1.FindNeighborsRequest.Query(
+            datapoint=aiplatform_v1.IndexDatapoint(feature_vector=np.asarray(query_embedding, dtype=np.float32).tolist()),
+            neighbor_count=k
+        )
+        for query_embedding in query_embeddings
+    ]
     
     request = aiplatform_v1.FindNeighborsRequest(
         index_endpoint=VECTOR_DEFAULT_INDEX_ENDPOINT,
         deployed_index_id=VECTOR_DEFAULT_DEPLOYED_ID,
-        queries=[query],
-        return_full_datapoint=True,
+        queries=queries,
+        # with a chunk store, texts are looked up by ID instead of shipped back with full vectors;
+        # MMR still needs the vectors
+        return_full_datapoint=not CHUNK_STORE_PATH or RESULT_MMR_LAMBDA is not None,
     )
     
     return vector_search_client.find_neighbors(request)
 
 
-def _extract_content_from_response(response) -> List[str]:
-    """Extract only the text content from vector search response."""
-    content_chunks = []
-    
-    if not response.nearest_neighbors or not response.nearest_neighbors[0].neighbors:
-        return content_chunks
+def _similarity_from_distance(distance: float) -> float:
+    """Map a Vertex neighbor distance onto a similarity where higher is closer."""
+    if VECTOR_DISTANCE_MEASURE == "DOT_PRODUCT_DISTANCE":
+        return distance
+    if VECTOR_DISTANCE_MEASURE == "COSINE_DISTANCE":
+        return 1.0 - distance
+    return -distance  # SQUARED_L2_DISTANCE / L1_DISTANCE
+
+
+def _extract_neighbors_from_response(response) -> List[Neighbor]:
+    """Extract (id, similarity, text) for each match of the first query in a vector search response."""
+    if not response.nearest_neighbors:
+        return []
+    return _neighbors_from_matches(response.nearest_neighbors[0].neighbors)
+
+
+def _extract_neighbor_lists_from_response(response) -> List[List[Neighbor]]:
+    """One neighbor list per query of a multi-query vector search response, in query order."""
+    return [_neighbors_from_matches(nn.neighbors) for nn in response.nearest_neighbors]
+
+
+def _neighbors_from_matches(matches) -> List[Neighbor]:
+    neighbors = []
     
-    for match in response.nearest_neighbors[0].neighbors:
+    for match in matches or []:
         # Try to get content from restricts first
         content = None
         if hasattr(match.datapoint, 'restricts') and match.datapoint.restricts:
@@ -93,10 +437,248 @@ def _extract_content_from_response(response) -> List[str]:
             if crowding_attr and crowding_attr != "0":
                 content = crowding_attr
         
-        if content:
-            content_chunks.append(content)
+        neighbors.append(Neighbor(
+            match.datapoint.datapoint_id,
+            _similarity_from_distance(match.distance),
+            content or "",
+            list(match.datapoint.feature_vector) or None if RESULT_MMR_LAMBDA is not None else None,
+        ))
     
-    return content_chunks
+    return neighbors
+
+
+class _ChunkStoreHandle:
+    """One opened copy of the chunk store and the number of requests reading it."""
+
+    def __init__(self, path: str, version: str):
+        self.store = ChunkStore(path)
+        self.path = path
+        self.version = version
+        self.readers = 0
+        self.retired = False
+
+
+_chunk_store_lock = threading.Lock()           # guards _chunk_store_state and the reader counts
+_chunk_store_refresh_lock = threading.Lock()   # one pull at a time
+_chunk_store_state = {"handle": None, "checked": 0.0}
+# Pulled copies of the chunk store kept next to CHUNK_STORE_PATH (older ones are deleted)
+CHUNK_STORE_KEEP_VERSIONS = 2
+
+
+def _prune_chunk_store_versions(keep: str):
+    folder, base = os.path.split(os.path.abspath(CHUNK_STORE_PATH))
+    versions = sorted(
+        (os.path.join(folder, n) for n in os.listdir(folder)
+         if n.startswith(base + ".") and n[len(base) + 1:].isdigit() and os.path.join(folder, n) != keep),
+        key=os.path.getmtime,
+    )
+    for path in versions[:max(len(versions) - (CHUNK_STORE_KEEP_VERSIONS - 1), 0)]:
+        # processes still reading an old copy keep their open file; only new opens need the name
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def _load_chunk_store(current: Optional[_ChunkStoreHandle]) -> _ChunkStoreHandle:
+    """
+    The handle to serve from next: `current` if CHUNK_STORE_GCS_URI has not
+    changed, else a new handle on a local copy of the current object
+    generation (CHUNK_STORE_PATH.<generation>). A copy is never overwritten,
+    so readers of an older one, in this or another process, are unaffected.
+    """
+    if not CHUNK_STORE_GCS_URI or (current is None and os.path.exists(CHUNK_STORE_PATH)):
+        # the store ingestion writes on this host, or a copy provisioned with the instance
+        return current or _ChunkStoreHandle(CHUNK_STORE_PATH, "local")
+    bucket_name, path = parse_gcs_uri(CHUNK_STORE_GCS_URI)
+    blob = get_storage_client().bucket(bucket_name).get_blob(path)
+    if blob is None:
+        return current or _ChunkStoreHandle(CHUNK_STORE_PATH, "local")
+    version = str(blob.generation)
+    if current is not None and current.version == version:
+        return current
+    local_path = f"{CHUNK_STORE_PATH}.{version}"
+    if not os.path.exists(local_path):   # another worker process may have pulled this generation already
+        tmp = f"{local_path}.{uuid.uuid4().hex}.download"
+        blob.download_to_filename(tmp)   # `blob` carries its generation, so exactly that one is read
+        os.replace(tmp, local_path)
+        print(f"Pulled {CHUNK_STORE_GCS_URI} (generation {version}) -> {local_path}")
+    _prune_chunk_store_versions(keep=local_path)
+    return _ChunkStoreHandle(local_path, version)
+
+
+def _release_chunk_store(handle: _ChunkStoreHandle):
+    with _chunk_store_lock:
+        handle.readers -= 1
+        if handle.retired and handle.readers == 0:
+            handle.store.close()
+
+
+@contextmanager
+def _query_chunk_store(refresh: bool = False) -> Iterator[ChunkStore]:
+    """
+    Process-wide chunk store for serving, for the duration of one lookup.
+    Pulled from CHUNK_STORE_GCS_URI when there is no local copy; `refresh`
+    checks for a newer generation (at most every CHUNK_STORE_REFRESH_SECONDS)
+    when the index has IDs the copy lacks. A replaced copy is closed once the
+    last lookup using it is done.
+    """
+    st = _chunk_store_state
+    with _chunk_store_lock:
+        due = (refresh and CHUNK_STORE_GCS_URI
+               and time.monotonic() - st["checked"] > CHUNK_STORE_REFRESH_SECONDS)
+        needs_load = st["handle"] is None or due
+    if needs_load:
+        with _chunk_store_refresh_lock:
+            with _chunk_store_lock:
+                current = st["handle"]
+                due = (refresh and CHUNK_STORE_GCS_URI
+                       and time.monotonic() - st["checked"] > CHUNK_STORE_REFRESH_SECONDS)
+            if current is None or due:
+                new = _load_chunk_store(current)   # network and disk work outside the reader lock
+                with _chunk_store_lock:
+                    st["checked"] = time.monotonic()
+                    if new is not current:
+                        st["handle"] = new
+                        if current is not None:
+                            current.retired = True
+                            if current.readers == 0:
+                                current.store.close()
+    with _chunk_store_lock:
+        handle = st["handle"]
+        handle.readers += 1
+    try:
+        yield handle.store
+    finally:
+        _release_chunk_store(handle)
+
+
+def _fill_texts_from_chunk_store(neighbors: List[Neighbor]) -> List[Neighbor]:
+    """Fetch the texts of all text-less neighbors in one bulk lookup."""
+    missing = [n.id for n in neighbors if not n.text]
+    if not missing or not CHUNK_STORE_PATH:
+        return neighbors
+    with _query_chunk_store() as store:
+        texts = store.get_texts(missing)
+    if len(texts) < len(set(missing)) and CHUNK_STORE_GCS_URI:
+        with _query_chunk_store(refresh=True) as store:
+            texts.update(store.get_texts([i for i in missing if i not in texts]))
+    return [n if n.text else n._replace(text=texts.get(n.id, "")) for n in neighbors]
+
+
+def _local_index() -> local_vector_index.LocalVectorIndex:
+    if not VECTOR_LOCAL_INDEX_DIR:
+        raise ValueError("VECTOR_SEARCH_BACKEND=local requires VECTOR_LOCAL_INDEX_DIR")
+    return local_vector_index.open_index(VECTOR_LOCAL_INDEX_DIR, VECTOR_LOCAL_RELOAD_SECONDS,
+                                         compression=VECTOR_LOCAL_COMPRESSION, ann=VECTOR_LOCAL_ANN)
+
+
+def _search_neighbors(query_embedding: List[float], k: int) -> List[Neighbor]:
+    """Run a nearest-neighbor search on the configured backend."""
+    if VECTOR_SEARCH_BACKEND == "local":
+        return _local_index().search(query_embedding, k)
+
+    response = _execute_vector_search(query_embedding, k)
+    return _fill_texts_from_chunk_store(_extract_neighbors_from_response(response))
+
+
+def _search_neighbors_many(query_embeddings: List[List[float]], k: int, fill_texts: bool = True) -> List[List[Neighbor]]:
+    """Nearest-neighbor search for several queries in one backend call (one chunk-store lookup too)."""
+    if VECTOR_SEARCH_BACKEND == "local":
+        return _local_index().search_many(query_embeddings, k, with_vectors=RESULT_MMR_LAMBDA is not None)
+
+    lists = _extract_neighbor_lists_from_response(_execute_vector_search_many(query_embeddings, k))
+    return _fill_text_lists(lists) if fill_texts else lists
+
+
+def _fill_text_lists(lists: List[List[Neighbor]]) -> List[List[Neighbor]]:
+    """_fill_texts_from_chunk_store over several neighbor lists with a single lookup."""
+    filled = iter(_fill_texts_from_chunk_store([n for ns in lists for n in ns]))
+    return [[next(filled) for _ in ns] for ns in lists]
+
+
+_lexical_lock = threading.Lock()
+_lexical_state = {"index": None, "version": None, "checked": 0.0}
+
+
+def _uri_version(uri: str):
+    """Generation of a gs:// object or mtime of a local file; None if it does not exist."""
+    if uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(uri)
+        blob = get_storage_client().bucket(bucket_name).get_blob(path)
+        return blob.generation if blob else None
+    return os.stat(uri).st_mtime_ns if os.path.exists(uri) else None
+
+
+def _query_lexical_index() -> Optional[LexicalIndex]:
+    """
+    Process-wide BM25 index loaded from LEXICAL_INDEX_URI; re-checked every
+    LEXICAL_RELOAD_SECONDS and reloaded only when the published copy changed.
+    """
+    if not LEXICAL_INDEX_URI:
+        return None
+    with _lexical_lock:
+        st = _lexical_state
+        if st["index"] is not None and time.monotonic() - st["checked"] < LEXICAL_RELOAD_SECONDS:
+            return st["index"]
+        st["checked"] = time.monotonic()
+        try:
+            version = _uri_version(LEXICAL_INDEX_URI)
+            if version is not None and version != st["version"]:
+                st["index"] = LexicalIndex.from_bytes(read_uri_bytes(LEXICAL_INDEX_URI))
+                st["version"] = version
+        except Exception as e:
+            print(f"[WARN] Could not load lexical index from {LEXICAL_INDEX_URI}: {e}")
+        return st["index"]
+
+
+def _lexical_neighbors(index: LexicalIndex, hits) -> List[Neighbor]:
+    return [Neighbor(h.id, h.score, index.text_of(h.id)) for h in hits]
+
+
+def _fuse_neighbors(vector: List[Neighbor], lexical: List[Neighbor], k: int) -> List[Neighbor]:
+    """Reciprocal rank fusion of vector and BM25 results; the score becomes the fused score."""
+    by_id = {n.id: n for n in lexical}
+    by_id.update({n.id: n for n in vector if n.text or n.id not in by_id})
+    fused = reciprocal_rank_fusion([[n.id for n in vector], [n.id for n in lexical]], k=RRF_K)[:k]
+    return [by_id[cid]._replace(score=score) for cid, score in fused]
+
+
+def _retrieve_neighbors(queries: List[str], k: int) -> List[List[Neighbor]]:
+    """
+    Up to k neighbors per query according to RETRIEVAL_MODE. In "auto" mode,
+    queries with a confident BM25 match skip embedding and vector search.
+
+    Vector hits below RESULT_MIN_SCORE or past a RESULT_SCORE_GAP drop are
+    cut; with RESULT_MMR_LAMBDA the k results are picked by MMR from
+    RESULT_CANDIDATE_FACTOR * k candidates. Texts are fetched for the kept hits only.
+    """
+    pool = k * max(RESULT_CANDIDATE_FACTOR, 1) if (RESULT_MMR_LAMBDA is not None or RESULT_SCORE_GAP) else k
+
+    def shape(neighbors: List[Neighbor]) -> List[Neighbor]:
+        return mmr(neighbors, k, RESULT_MMR_LAMBDA) if RESULT_MMR_LAMBDA is not None else neighbors[:k]
+
+    def vector_candidates(indices: List[int]) -> List[List[Neighbor]]:
+        lists = _search_neighbors_many(embed_queries([queries[i] for i in indices]), pool, fill_texts=False)
+        return [filter_by_score(ns, RESULT_MIN_SCORE, RESULT_SCORE_GAP) for ns in lists]
+
+    lexical_index = _query_lexical_index() if RETRIEVAL_MODE in ("hybrid", "auto") else None
+    if lexical_index is None:
+        return _fill_text_lists([shape(ns) for ns in vector_candidates(list(range(len(queries))))])
+
+    lexical = [lexical_index.search(q, pool) for q in queries]
+    results: List[List[Neighbor]] = [[] for _ in queries]
+    need = []
+    for i, (query, hits) in enumerate(zip(queries, lexical)):
+        if RETRIEVAL_MODE == "auto" and lexical_index.is_confident(
+            query, hits, min_score=LEXICAL_CONFIDENT_SCORE, max_terms=LEXICAL_CONFIDENT_MAX_TERMS
+        ):
+            results[i] = _lexical_neighbors(lexical_index, hits[:k])
+        else:
+            need.append(i)
+    if need:
+        for i, vector in zip(need, vector_candidates(need)):
+            results[i] = shape(_fuse_neighbors(vector, _lexical_neighbors(lexical_index, lexical[i]), pool))
+    return _fill_text_lists(results)
 
 # ADK Tool Function
 def retrieve_documents(
@@ -115,14 +697,11 @@ def retrieve_documents(
         Returns error message if retrieval fails.
     """
     try:
-        # Generate query embedding
-        query_embedding = embed_texts([query])[0]
+        # Vector search on the configured backend (BM25 / fused per RETRIEVAL_MODE)
+        neighbors = _retrieve_neighbors([query], num_results)[0]
         
-        # Execute vector search
-        response = _execute_vector_search(query_embedding, num_results)
-        
-        # Extract text chunks
-        chunks = _extract_content_from_response(response)
+        # Extract text chunks, within the prompt token budget
+        chunks = [n.text for n in apply_token_budget([n for n in neighbors if n.text], RESULT_TOKEN_BUDGET)]
         
         if not chunks:
             return "No relevant documents found for the query."
@@ -134,11 +713,73 @@ def retrieve_documents(
         return f"Error retrieving documents: {str(e)}"
 
 
+def retrieve_documents_batch(
+    queries: List[str],
+    num_results: int = 5
+) -> str:
+    """
+    Retrieve relevant document chunks for several related queries at once.
+    
+    Use this instead of repeated retrieve_documents calls when a question needs
+    several angles (e.g. "parental leave policy" and "leave approval process").
+    
+    Args:
+        queries: List of search query texts
+        num_results: Number of chunks to retrieve per query (default: 5)
+    
+    Returns:
+        String with one section per query. Each chunk is numbered and printed once;
+        when a chunk also matches a later query, that section refers to its number.
+        Returns error message if retrieval fails.
+    """
+    try:
+        queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q][:RETRIEVE_BATCH_MAX_QUERIES]
+        if not queries:
+            return "No queries provided."
+        
+        # One embedding call for the uncached queries, one search round trip for all of them
+        neighbor_lists = _retrieve_neighbors(queries, num_results)
+        
+        # Spend the token budget round-robin over ranks, so every query keeps its best chunks
+        allowed, used = set(), 0
+        for rank in range(max((len(ns) for ns in neighbor_lists), default=0)):
+            for ns in neighbor_lists:
+                if rank >= len(ns) or not ns[rank].text or ns[rank].id in allowed:
+                    continue
+                cost = estimate_tokens(ns[rank].text)
+                if RESULT_TOKEN_BUDGET > 0 and used + cost > RESULT_TOKEN_BUDGET:
+                    continue
+                allowed.add(ns[rank].id)
+                used += cost
+        
+        # Merge duplicates across queries: a chunk is shown under the first query that found it
+        numbers: Dict[str, int] = {}
+        sections = []
+        for query, neighbors in zip(queries, neighbor_lists):
+            lines, seen_refs = [], []
+            for n in neighbors:
+                if n.id not in allowed:
+                    continue
+                if n.id in numbers:
+                    seen_refs.append(f"[{numbers[n.id]}]")
+                    continue
+                numbers[n.id] = len(numbers) + 1
+                lines.append(f"[{numbers[n.id]}] {n.text}")
+            if seen_refs:
+                lines.append(f"(also relevant: {', '.join(seen_refs)})")
+            body = "\n\n".join(lines) if lines else "No relevant documents found for the query."
+            sections.append(f"### Query: {query}\n\n{body}")
+        
+        if not numbers:
+            return "No relevant documents found for the queries."
+        return "\n\n".join(sections)
+    
+    except Exception as e:
+        return f"Error retrieving documents: {str(e)}"
 
-### ---
-from google.cloud import storage
-storage_client = storage.Client()
 
+
+### ---
 # ========= GCS HELPERS =========
 def parse_gcs_uri(uri: str) -> Tuple[str, str]:
     assert uri.startswith("gs://")
@@ -147,42 +788,79 @@ def parse_gcs_uri(uri: str) -> Tuple[str, str]:
     return bucket, prefix
 
 
-def list_gcs_files(gcs_prefix: str, exts={".pdf", ".txt"}) -> List[str]:
+def read_uri_bytes(uri: str) -> Optional[bytes]:
+    """Read a gs:// object or local file; None if it does not exist."""
+    if uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(uri)
+        blob = get_storage_client().bucket(bucket_name).blob(path)
+        return blob.download_as_bytes() if blob.exists() else None
+    if not os.path.exists(uri):
+        return None
+    with open(uri, "rb") as f:
+        return f.read()
+
+def write_uri_bytes(uri: str, data: bytes, content_type: str = "application/octet-stream"):
+    """Write a gs:// object, or a local file atomically."""
+    if uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(uri)
+        get_storage_client().bucket(bucket_name).blob(path).upload_from_string(data, content_type=content_type)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(uri)), exist_ok=True)
+    tmp = f"{uri}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, uri)
+
+def delete_uri(uri: str):
+    if uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(uri)
+        blob = get_storage_client().bucket(bucket_name).blob(path)
+        if blob.exists():
+            blob.delete()
+    elif os.path.exists(uri):
+        os.remove(uri)
+
+def iter_gcs_objects(gcs_prefix: str, exts=None) -> Iterator[Dict]:
+    """
+    Stream objects under a prefix (with a registered extractor by default) with
+    the metadata incremental ingestion needs, listing sub-prefixes concurrently
+    (GCS_LIST_WORKERS, GCS_LIST_PARTITION_DEPTH); order is not defined.
+    """
+    exts = exts or TEXT_EXTRACTORS.extensions
     bucket_name, prefix = parse_gcs_uri(gcs_prefix)
-    bucket = storage_client.bucket(bucket_name)
-    blobs = storage_client.list_blobs(bucket, prefix=prefix)
-    out = []
-    for b in blobs:
-        name = b.name.lower()
-        if any(name.endswith(ext) for ext in exts):
-            out.append(f"gs://{bucket_name}/{b.name}")
-    return out
+    return iter_objects(get_storage_client(), bucket_name, prefix, exts,
+                        workers=GCS_LIST_WORKERS, depth=GCS_LIST_PARTITION_DEPTH)
+
+def list_gcs_objects(gcs_prefix: str, exts=None) -> List[Dict]:
+    """List objects under a prefix (with a registered extractor by default), sorted by URI."""
+    return sorted(iter_gcs_objects(gcs_prefix, exts), key=lambda o: o["uri"])
+
+def list_gcs_files(gcs_prefix: str, exts=None) -> List[str]:
+    return [obj["uri"] for obj in list_gcs_objects(gcs_prefix, exts)]
+
+def download_gcs_bytes(gcs_uri: str) -> bytes:
+    bucket_name, path = parse_gcs_uri(gcs_uri)
+    return get_storage_client().bucket(bucket_name).blob(path).download_as_bytes()
+
+def extract_text(gcs_uri: str, raw: bytes) -> str:
+    """
+    Turn downloaded object bytes into text with the engine registered for the
+    object's extension in TEXT_EXTRACTORS (blank if unreadable; PDFs parsed by
+    PyPDF2 are also blank when too slow or over the memory cap).
+    """
+    extractor = TEXT_EXTRACTORS.for_uri(gcs_uri)
+    if extractor is None:
+        print(f"[WARN] No text extractor registered for {gcs_uri}")
+        return ""
+    return extractor.extract(raw, label=gcs_uri)
 
 def read_gcs_text(gcs_uri: str) -> str:
     """Read a .txt object from GCS and return utf-8 text"""
-    bucket_name, path = parse_gcs_uri(gcs_uri)
-    blob = storage_client.bucket(bucket_name).blob(path)
-    raw = blob.download_as_bytes()
-    return raw.decode("utf-8", errors="ignore")
+    return extract_text(gcs_uri, download_gcs_bytes(gcs_uri))
 
 def read_gcs_pdf_text(gcs_uri: str) -> str:
-    """Extract text from PDF in GCS using PyPDF2 (simple); falls back to blank if unreadable."""
-    from PyPDF2 import PdfReader
-    bucket_name, path = parse_gcs_uri(gcs_uri)
-    blob = storage_client.bucket(bucket_name).blob(path)
-    pdf_bytes = io.BytesIO(blob.download_as_bytes())
-    try:
-        reader = PdfReader(pdf_bytes)
-        pages = []
-        for p in reader.pages:
-            try:
-                pages.append(p.extract_text() or "")
-            except Exception:
-                pages.append("")
-        return "\n".join(pages)
-    except Exception as e:
-        print(f"[WARN] PDF extract failed for {gcs_uri}: {e}")
-        return ""
+    """Extract text from PDF in GCS (see extract_text); falls back to blank if unreadable."""
+    return extract_text(gcs_uri, download_gcs_bytes(gcs_uri))
 
 
 # ========= CHUNKING =========
@@ -206,25 +884,138 @@ def chunk_text(text: str, chunk_chars=1000, overlap=100) -> List[str]:
     return chunks
 
 
-def embed_texts(texts: List[str], dim: int = VECTOR_DEFAULT_EMBED_DIM) -> List[List[float]]:
-    resp = genai_client.models.embed_content(
-        model=VECTOR_DEFAULT_MODEL_NAME,
-        contents=texts,
-        config=EmbedContentConfig(
-            task_type="RETRIEVAL_DOCUMENT",  # good default for RAG docs/queries
-            output_dimensionality=dim       # 3072 / 1536 / 768
-        ),
-    )
-    return [e.values for e in resp.embeddings]
+# ========= EMBEDDING CACHE =========
+def pull_sidecar(gcs_uri: str, local_path: str) -> bool:
+    """Download a sidecar file (SQLite cache/store; gs:// or local) over `local_path`; False if it does not exist."""
+    tmp = f"{local_path}.download"
+    if gcs_uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(gcs_uri)
+        blob = get_storage_client().bucket(bucket_name).blob(path)
+        if not blob.exists():
+            return False
+        blob.download_to_filename(tmp)
+    elif os.path.exists(gcs_uri):
+        shutil.copyfile(gcs_uri, tmp)
+    else:
+        return False
+    os.replace(tmp, local_path)
+    # a leftover WAL belongs to the previous copy and must not be replayed onto this one
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(local_path + suffix):
+            os.remove(local_path + suffix)
+    print(f"Pulled {gcs_uri} -> {local_path}")
+    return True
+
+def push_sidecar(local_path: str, gcs_uri: str):
+    if gcs_uri.startswith("gs://"):
+        bucket_name, path = parse_gcs_uri(gcs_uri)
+        get_storage_client().bucket(bucket_name).blob(path).upload_from_filename(local_path)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(gcs_uri)), exist_ok=True)
+        shutil.copyfile(local_path, f"{gcs_uri}.tmp")
+        os.replace(f"{gcs_uri}.tmp", gcs_uri)
+    print(f"Saved {local_path} -> {gcs_uri}")
+
+def fold_sidecar(store: Optional[SqliteSidecar], uri: str) -> int:
+    """Merge the copy of `store` pushed to `uri` (by a shard worker) into it; returns the rows copied."""
+    if store is None:
+        return 0
+    local_path = f"{store.path}.incoming"
+    if not pull_sidecar(uri, local_path):
+        return 0
+    try:
+        return store.merge_from(local_path)
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(local_path + suffix):
+                os.remove(local_path + suffix)
+
+SidecarT = TypeVar("SidecarT", bound=SqliteSidecar)
+
+def open_sidecar(store_cls: Type[SidecarT], local_path: Optional[str], gcs_uri: Optional[str]) -> Optional[SidecarT]:
+    """Open a SQLite sidecar at `local_path`, pulling it from `gcs_uri` first if there is no local copy."""
+    if not local_path:
+        return None
+    if gcs_uri and not os.path.exists(local_path):
+        pull_sidecar(gcs_uri, local_path)
+    return store_cls(local_path)
+
+def save_sidecar(store: Optional[SqliteSidecar], gcs_uri: Optional[str]):
+    """Checkpoint a SQLite sidecar and push it to `gcs_uri` (if both are set)."""
+    if not store or not gcs_uri:
+        return
+    store.checkpoint()
+    push_sidecar(store.path, gcs_uri)
+
+def open_embedding_store() -> Optional[EmbeddingStore]:
+    return open_sidecar(EmbeddingStore, EMBED_CACHE_PATH, EMBED_CACHE_GCS_URI)
+
+def save_embedding_store(store: EmbeddingStore):
+    save_sidecar(store, EMBED_CACHE_GCS_URI)
+
+def open_chunk_store() -> Optional[ChunkStore]:
+    return open_sidecar(ChunkStore, CHUNK_STORE_PATH, CHUNK_STORE_GCS_URI)
+
+def save_chunk_store(store: ChunkStore):
+    save_sidecar(store, CHUNK_STORE_GCS_URI)
+
+def open_extracted_text_store() -> Optional[ExtractedTextStore]:
+    return open_sidecar(ExtractedTextStore, EXTRACT_CACHE_PATH, EXTRACT_CACHE_GCS_URI)
+
+def save_extracted_text_store(store: ExtractedTextStore):
+    save_sidecar(store, EXTRACT_CACHE_GCS_URI)
+
+def embed_texts_cached(texts: List[str], store: EmbeddingStore = None, dim: int = VECTOR_DEFAULT_EMBED_DIM) -> np.ndarray:
+    """embed_texts (float32 array), but only for texts whose (model, dim, sha256) key is not already in `store`."""
+    if store is None:
+        return embed_texts(texts, dim=dim)
+
+    keys = [embedding_key(t, VECTOR_DEFAULT_MODEL_NAME, dim) for t in texts]
+    found = store.get_many(keys)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    if missing:
+        fresh = embed_texts(list(missing.values()), dim=dim)
+        fresh_rows = dict(zip(missing.keys(), fresh))
+        store.put_many(fresh_rows)
+        found.update(fresh_rows)
+
+    print(f"Embedding cache: {len(texts) - len(missing)} reused, {len(missing)} embedded")
+    out = np.empty((len(texts), dim), dtype=np.float32)
+    for i, k in enumerate(keys):
+        out[i] = found[k]
+    return out
 
 # ========= UPSERT =========
 def stable_uuid(namespace: uuid.UUID, key: str) -> str:
-    """Deterministic ID from path+chunk_index so re-runs don't create duplicates."""
+    """Deterministic ID from path+chunk_index so re-runs don't create duplicates (INGEST_ID_MODE=path)."""
     return str(uuid.uuid5(namespace, key))
 
-def upsert_docs(index_resource_name: str, chunks: List[Tuple[str, str]]):
+def _sources_of(entry: Dict) -> Dict[str, int]:
+    """Mapping entry -> {uri: chunk_index} of every object producing it (entries without `sources` have one)."""
+    if "sources" in entry:
+        return dict(entry["sources"])
+    return {entry["source"]: entry.get("chunk_index")} if entry.get("source") else {}
+
+def upsert_docs(
+    index_resource_name: str,
+    chunks: List[Tuple[str, str]],
+    local_index_dir: str = None,
+    embedding_store: EmbeddingStore = None,
+    local_update: "local_vector_index.IndexUpdate" = None,
+):
     """
     chunks: list of (chunk_id, chunk_text)
+
+    Upserts to the Vertex index when `index_resource_name` is set, and merges the
+    same rows into the memory-mapped local index when `local_index_dir` is set.
+    Chunks already present in `embedding_store` are not re-embedded.
+
+    Merging into the local index rewrites all of it (O(corpus)); when calling
+    this per batch, pass one `local_update` instead and commit it at the end.
     """
     if not chunks:
         print("No chunks to upsert.")
@@ -234,31 +1025,94 @@ def upsert_docs(index_resource_name: str, chunks: List[Tuple[str, str]]):
     texts = [txt for _, txt in chunks]
 
     print(f"Embedding {len(texts)} chunks...")
-    vecs = embed_texts(texts)
-
-    print("Creating datapoints...")
-    dps = []
-    for cid, vec, chunk in zip(ids, vecs, texts):
-        # Keep your original idea: put content in restricts (note caveat in the note below)
-        restrict = IndexDatapoint.Restriction(namespace="content", allow_list=[chunk])
-        dp = IndexDatapoint(datapoint_id=cid, feature_vector=vec, restricts=[restrict])
-        dps.append(dp)
-
-    print(f"Upserting {len(dps)} datapoints to Vector Search index: {index_resource_name}")
-    idx = MatchingEngineIndex(index_name=index_resource_name)
-    # batch to be kind to the service
-    BATCH = 100
-    for i in range(0, len(dps), BATCH):
-        idx.upsert_datapoints(datapoints=dps[i : i + BATCH])
-    print("Upsert complete.")
+    vecs = embed_texts_cached(texts, embedding_store)
+    print(f"Embedding throughput: {embedding_throughput_stats()}")
+
+    if index_resource_name:
+        print(f"Upserting {len(ids)} datapoints to Vector Search index: {index_resource_name}")
+        upsert_vertex_datapoints(get_matching_engine_index(index_resource_name), ids, texts, vecs)
+        print("Upsert complete.")
+
+    if local_update is not None:
+        local_update.add(ids, texts, vecs)
+    elif local_index_dir:
+        version = local_vector_index.upsert(local_index_dir, ids, texts, vecs)
+        print(f"Local vector index updated: {local_index_dir} (version {version})")
 
     return {cid: txt for cid, txt in chunks}
 
+def _datapoint_bytes(cid: str, text: str, dim: int) -> int:
+    """Approximate serialized size of one datapoint (packed float32 vector, ID, optional text restrict)."""
+    size = 4 * dim + len(cid) + 16
+    if VECTOR_TEXT_IN_RESTRICTS:
+        size += len(text.encode("utf-8")) + 32
+    return size
+
+def upsert_vertex_datapoints(idx: "MatchingEngineIndex", ids: List[str], texts: List[str], vecs: np.ndarray):
+    """
+    Upsert rows of a float32 array as datapoints.
+
+    Requests are packed by payload bytes (an adaptive budget up to
+    VECTOR_UPSERT_MAX_BYTES, at most VECTOR_UPSERT_MAX_DATAPOINTS each) and
+    sent concurrently (up to VECTOR_UPSERT_MAX_CONCURRENCY) with retries on
+    quota/deadline/transient errors. Datapoints are built per request, so only
+    the vectors of requests in flight exist as Python floats.
+    """
+    from google.cloud import aiplatform_v1
+
+    if not ids:
+        return
+    dim = np.asarray(vecs[0]).shape[-1]
+    sizes = [_datapoint_bytes(cid, chunk, dim) for cid, chunk in zip(ids, texts)]
+    batches = pack_by_size(sizes, VECTOR_UPSERT_MAX_DATAPOINTS, _upsert_control.batch_limit())
+
+    def send(rows: List[int]):
+        dps = []
+        for r in rows:
+            values = np.asarray(vecs[r], dtype=np.float32).tolist()
+            if VECTOR_TEXT_IN_RESTRICTS:
+                # Legacy layout: content travels in restricts (needed when there is no chunk store)
+                restrict = aiplatform_v1.IndexDatapoint.Restriction(namespace="content", allow_list=[texts[r]])
+                dp = aiplatform_v1.IndexDatapoint(datapoint_id=ids[r], feature_vector=values, restricts=[restrict])
+            else:
+                dp = aiplatform_v1.IndexDatapoint(datapoint_id=ids[r], feature_vector=values)
+            dps.append(dp)
+        _upsert_control.call(idx.upsert_datapoints, datapoints=dps)
+
+    workers = min(_upsert_control.max_concurrency, len(batches))
+    if workers <= 1:
+        for rows in batches:
+            send(rows)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as pool:
+        for _ in pool.map(send, batches):
+            pass
+
+def remove_docs(index_resource_name: str, ids: List[str], local_index_dir: str = None,
+                local_update: "local_vector_index.IndexUpdate" = None):
+    """
+    Remove datapoints by ID from the Vertex index and/or the local index.
+    With `local_update`, the local deletes are staged there (committed by the
+    caller) instead of rewriting the local index for this call alone.
+    """
+    if not ids:
+        return
+    print(f"Removing {len(ids)} stale datapoints...")
+    if index_resource_name:
+        idx = get_matching_engine_index(index_resource_name)
+        BATCH = 1000
+        for i in range(0, len(ids), BATCH):
+            _upsert_control.call(idx.remove_datapoints, datapoint_ids=ids[i : i + BATCH])
+    if local_update is not None:
+        local_update.delete(ids)
+    elif local_index_dir:
+        local_vector_index.upsert(local_index_dir, [], [], None, delete_ids=ids)
+
 # ========= MAPPING PERSISTENCE =========
 def load_mapping_from_gcs(mapping_uri: str) -> Dict[str, Dict]:
     try:
         bucket_name, path = parse_gcs_uri(mapping_uri)
-        blob = storage_client.bucket(bucket_name).blob(path)
+        blob = get_storage_client().bucket(bucket_name).blob(path)
         if not blob.exists():
             return {}
         data = json.loads(blob.download_as_bytes().decode("utf-8"))
@@ -269,76 +1123,851 @@ def load_mapping_from_gcs(mapping_uri: str) -> Dict[str, Dict]:
 
 def save_mapping_to_gcs(mapping_uri: str, mapping: Dict[str, Dict]):
     bucket_name, path = parse_gcs_uri(mapping_uri)
-    blob = storage_client.bucket(bucket_name).blob(path)
+    blob = get_storage_client().bucket(bucket_name).blob(path)
     blob.upload_from_string(json.dumps(mapping, ensure_ascii=False, indent=2), content_type="application/json")
     print(f"Saved mapping to {mapping_uri}")
 
+def open_mapping_store(mapping_uri: str):
+    """
+    A mapping URI ending in "/" is a segmented store (append-only segments + index);
+    anything else is the legacy single JSON document, with a local vector_mapping.json backup.
+    """
+    if mapping_uri.endswith("/"):
+        return SegmentedMappingStore(mapping_uri, read_uri_bytes, write_uri_bytes, delete_uri,
+                                     segment_max_entries=MAPPING_SEGMENT_MAX_ENTRIES)
+    return JsonMappingStore(mapping_uri, load_mapping_from_gcs, save_mapping_to_gcs,
+                            local_backup="vector_mapping.json")
+
+def _sidecar_base(mapping_uri: str) -> str:
+    if mapping_uri.endswith("/"):
+        return mapping_uri
+    base = mapping_uri[:-len(".json")] if mapping_uri.endswith(".json") else mapping_uri
+    return f"{base}."
+
+def shard_cache_uris(shard_mapping_uri: str) -> Dict[str, str]:
+    """Where a shard worker pushes its embedding / extracted-text caches (folded in by merge_sharded_ingest)."""
+    base = _sidecar_base(shard_mapping_uri)
+    return {"embed": f"{base}embedding_cache.sqlite", "text": f"{base}extracted_text.sqlite"}
+
+def manifest_uri_for(mapping_uri: str) -> str:
+    """The ingestion manifest lives next to the mapping: <mapping>.manifest.json (or <root>/manifest.json)"""
+    return f"{_sidecar_base(mapping_uri)}manifest.json"
+
+def load_manifest_from_gcs(manifest_uri: str) -> IngestManifest:
+    """Load the manifest (gs:// or local path); an empty one if missing or unreadable."""
+    try:
+        raw = read_uri_bytes(manifest_uri)
+        return IngestManifest.from_json(raw.decode("utf-8")) if raw else IngestManifest()
+    except Exception as e:
+        print(f"[WARN] Could not load manifest from {manifest_uri}: {e}")
+        return IngestManifest()
+
+def save_manifest_to_gcs(manifest_uri: str, manifest: IngestManifest):
+    write_uri_bytes(manifest_uri, manifest.to_json().encode("utf-8"), content_type="application/json")
+    print(f"Saved manifest ({len(manifest)} objects) to {manifest_uri}")
+
+def checkpoint_uri_for(mapping_uri: str) -> str:
+    """INGEST_CHECKPOINT_URI if set, else <mapping>.checkpoint.json next to the mapping."""
+    if INGEST_CHECKPOINT_URI:
+        return INGEST_CHECKPOINT_URI
+    return f"{_sidecar_base(mapping_uri)}checkpoint.json"
+
+def load_near_dup_index() -> Optional[NearDupIndex]:
+    """The persisted near-duplicate index (a fresh one if none yet); None when suppression is off."""
+    if not NEAR_DUP_INDEX_URI:
+        return None
+    raw = read_uri_bytes(NEAR_DUP_INDEX_URI)
+    if not raw:
+        return NearDupIndex(threshold=NEAR_DUP_THRESHOLD)
+    return NearDupIndex.from_bytes(raw, threshold=NEAR_DUP_THRESHOLD)
+
+def save_near_dup_index(near_dup: Optional[NearDupIndex]):
+    if near_dup is not None:
+        write_uri_bytes(NEAR_DUP_INDEX_URI, near_dup.to_bytes())
+
+def publish_index_version(run_key: str) -> Optional[str]:
+    """Write a new knowledge index version to KNOWLEDGE_INDEX_VERSION_URI; returns it."""
+    if not KNOWLEDGE_INDEX_VERSION_URI:
+        return None
+    # unique per publish: two identical runs in the same second must still invalidate cached answers
+    version = f"{int(time.time())}-{run_key}-{uuid.uuid4().hex}"
+    write_uri_bytes(KNOWLEDGE_INDEX_VERSION_URI,
+                    json.dumps({"version": version, "updated": time.time()}).encode("utf-8"),
+                    content_type="application/json")
+    print(f"Published knowledge index version {version}")
+    return version
+
+def read_index_version() -> Optional[str]:
+    """The current knowledge index version, or None if none has been published."""
+    if not KNOWLEDGE_INDEX_VERSION_URI:
+        return None
+    raw = read_uri_bytes(KNOWLEDGE_INDEX_VERSION_URI)
+    return json.loads(raw.decode("utf-8")).get("version") if raw else None
+
+def load_checkpoint(checkpoint_uri: str, run_key: str) -> IngestCheckpoint:
+    try:
+        raw = read_uri_bytes(checkpoint_uri)
+        return IngestCheckpoint.from_json(raw.decode("utf-8") if raw else "", run_key)
+    except Exception as e:
+        print(f"[WARN] Could not load checkpoint from {checkpoint_uri}: {e}")
+        return IngestCheckpoint(run_key)
+
+def save_checkpoint(checkpoint_uri: str, checkpoint: IngestCheckpoint):
+    write_uri_bytes(checkpoint_uri, checkpoint.to_json().encode("utf-8"), content_type="application/json")
+
+
+# ========= LEXICAL INDEX =========
+def save_lexical_index(mapping) -> Optional[int]:
+    """
+    Rebuild the BM25 index from every stored chunk (chunk store, else the
+    mapping) and publish it to LEXICAL_INDEX_URI. Returns the chunk count.
+    """
+    if not LEXICAL_INDEX_URI:
+        return None
+    if CHUNK_STORE_PATH:
+        store = ChunkStore(CHUNK_STORE_PATH)
+        try:
+            index = LexicalIndex.build(store.iter_chunks())
+        finally:
+            store.close()
+    else:
+        # no chunk store to serve texts from, so the index keeps them
+        index = LexicalIndex.build(
+            ((cid, e["text"]) for cid, e in mapping.iter_items() if "text" in e), keep_texts=True
+        )
+    write_uri_bytes(LEXICAL_INDEX_URI, index.to_bytes())
+    print(f"Saved lexical index ({len(index)} chunks, {len(index.vocab)} terms) to {LEXICAL_INDEX_URI}")
+    return len(index)
+
 
 # ========= MAIN PIPELINE =========
-def build_and_upsert(gcs_prefix: str, index_resource_name: str, mapping_uri: str):
-    # Collect files
-    files = list_gcs_files(gcs_prefix, exts={".pdf", ".txt"})
-    if not files:
-        print(f"No .pdf or .txt files found in {gcs_prefix}")
-        return
+class _IngestRun:
+    """
+    State shared by the streaming ingestion stages. A file counts as done (and
+    its manifest entry is updated) only once every one of its chunks has been
+    upserted, so the manifest never claims more than the index holds.
+
+    Every INGEST_CHECKPOINT_EVERY batches the local index staging, mapping,
+    manifest and checkpoint are persisted (in that order), so a restarted run
+    resumes after the last committed batch. The sidecar stores (chunk store,
+    extracted-text cache, near-duplicate index) are whole-file uploads, so they
+    are pushed once at the end of the run, or when it stops on an error.
+    """
+
+    def __init__(self, ns: uuid.UUID, manifest: IngestManifest, mapping,
+                 index_resource_name: str, local_update, store: EmbeddingStore, chunk_store: ChunkStore,
+                 checkpoint: IngestCheckpoint, manifest_uri: str, checkpoint_uri: str,
+                 near_dup: NearDupIndex = None, text_cache: ExtractedTextStore = None, indexed=None,
+                 text_cache_uri: Optional[str] = None, fence: Optional[Callable[[], None]] = None):
+        self.ns = ns
+        self.manifest = manifest
+        self.mapping = mapping
+        self.index = get_matching_engine_index(index_resource_name) if index_resource_name else None
+        self.local_update = local_update
+        self.store = store
+        self.chunk_store = chunk_store
+        self.near_dup = near_dup
+        self.text_cache = text_cache
+        self.text_cache_uri = text_cache_uri
+        self.fence = fence or (lambda: None)   # raises once this run may no longer write (shard lease lost)
+        self.collapsed: set = set()   # chunk IDs collapsed onto a near-duplicate this run
+        self.content_ids = INGEST_ID_MODE == "content"
+        self.inflight: Dict[str, Dict[str, int]] = {}   # content ID queued for upsert -> {uri: chunk_index}
+        self.indexed = indexed   # read-only mapping of chunks already indexed (the main mapping, in shard runs)
+        self.checkpoint = checkpoint
+        self.manifest_uri = manifest_uri
+        self.checkpoint_uri = checkpoint_uri
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Dict] = {}   # uri -> {"obj", "ids", "left"}
+        self.buffer: List[Tuple[str, str, str, int]] = []
+        self.stale_ids: List[str] = manifest.stale_ids   # persisted with the manifest
+        self.files_done = 0
+        self.chunks_upserted = 0
+
+    # -- download / extract --
+    def _text_cache_key(self, obj: Dict):
+        extractor = TEXT_EXTRACTORS.for_uri(obj["uri"])
+        return obj["uri"], obj["generation"], extractor.cache_id if extractor else ""
+
+    def download(self, obj: Dict):
+        # an object version extracted before (earlier run or a retry) is neither downloaded nor parsed again
+        if self.text_cache is not None:
+            text = self.text_cache.get(*self._text_cache_key(obj))
+            if text is not None:
+                print(f"Reusing extracted text for {obj['uri']} (generation {obj['generation']})")
+                yield obj, None, text
+                return
+        print(f"Reading {obj['uri']} ...")
+        yield obj, download_gcs_bytes(obj["uri"]), None
+
+    def extract(self, item):
+        obj, raw, text = item
+        if text is None:
+            text = extract_text(obj["uri"], raw)
+            # blank results (unreadable, timed out) are not cached so the next run tries again
+            if self.text_cache is not None and text:
+                self.text_cache.put(*self._text_cache_key(obj), text)
+        yield obj, text
+
+    # -- chunk + batch (single worker) --
+    def chunk(self, item):
+        obj, text = item
+        f = obj["uri"]
+        if self.content_ids:
+            chunks = content_defined_chunks(text, target_chars=1000, overlap=100)
+        else:
+            chunks = chunk_text(text, chunk_chars=1000, overlap=100)
+        if not chunks:
+            print(f"[WARN] No text extracted from {f}")
+
+        if self.content_ids:
+            ids = [content_chunk_id(ch) for ch in chunks]
+        else:
+            ids = [stable_uuid(self.ns, f"{f}::chunk::{i}") for i in range(len(chunks))]
+        committed = self.checkpoint.committed_ids(f, obj["generation"])
+        todo = [(i, cid, ch) for i, (cid, ch) in enumerate(zip(ids, chunks)) if cid not in committed]
+        if committed:
+            print(f"Resuming {f}: {len(ids) - len(todo)} of {len(ids)} chunks already committed")
+        waiting = 0
+        if self.content_ids:
+            todo, waiting = self._skip_indexed(f, todo)
+        if self.near_dup is not None:
+            todo = self._drop_near_duplicates(f, todo)
+        with self.lock:
+            if self.content_ids:
+                # queued only now, so a chunk collapsed above never has files waiting on its upsert
+                for i, cid, _ in todo:
+                    self.inflight[cid] = {f: i}
+            self.pending[f] = {"obj": obj, "ids": ids, "left": len(todo) + waiting}
+            if not todo and not waiting:
+                self._complete(f)
+
+        for i, cid, ch in todo:
+            self.buffer.append((cid, ch, f, i))
+            if len(self.buffer) >= INGEST_BATCH_CHUNKS:
+                batch, self.buffer = self.buffer, []
+                yield batch
+
+    def _skip_indexed(self, f: str, todo):
+        """
+        Content IDs: chunks whose text is already indexed (same text in a
+        renamed, moved or other file) only gain `f` as a source in the mapping.
+        A chunk another file has queued for upsert is not queued twice; `f`
+        waits for that upsert instead. Returns (chunks to embed, chunks waited
+        on); the caller queues the former once near-duplicates are dropped.
+        """
+        kept, linked, waiting, queued = [], {}, 0, set()
+        with self.lock:
+            existing = self.mapping.get_many(cid for _, cid, _ in todo)
+            if self.indexed is not None:
+                existing = {**self.indexed.get_many(cid for _, cid, _ in todo if cid not in existing), **existing}
+            for i, cid, ch in todo:
+                entry = existing.get(cid)
+                if entry is not None and "duplicate_of" not in entry:
+                    entry = linked.setdefault(cid, entry)
+                    entry["sources"] = {**_sources_of(entry), f: i}
+                elif cid in self.inflight:
+                    if f not in self.inflight[cid]:
+                        self.inflight[cid][f] = i
+                        waiting += 1
+                elif cid not in queued:   # the same text can recur within a file
+                    queued.add(cid)
+                    kept.append((i, cid, ch))
+            if linked:
+                self.mapping.put_many(linked)
+        if linked:
+            print(f"{f}: {len(linked)} chunks already indexed, not re-embedded")
+        return kept, waiting
+
+    def _detach_sources(self, uri: str, ids: Iterable[str]):
+        """Content IDs: `uri` no longer produces `ids`; re-point their mapping entries at a remaining source."""
+        updated = {}
+        for cid, entry in self.mapping.get_many(ids).items():
+            sources = _sources_of(entry)
+            if sources.pop(uri, None) is None or not sources:
+                continue   # not linked to uri, or orphaned (removed with the stale IDs)
+            source, chunk_index = next(iter(sources.items()))
+            updated[cid] = {**entry, "source": source, "chunk_index": chunk_index, "sources": sources}
+        if updated:
+            self.mapping.put_many(updated)
+
+    def _drop_near_duplicates(self, f: str, todo):
+        """
+        Skip chunks that nearly duplicate an indexed chunk; they are recorded in
+        the mapping as `duplicate_of` and never embedded. A copy this file used
+        to have in the index is removed along with the other stale IDs.
+        """
+        kept, collapsed = [], {}
+        with self.lock:
+            previous = set(self.manifest.ids_for(f))
+            for i, cid, ch in todo:
+                canonical = self.near_dup.check(cid, ch, f)
+                if canonical is None:
+                    kept.append((i, cid, ch))
+                    continue
+                collapsed[cid] = {"source": f, "chunk_index": i, "duplicate_of": canonical}
+                self.collapsed.add(cid)
+                if cid in previous:
+                    self.stale_ids.append(cid)
+            if collapsed:
+                self.mapping.put_many(collapsed)
+        if collapsed:
+            print(f"{f}: {len(collapsed)} near-duplicate chunks collapsed")
+        return kept
+
+    def flush_chunks(self):
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            yield batch
+
+    # -- embed --
+    def embed(self, batch):
+        vecs = embed_texts_cached([ch for _, ch, _, _ in batch], self.store)
+        yield batch, vecs
+
+    # -- upsert (single worker) --
+    def upsert(self, item):
+        self.fence()
+        batch, vecs = item
+        ids = [cid for cid, _, _, _ in batch]
+        texts = [ch for _, ch, _, _ in batch]
+        if self.index is not None:
+            upsert_vertex_datapoints(self.index, ids, texts, vecs)
+        if self.local_update is not None:
+            self.local_update.add(ids, texts, vecs)
+        if self.chunk_store is not None:
+            self.chunk_store.put_many([(cid, ch, f, i) for cid, ch, f, i in batch])
+
+        with self.lock:
+            if self.content_ids:
+                # every file that had this text queued is a source; keep sources recorded by earlier runs
+                existing = self.mapping.get_many(ids)
+                sources = {cid: self.inflight.pop(cid, {f: i}) for cid, _, f, i in batch}
+                self.mapping.put_many({
+                    cid: {"source": f, "chunk_index": i, "text": ch,
+                          "sources": {**(_sources_of(existing[cid]) if cid in existing else {}), **sources[cid]}}
+                    for cid, ch, f, i in batch
+                })
+            else:
+                self.mapping.put_many({cid: {"source": f, "chunk_index": i, "text": ch} for cid, ch, f, i in batch})
+                sources = {cid: {f: i} for cid, _, f, i in batch}
+            for cid, _, _, _ in batch:
+                for f in sources[cid]:
+                    entry = self.pending[f]
+                    self.checkpoint.mark_committed(f, entry["obj"]["generation"], [cid])
+                    entry["left"] -= 1
+                    if entry["left"] == 0:
+                        self._complete(f)
+            self.chunks_upserted += len(batch)
+            self.checkpoint.batches += 1
+            batches = self.checkpoint.batches
+        print(f"Upserted batch {batches} ({self.chunks_upserted} chunks, {self.files_done} files done)")
+        if batches % max(INGEST_CHECKPOINT_EVERY, 1) == 0:
+            self.save_state()
+        return None
+
+    def _complete(self, uri: str):
+        entry = self.pending.pop(uri)
+        obj = entry["obj"]
+        stale = self.manifest.record(uri, obj["generation"], obj["crc32c"], entry["ids"])
+        if self.content_ids:
+            self._detach_sources(uri, stale)
+        self.stale_ids.extend(stale)
+        self.checkpoint.mark_completed(uri, obj["generation"])
+        self.files_done += 1
+
+    # -- durability --
+    def save_state(self, sidecars: bool = False):
+        """Checkpoint progress; cost is O(changes) unless `sidecars` also pushes the whole-file stores."""
+        self.fence()
+        with self.lock:
+            if self.local_update is not None:
+                self.local_update.sync()
+            if sidecars:
+                save_chunk_store(self.chunk_store)
+                save_sidecar(self.text_cache, self.text_cache_uri)
+                save_near_dup_index(self.near_dup)
+            self.mapping.flush()
+            save_manifest_to_gcs(self.manifest_uri, self.manifest)
+            save_checkpoint(self.checkpoint_uri, self.checkpoint)
+        print(f"Checkpoint saved after batch {self.checkpoint.batches}: {self.checkpoint_uri}")
+
+
+def build_and_upsert(gcs_prefix: str, index_resource_name: str, mapping_uri: str, full_rebuild: bool = False):
+    """
+    Ingest objects under `gcs_prefix` with a registered text extractor
+    (TEXT_EXTRACTORS; .pdf/.txt by default) into the vector index.
+
+    Only objects whose generation/crc32c differ from the manifest kept next to
+    `mapping_uri` are downloaded and re-chunked; datapoints of deleted objects
+    and trailing chunks of files that shrank are removed. `full_rebuild=True`
+    re-ingests every object.
+
+    With INGEST_ID_MODE=content, datapoint IDs are hashes of the chunk text and
+    the mapping records every object a chunk comes from (`sources`); a moved
+    or renamed file, or an unchanged chunk of an edited one, is not embedded
+    or upserted again, and a datapoint is removed only once no object produces it.
+
+    Work streams through bounded stages (download -> extract -> chunk -> embed
+    -> upsert), so only a few batches are in flight at once and embedding of
+    batch N+1 overlaps with upserting batch N. The prefix is listed in
+    parallel parts and downloads start before the listing has finished.
+    Progress is checkpointed; if a run dies, calling it again with the same
+    arguments resumes from the last committed batch.
+
+    For rebuilds too large for one process, see plan_sharded_ingest.
+    """
+    _ingest(gcs_prefix, index_resource_name, mapping_uri, full_rebuild=full_rebuild)
+
+
+def _ingest(gcs_prefix: str, index_resource_name: str, mapping_uri: str, full_rebuild: bool = False,
+            objects: Optional[Iterable[Dict]] = None, shard: Optional[Tuple[int, int]] = None, indexed=None,
+            fence: Optional[Callable[[], None]] = None) -> Dict:
+    """
+    build_and_upsert, optionally on a given object listing. With `shard`
+    ((index, count), set by run_shard_worker) the run only builds the shard's
+    partial mapping and manifest under `mapping_uri` and upserts its
+    datapoints; removals, the chunk store, the local index, the lexical index
+    and the index version are left to merge_sharded_ingest, and near-duplicate
+    suppression is off (its index is global). Shard runs push their
+    embedding / extracted-text caches next to the partial mapping rather than
+    over the shared URIs, which concurrent workers would overwrite.
+    `indexed` is a read-only mapping whose chunks count as already indexed
+    (content IDs). `fence` is called before every upsert batch and every
+    write of the mapping, manifest or checkpoint, and raises to stop the run
+    (run_shard_worker: the shard's lease was lost).
+    """
+    local_index_dir = None if shard else VECTOR_LOCAL_INDEX_DIR
+    shard_caches = shard_cache_uris(mapping_uri) if shard else {}
+    embed_cache_uri = EMBED_CACHE_GCS_URI and shard_caches.get("embed", EMBED_CACHE_GCS_URI)
+    text_cache_uri = EXTRACT_CACHE_GCS_URI and shard_caches.get("text", EXTRACT_CACHE_GCS_URI)
 
-    print(f"Found {len(files)} files under {gcs_prefix}")
+    # Load existing mapping (merge later), the per-object manifest and any checkpoint of this run
+    mapping = open_mapping_store(mapping_uri)  # id -> {source, chunk_index, text[, sources]}
+    manifest_uri = manifest_uri_for(mapping_uri)
+    manifest = load_manifest_from_gcs(manifest_uri)
+    # a shared INGEST_CHECKPOINT_URI would be overwritten by every shard
+    checkpoint_uri = f"{_sidecar_base(mapping_uri)}checkpoint.json" if shard else checkpoint_uri_for(mapping_uri)
+    run_key = hashlib.sha256(
+        json.dumps([gcs_prefix, index_resource_name, mapping_uri, local_index_dir, full_rebuild,
+                    INGEST_ID_MODE]).encode("utf-8")
+    ).hexdigest()[:16]
+    checkpoint = load_checkpoint(checkpoint_uri, run_key)
+    if checkpoint.resumed:
+        print(f"Resuming run {run_key} after batch {checkpoint.batches} "
+              f"({len(checkpoint.completed)} files done, {len(checkpoint.partial)} partial)")
+    manifest.stale_ids.extend(checkpoint.stale_ids)   # checkpoints written before the manifest kept them
+    if manifest.stale_ids:
+        print(f"{len(manifest.stale_ids)} stale datapoints left by an earlier run will be removed")
 
-    # Load existing mapping (merge later)
-    existing = load_mapping_from_gcs(mapping_uri)
-    mapping  = dict(existing)  # id -> {src, i, text}
+    force = full_rebuild
+    if not force and manifest.entries and manifest.id_mode != INGEST_ID_MODE:
+        # IDs of the other scheme never match; re-ingest everything (old datapoints are removed as stale)
+        print(f"INGEST_ID_MODE changed from {manifest.id_mode!r} to {INGEST_ID_MODE!r}; re-ingesting all objects")
+        force = True
+    manifest.id_mode = INGEST_ID_MODE
+
+    # The listing streams: changed objects enter the pipeline while the rest of the prefix is still being listed.
+    # Deletions are known only once the listing is complete.
+    seen: set = set()
+    listed = {"changed": 0}
+
+    def changed_objects():
+        listed_objects = objects if objects is not None else iter_gcs_objects(gcs_prefix)
+        for obj in manifest.iter_changed(listed_objects, seen, force=force):
+            if not checkpoint.is_completed(obj["uri"], obj["generation"]):
+                listed["changed"] += 1
+                yield obj
+
+    listing = changed_objects()
+    first = next(listing, None)
+    if first is None:
+        print(f"Found {len(seen)} files under {gcs_prefix}")
+        if not manifest.missing(seen, prefix=gcs_prefix) and not checkpoint.resumed and not manifest.stale_ids:
+            print("Index is up to date.")
+            return {"files": 0, "chunks": 0, "stale": 0}
+    changed = itertools.chain([first], listing) if first is not None else []
 
     # Deterministic namespace for IDs (per bucket/prefix)
     ns_seed = hashlib.sha256(gcs_prefix.encode("utf-8")).hexdigest()
     ns = uuid.UUID(ns_seed[0:32])
 
-    # Gather chunks (id, text) and a sidecar for provenance
-    to_upsert: List[Tuple[str, str]] = []
-    provenance: Dict[str, Dict] = {}  # id -> {src, i}
+    store = open_embedding_store()
+    chunk_store = None if shard else open_chunk_store()
+    local_update = local_vector_index.IndexUpdate(local_index_dir, durable=True, ann=VECTOR_LOCAL_ANN) if local_index_dir else None
+    near_dup = None if shard else load_near_dup_index()
+    text_cache = open_extracted_text_store()
+    run = _IngestRun(ns, manifest, mapping, index_resource_name, local_update, store, chunk_store,
+                     checkpoint, manifest_uri, checkpoint_uri, near_dup=near_dup, text_cache=text_cache,
+                     indexed=indexed, text_cache_uri=text_cache_uri, fence=fence)
 
-    for f in files:
-        print(f"Reading {f} ...")
-        if f.lower().endswith(".txt"):
-            text = read_gcs_text(f)
-        else:
-            text = read_gcs_pdf_text(f)
+    try:
+        run_pipeline(changed, [
+            Stage("download", run.download, workers=INGEST_DOWNLOAD_WORKERS),
+            Stage("extract", run.extract, workers=PDF_EXTRACT_WORKERS),
+            Stage("chunk", run.chunk, flush=run.flush_chunks),
+            Stage("embed", run.embed, workers=INGEST_EMBED_WORKERS),
+            Stage("upsert", run.upsert),
+        ], queue_size=INGEST_QUEUE_SIZE)
 
-        chunks = chunk_text(text, chunk_chars=1000, overlap=100)
-        if not chunks:
-            print(f"[WARN] No text extracted from {f}")
+        deleted = manifest.missing(seen, prefix=gcs_prefix)
+        print(f"Listed {len(seen)} files under {gcs_prefix}: {listed['changed']} new/modified, "
+              f"{len(deleted)} deleted, {len(seen) - listed['changed']} unchanged")
+        for f in deleted:
+            print(f"Removed from bucket: {f}")
+            ids = manifest.forget(f)
+            if run.content_ids:
+                run._detach_sources(f, ids)
+            run.stale_ids.extend(ids)
+            if text_cache is not None:
+                text_cache.forget(f)
+
+        if run.content_ids:
+            # a content ID dropped by one file may still be produced by another (moved/copied text)
+            run.stale_ids[:] = [cid for cid in dict.fromkeys(run.stale_ids) if not manifest.is_referenced(cid)]
+        # Drop datapoints of deleted objects and trailing chunks of shrunken files
+        if not shard:
+            remove_docs(index_resource_name, run.stale_ids)
+        if chunk_store is not None:
+            chunk_store.delete_many(run.stale_ids)
+            save_chunk_store(chunk_store)
+        if local_update is not None:
+            local_update.delete(run.stale_ids)
+            version = local_update.commit()
+            print(f"Local vector index updated: {local_index_dir} (version {version})")
+    except BaseException:
+        # Keep everything committed so far; the next run resumes from here
+        try:
+            run.save_state(sidecars=True)
+        except Exception as e:
+            print(f"[WARN] Could not save checkpoint: {e}")
+        finally:
+            if local_update is not None:
+                local_update.close()
+        raise
+    finally:
+        listing.close()   # stops the listing threads if the pipeline failed
+        if store:
+            save_sidecar(store, embed_cache_uri)
+            store.close()
+        if chunk_store:
+            chunk_store.close()
+        if text_cache:
+            print(f"Extracted-text cache: {text_cache.hits} reused, {text_cache.misses} extracted")
+            save_sidecar(text_cache, text_cache_uri)
+            text_cache.close()
+    print(f"Embedding throughput: {embedding_throughput_stats()}")
+    if index_resource_name:
+        print(f"Vector Search upserts: {vector_upsert_stats()}")
+
+    mapping.delete_many(cid for cid in run.stale_ids if cid not in run.collapsed)
+
+    if near_dup is not None:
+        # Files whose chunks were collapsed onto a chunk that is now gone or changed get re-ingested next run
+        near_dup.release(run.stale_ids)
+        for uri in sorted(near_dup.reingest):
+            manifest.invalidate(uri)
+        if near_dup.reingest:
+            print(f"{len(near_dup.reingest)} files lost their canonical near-duplicate; they will be re-ingested next run")
+        near_dup.reingest.clear()
+        print(f"Near-duplicate suppression: {near_dup.stats.snapshot(bytes_per_vector=4 * VECTOR_DEFAULT_EMBED_DIM)}")
+
+    # Persist the mapping changes; the manifest goes last so a failed run is retried next time
+    run.fence()
+    mapping.flush()
+    mapping.compact(max_segments=MAPPING_MAX_SEGMENTS)
+    if not shard:
+        save_lexical_index(mapping)
+    save_near_dup_index(near_dup)
+    stale = len(run.stale_ids)
+    manifest.stale_ids.clear()   # removed above (in sharded runs, merge_sharded_ingest diffs the manifests instead)
+    run.fence()
+    save_manifest_to_gcs(manifest_uri, manifest)
+    delete_uri(checkpoint_uri)
+    if not shard:
+        publish_index_version(run_key)
+
+    print(f"All done. Upserted {run.chunks_upserted} chunks from {run.files_done} files, removed {stale} stale chunks.")
+    return {"files": run.files_done, "chunks": run.chunks_upserted, "stale": stale}
+
+
+# ========= SHARDED INGESTION =========
+# plan_sharded_ingest (once) -> run_shard_worker (any number of processes/nodes) -> merge_sharded_ingest (once)
+#
+#   <work>/plan.json                                 current plan (prefix, index, shard count, plan_id)
+#   <work>/<plan_id>/shard-0003/objects.json         the shard's objects (hash-partitioned listing)
+#   <work>/<plan_id>/shard-0003/mapping/             partial mapping (segmented) + manifest.json + checkpoint.json
+#   <leases>/shard-0003.json                         lease record (see utils.ingest_shards)
+def _shard_work_root(mapping_uri: str) -> str:
+    root = INGEST_SHARD_WORK_URI or f"{_sidecar_base(mapping_uri)}shards/"
+    return root if root.endswith("/") else root + "/"
+
+def _shard_dir(plan: Dict, shard: int) -> str:
+    return f"{plan['root']}{plan['plan_id']}/shard-{shard:04d}/"
+
+def _shard_mapping_uri(plan: Dict, shard: int) -> str:
+    return f"{_shard_dir(plan, shard)}mapping/"
+
+def _shard_leases(plan: Dict, owner: str = None) -> ShardLeases:
+    if INGEST_SHARD_LEASE_URI:
+        root = f"{INGEST_SHARD_LEASE_URI.rstrip('/')}/{plan['plan_id']}/"
+    else:
+        root = f"{plan['root']}{plan['plan_id']}/leases/"
+    backend = GcsLeaseBackend(get_storage_client(), root) if root.startswith("gs://") else LocalLeaseBackend(root)
+    return ShardLeases(backend, plan["shards"], ttl_seconds=INGEST_SHARD_LEASE_SECONDS, owner=owner)
+
+def load_shard_plan(mapping_uri: str) -> Dict:
+    raw = read_uri_bytes(f"{_shard_work_root(mapping_uri)}plan.json")
+    if not raw:
+        raise ValueError(f"No sharded ingestion plan for {mapping_uri}; run plan_sharded_ingest first")
+    return json.loads(raw.decode("utf-8"))
+
+def plan_sharded_ingest(gcs_prefix: str, index_resource_name: str, mapping_uri: str, shards: int,
+                        full_rebuild: bool = False) -> Dict:
+    """
+    List `gcs_prefix` once and hash-partition its objects into `shards` shards
+    for run_shard_worker. Each shard's manifest is seeded from the main one, so
+    unchanged objects are skipped as in an unsharded run. Replaces any
+    earlier plan for `mapping_uri`.
+    """
+    shards = max(int(shards), 1)
+    root = _shard_work_root(mapping_uri)
+    previous = read_uri_bytes(f"{root}plan.json")
+    if previous:
+        old = json.loads(previous.decode("utf-8"))
+        if not old.get("merged"):
+            print(f"[WARN] Replacing plan {old['plan_id']}, which was never merged; its files stay under {root}{old['plan_id']}/")
+    plan = {
+        "plan_id": f"{int(time.time())}-{uuid.uuid4().hex[:8]}",
+        "root": root,
+        "gcs_prefix": gcs_prefix,
+        "index_resource_name": index_resource_name,
+        "mapping_uri": mapping_uri,
+        "shards": shards,
+        "full_rebuild": bool(full_rebuild),
+        "id_mode": INGEST_ID_MODE,
+        "created": time.time(),
+    }
+    parts: List[List[Dict]] = [[] for _ in range(shards)]
+    for obj in iter_gcs_objects(gcs_prefix):
+        parts[shard_of(obj["uri"], shards)].append(obj)
+    main = load_manifest_from_gcs(manifest_uri_for(mapping_uri))
+    seeds = [IngestManifest(id_mode=main.id_mode) for _ in range(shards)]
+    for uri, entry in main.entries.items():
+        if uri.startswith(gcs_prefix):
+            seeds[shard_of(uri, shards)].entries[uri] = entry
+
+    for shard in range(shards):
+        objects = sorted(parts[shard], key=lambda o: o["uri"])
+        write_uri_bytes(f"{_shard_dir(plan, shard)}objects.json", json.dumps(objects).encode("utf-8"),
+                        content_type="application/json")
+        save_manifest_to_gcs(manifest_uri_for(_shard_mapping_uri(plan, shard)), seeds[shard])
+    plan["objects"] = [len(p) for p in parts]
+    # written last: workers only see a plan once all of its shards exist
+    write_uri_bytes(f"{root}plan.json", json.dumps(plan).encode("utf-8"), content_type="application/json")
+    print(f"Planned {sum(plan['objects'])} objects under {gcs_prefix} into {shards} shards "
+          f"(plan {plan['plan_id']}, {min(plan['objects'])}-{max(plan['objects'])} objects per shard)")
+    return plan
+
+def run_shard_worker(mapping_uri: str, owner: str = None, max_shards: int = 0) -> List[int]:
+    """
+    Claim shards of the current plan one at a time and ingest each into its
+    partial mapping, until none is left to claim (all done, or leased by live
+    workers). A failed shard's lease is released so another worker resumes it
+    from its checkpoint; a worker that dies simply lets its lease expire.
+    Returns the shards this worker completed.
+    """
+    plan = load_shard_plan(mapping_uri)
+    leases = _shard_leases(plan, owner)
+    if VECTOR_LOCAL_INDEX_DIR or CHUNK_STORE_PATH:
+        print("[INFO] Local vector index / chunk store are updated by merge_sharded_ingest, not by shard workers")
+    if NEAR_DUP_INDEX_URI:
+        print("[INFO] Near-duplicate suppression is off in sharded runs")
+    # content IDs: chunks already in the main mapping (moved/copied text) are linked, not re-embedded
+    indexed = open_mapping_store(plan["mapping_uri"]) if plan["id_mode"] == "content" else None
+    done: List[int] = []
+    while not max_shards or len(done) < max_shards:
+        shard = leases.claim()
+        if shard is None:
+            break
+        print(f"[INFO] {leases.owner} claimed shard {shard} of {plan['shards']}")
+        objects = json.loads(read_uri_bytes(f"{_shard_dir(plan, shard)}objects.json").decode("utf-8"))
+        keeper = LeaseKeeper(leases, shard)
+        try:
+            with keeper:
+                # every write of the shard's mapping, manifest and checkpoint is fenced on the lease
+                stats = _ingest(plan["gcs_prefix"], plan["index_resource_name"], _shard_mapping_uri(plan, shard),
+                                full_rebuild=plan["full_rebuild"], objects=objects, shard=(shard, plan["shards"]),
+                                indexed=indexed, fence=keeper.check)
+                keeper.check()
+        except LeaseLost as e:
+            print(f"[WARN] {e}; stopped shard {shard} and left it to the new owner")
             continue
+        except BaseException:
+            leases.release(shard)
+            raise
+        leases.complete(shard, **stats)
+        done.append(shard)
+    print(f"[INFO] Worker {leases.owner} done; completed shards {done}")
+    return done
 
-        for i, ch in enumerate(chunks):
-            cid = stable_uuid(ns, f"{f}::chunk::{i}")
-            to_upsert.append((cid, ch))
-            provenance[cid] = {"src": f, "i": i}
+def sharded_ingest_status(mapping_uri: str) -> Dict[int, Dict]:
+    """shard -> lease record of the current plan."""
+    plan = load_shard_plan(mapping_uri)
+    status = _shard_leases(plan).status()
+    now = time.time()
+    for shard, record in status.items():
+        state = record.get("state")
+        if state == "leased" and (record.get("expires_at") or 0) < now:
+            state = "expired"
+        print(f"shard {shard:4d}: {state:<8} {plan['objects'][shard]:>8} objects  {record.get('owner') or ''}")
+    return status
 
-    if not to_upsert:
-        print("Nothing to upsert after extraction.")
-        return
+def _remove_shard_plan(plan: Dict, leases: ShardLeases):
+    """Delete a plan's work files: partial mappings, shard manifests and listings, leases, plan.json."""
+    for shard in range(plan["shards"]):
+        shard_mapping = _shard_mapping_uri(plan, shard)
+        open_mapping_store(shard_mapping).destroy()
+        delete_uri(manifest_uri_for(shard_mapping))
+        delete_uri(f"{_shard_dir(plan, shard)}objects.json")
+        for uri in shard_cache_uris(shard_mapping).values():
+            delete_uri(uri)
+    leases.clear()
+    delete_uri(f"{plan['root']}plan.json")
+
+def merge_sharded_ingest(mapping_uri: str) -> Dict:
+    """
+    Once every shard is done: fold the shard manifests and partial mappings
+    into the main ones, remove datapoints no object produces any more (across
+    all shards, so content-addressed IDs shared between shards survive),
+    update the chunk store, local index and lexical index, publish a new index
+    version and delete the plan's work files.
+    """
+    plan = load_shard_plan(mapping_uri)
+    leases = _shard_leases(plan)
+    if plan.get("merged"):
+        # an earlier merge got as far as saving the manifest; only the cleanup is left
+        _remove_shard_plan(plan, leases)
+        return {"shards": plan["shards"], "entries": 0, "removed": 0}
+    pending = [shard for shard, r in leases.status().items() if r.get("state") != "done"]
+    if pending:
+        raise RuntimeError(f"Cannot merge: shards {pending} of plan {plan['plan_id']} are not done")
+    prefix = plan["gcs_prefix"]
+    content_ids = plan["id_mode"] == "content"
 
-    # Upsert
-    id2text = upsert_docs(index_resource_name, to_upsert)
+    manifest_uri = manifest_uri_for(mapping_uri)
+    previous = load_manifest_from_gcs(manifest_uri)
+    merged = IngestManifest({u: e for u, e in previous.entries.items() if not u.startswith(prefix)},
+                            id_mode=plan["id_mode"])
+    for shard in range(plan["shards"]):
+        merged.entries.update(load_manifest_from_gcs(manifest_uri_for(_shard_mapping_uri(plan, shard))).entries)
+    removed = sorted({cid for u, e in previous.entries.items() if u.startswith(prefix) for cid in e.get("ids", [])
+                      if not merged.is_referenced(cid)}
+                     | {cid for cid in previous.stale_ids if not merged.is_referenced(cid)})
+    produced: Dict[str, set] = {}
 
-    # Merge into mapping and save (locally + GCS)
-    for cid, meta in provenance.items():
-        mapping[cid] = {
-            "source": meta["src"],
-            "chunk_index": meta["i"],
-            "text": id2text.get(cid, "")
-        }
+    def live_sources(cid: str, sources: Dict[str, int]) -> Dict[str, int]:
+        # sources recorded before this run may point at objects that moved or changed since
+        out = {}
+        for uri, i in sources.items():
+            if uri not in produced:
+                produced[uri] = set(merged.ids_for(uri))
+            if cid in produced[uri]:
+                out[uri] = i
+        return out
+
+    mapping = open_mapping_store(mapping_uri)
+    chunk_store = open_chunk_store()
+    store = open_embedding_store() if VECTOR_LOCAL_INDEX_DIR or EMBED_CACHE_GCS_URI else None
+    text_cache = open_extracted_text_store() if EXTRACT_CACHE_GCS_URI else None
+    # the shared caches get every shard's additions (workers push theirs next to their partial mappings)
+    folded = {"embed": 0, "text": 0}
+    for shard in range(plan["shards"]):
+        caches = shard_cache_uris(_shard_mapping_uri(plan, shard))
+        if EMBED_CACHE_GCS_URI:
+            folded["embed"] += fold_sidecar(store, caches["embed"])
+        if EXTRACT_CACHE_GCS_URI:
+            folded["text"] += fold_sidecar(text_cache, caches["text"])
+    if text_cache is not None:
+        save_extracted_text_store(text_cache)
+        text_cache.close()
+    if any(folded.values()):
+        print(f"Merged shard caches: {folded['embed']} embeddings, {folded['text']} extracted texts")
+    local_update = local_vector_index.IndexUpdate(VECTOR_LOCAL_INDEX_DIR, durable=True, ann=VECTOR_LOCAL_ANN) if VECTOR_LOCAL_INDEX_DIR else None
+    merged_entries = 0
+
+    def apply(batch: Dict[str, Dict]):
+        existing = mapping.get_many(batch) if content_ids else {}
+        if content_ids:
+            for cid, entry in batch.items():
+                sources = live_sources(cid, {**(_sources_of(existing[cid]) if cid in existing else {}),
+                                             **_sources_of(entry)})
+                if sources:
+                    source, chunk_index = next(iter(sources.items()))
+                    batch[cid] = {**entry, "source": source, "chunk_index": chunk_index, "sources": sources}
+        mapping.put_many(batch)
+        rows = [(cid, e["text"], e["source"], e["chunk_index"]) for cid, e in batch.items() if "text" in e]
+        if chunk_store is not None:
+            chunk_store.put_many(rows)
+        # a content ID already in the main mapping has the same text, so its local row is current
+        rows = [row for row in rows if row[0] not in existing]
+        if local_update is not None and rows:
+            # vectors come from the embedding cache the workers filled (missing ones are embedded again)
+            texts = [ch for _, ch, _, _ in rows]
+            local_update.add([cid for cid, _, _, _ in rows], texts, embed_texts_cached(texts, store))
+
+    try:
+        for shard in range(plan["shards"]):
+            part = open_mapping_store(_shard_mapping_uri(plan, shard))
+            batch: Dict[str, Dict] = {}
+            for cid, entry in part.iter_items():
+                if "duplicate_of" in entry or not merged.is_referenced(cid):
+                    continue
+                batch[cid] = entry
+                if len(batch) >= INGEST_BATCH_CHUNKS:
+                    apply(batch)
+                    merged_entries += len(batch)
+                    batch = {}
+            if batch:
+                apply(batch)
+                merged_entries += len(batch)
+            part.close()
 
-    # Also keep a local backup
-    with open("vector_mapping.json", "w", encoding="utf-8") as f:
-        json.dump(mapping, f, ensure_ascii=False, indent=2)
-    print("Saved local vector_mapping.json")
+        remove_docs(plan["index_resource_name"], removed)
+        mapping.delete_many(removed)
+        if chunk_store is not None:
+            chunk_store.delete_many(removed)
+            save_chunk_store(chunk_store)
+        if local_update is not None:
+            local_update.delete(removed)
+            version = local_update.commit()
+            print(f"Local vector index updated: {VECTOR_LOCAL_INDEX_DIR} (version {version})")
+    except BaseException:
+        if local_update is not None:
+            local_update.close()
+        raise
+    finally:
+        if chunk_store:
+            chunk_store.close()
+        if store:
+            save_embedding_store(store)
+            store.close()
 
-    # Push to GCS
-    save_mapping_to_gcs(mapping_uri, mapping)
+    # Persist like build_and_upsert: the manifest goes last, so a failed merge can simply be run again
+    mapping.flush()
+    mapping.compact(max_segments=MAPPING_MAX_SEGMENTS)
+    save_lexical_index(mapping)
+    save_manifest_to_gcs(manifest_uri, merged)
+    publish_index_version(plan["plan_id"])
+    plan["merged"] = time.time()
+    write_uri_bytes(f"{plan['root']}plan.json", json.dumps(plan).encode("utf-8"), content_type="application/json")
 
-    print(f"All done. Upserted {len(to_upsert)} chunks from {len(files)} files.")
+    _remove_shard_plan(plan, leases)
+    print(f"Merged {plan['shards']} shards: {merged_entries} mapping entries, {len(removed)} stale datapoints removed")
+    return {"shards": plan["shards"], "entries": merged_entries, "removed": len(removed)}
 
 
 # Create FunctionTools from the functions
 query_documents_tool = FunctionTool(retrieve_documents)
+query_documents_batch_tool = FunctionTool(retrieve_documents_batch)
 build_and_upsert_tool = FunctionTool(build_and_upsert)
\ No newline at end of file
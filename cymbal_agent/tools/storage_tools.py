@@ -4,11 +4,12 @@ Google Cloud Storage (GCS) Bucket Management Tools for ADK
 This module provides tools for creating and listing GCS buckets to be used with the Agent Development Kit (ADK).
 """
 import os
-from google.cloud import storage
 from google.api_core.exceptions import GoogleAPIError
 from google.adk.tools import ToolContext, FunctionTool
 from typing import Dict, Any, Optional
 
+from ..utils.clients import get_storage_client
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -18,9 +19,6 @@ GCS_LIST_BLOBS_MAX_RESULTS = int(os.getenv("GCS_LIST_BLOBS_MAX_RESULTS"))
 GCS_DEFAULT_CONTENT_TYPE = os.getenv("GCS_DEFAULT_CONTENT_TYPE")
 
 
-# Initialize the GCS client
-client = storage.Client(project=PROJECT_ID)
-
 def list_gcs_buckets(
     prefix: Optional[str] = None,
     max_results: Optional[int] = None
@@ -38,11 +36,8 @@ def list_gcs_buckets(
     if max_results is None:
         max_results = GCS_LIST_BUCKETS_MAX_RESULTS
     try:
-        # Initialize the client
-        client = storage.Client(project=PROJECT_ID)
-        
         # List the buckets with optional filtering
-        bucket_iterator = client.list_buckets(prefix=prefix, max_results=max_results)
+        bucket_iterator = get_storage_client(PROJECT_ID).list_buckets(prefix=prefix, max_results=max_results)
         
         bucket_list = []
         for bucket in bucket_iterator:
@@ -86,14 +81,11 @@ def get_bucket_details() -> Dict[str, Any]:
     bucket_name = "cymbal-document"
 
     try:
-        # Initialize the client
-        client = storage.Client(project=PROJECT_ID)
-        
         # Get the bucket
-        bucket = client.get_bucket(bucket_name)
+        bucket = get_storage_client(PROJECT_ID).get_bucket(bucket_name)
         
         # List all blobs in the bucket
-        blobs = client.list_blobs(bucket_name)
+        blobs = get_storage_client(PROJECT_ID).list_blobs(bucket_name)
         blob_list = []
         for blob in blobs:
             blob_list.append({
@@ -162,14 +154,11 @@ def list_blobs_in_bucket(
     if max_results is None:
         max_results = GCS_LIST_BLOBS_MAX_RESULTS
     try:
-        # Initialize the client
-        client = storage.Client(project=PROJECT_ID)
-        
         # Get the bucket
-        bucket = client.bucket(bucket_name)
+        bucket = get_storage_client(PROJECT_ID).bucket(bucket_name)
         
         # List blobs with optional filtering
-        blobs = client.list_blobs(
+        blobs = get_storage_client(PROJECT_ID).list_blobs(
             bucket_name, 
             prefix=prefix, 
             delimiter=delimiter,
@@ -264,8 +253,7 @@ def upload_file_to_gcs(
                         destination_blob_name += ".pdf"
                 
                 # Upload to GCS
-                client = storage.Client(project=PROJECT_ID)
-                bucket = client.bucket(bucket_name)
+                bucket = get_storage_client(PROJECT_ID).bucket(bucket_name)
                 blob = bucket.blob(destination_blob_name)
                 
                 blob.upload_from_string(
@@ -16,14 +16,13 @@ Add to requirements.txt:
 
 import os
 import re
-import time
 from typing import Optional, List
 from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
 
 from google.adk.tools import FunctionTool
 
+from ..utils.clients import get_http_session
+
 load_dotenv()
 
 GOOGLE_SEARCH = os.getenv("GOOGLE_SEARCH")
@@ -63,7 +62,7 @@ def google_web_search(
         params["dateRestrict"] = f"d{int(recent_days)}"
 
     try:
-        resp = requests.get("https://www.googleapis.com/customsearch/v1", params=params, timeout=20)
+        resp = get_http_session().get("https://www.googleapis.com/customsearch/v1", params=params, timeout=20)
         if resp.status_code != 200:
             return f"Search error {resp.status_code}: {resp.text}"
         data = resp.json()
@@ -103,14 +102,12 @@ def _fetch_url_text(url: str, timeout: int = 20, max_chars: int = 8000) -> str:
         )
     }
     try:
-        r = requests.get(url, headers=headers, timeout=timeout)
-        if r.status_code == 429:
-            # simple backoff & retry once
-            time.sleep(1.5)
-            r = requests.get(url, headers=headers, timeout=timeout)
+        # keep-alive session; 429/5xx are retried with backoff by its retry policy
+        r = get_http_session().get(url, headers=headers, timeout=timeout)
         if r.status_code != 200:
             return f"[{url}] HTTP {r.status_code} - unable to fetch."
         html = r.text or ""
+        from bs4 import BeautifulSoup   # only needed once a page is fetched
         soup = BeautifulSoup(html, "html.parser")
 
         # Remove scripts/styles/nav/footer for cleaner text
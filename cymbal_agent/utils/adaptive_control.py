@@ -0,0 +1,198 @@
+"""
+Adaptive (AIMD) concurrency, batch-size and retry control for remote API calls.
+
+    control = AdaptiveControl("embed",
+                              concurrency=AimdLimit(initial=2, minimum=1, maximum=8, step=1),
+                              batch=AimdLimit(initial=10000, minimum=1000, maximum=20000, step=2000))
+    budget = control.batch_limit()            # size the next batches with this
+    result = control.call(fn, *args)           # waits for a slot, retries, adapts
+
+Every success counts toward an additive increase of both limits (by `step`
+after `window` consecutive successes). A throttling error (quota exhausted,
+overloaded, deadline exceeded) cuts both limits multiplicatively, at most
+once per `cooldown` seconds so a burst of failures from calls that were
+already in flight counts as one congestion event. Throttling and transient
+errors (5xx, connection resets) are retried up to `max_attempts` times with
+full-jitter exponential backoff; any other error is raised immediately.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+
+# HTTP / google.api_core / google.genai status codes and gRPC status names
+_THROTTLE_CODES = {429, 503, 504}
+_TRANSIENT_CODES = {408, 500, 502}
+_THROTTLE_STATUS = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED"}
+_TRANSIENT_STATUS = {"INTERNAL", "ABORTED"}
+_THROTTLE_TYPES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded", "GatewayTimeout"}
+_TRANSIENT_TYPES = {"InternalServerError", "BadGateway", "Aborted", "ServerError"}
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """THROTTLE, TRANSIENT, or None for errors that retrying will not fix."""
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & _THROTTLE_TYPES:
+        return THROTTLE
+    if names & _TRANSIENT_TYPES:
+        return TRANSIENT
+    code = getattr(exc, "code", None)
+    if callable(code):   # grpc.RpcError
+        try:
+            code = code()
+        except Exception:
+            code = None
+    status = getattr(code, "name", None)
+    if status in _THROTTLE_STATUS or code in _THROTTLE_CODES:
+        return THROTTLE
+    if status in _TRANSIENT_STATUS or code in _TRANSIENT_CODES:
+        return TRANSIENT
+    if isinstance(exc, TimeoutError):
+        return THROTTLE
+    if isinstance(exc, ConnectionError):
+        return TRANSIENT
+    return None
+
+
+class AimdLimit:
+    """A limit that grows by `step` every `window` successes and is multiplied by `backoff` on congestion."""
+
+    def __init__(self, initial: float, minimum: float, maximum: float, step: float,
+                 backoff: float = 0.5, window: int = 4):
+        self.minimum = float(minimum)
+        self.maximum = float(max(maximum, minimum))
+        self.value = min(max(float(initial), self.minimum), self.maximum)
+        self.step = float(step)
+        self.backoff = float(backoff)
+        self.window = max(int(window), 1)
+        self._successes = 0
+
+    def increase(self) -> None:
+        self._successes += 1
+        if self._successes >= self.window:
+            self._successes = 0
+            self.value = min(self.value + self.step, self.maximum)
+
+    def decrease(self) -> None:
+        self._successes = 0
+        self.value = max(self.value * self.backoff, self.minimum)
+
+    def __int__(self) -> int:
+        return int(self.value)
+
+
+class AdaptiveControl:
+    """Thread-safe AIMD concurrency gate + batch-size limit + jittered retries for one kind of call."""
+
+    def __init__(self, name: str, concurrency: AimdLimit, batch: Optional[AimdLimit] = None,
+                 max_attempts: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 cooldown: float = 2.0, sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.concurrency = concurrency
+        self.batch = batch
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.cooldown = float(cooldown)
+        self._sleep = sleep
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self.succeeded = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    # ---- limits ----
+    def batch_limit(self) -> int:
+        """Current batch budget (in whatever unit `batch` was configured with)."""
+        with self._cond:
+            return max(int(self.batch), 1) if self.batch is not None else 0
+
+    @property
+    def max_concurrency(self) -> int:
+        """Upper bound of the concurrency limit (size thread pools with this)."""
+        return max(int(self.concurrency.maximum), 1)
+
+    def _on_success(self) -> None:
+        with self._cond:
+            self.succeeded += 1
+            self.concurrency.increase()
+            if self.batch is not None:
+                self.batch.increase()
+            self._cond.notify_all()
+
+    def _on_throttle(self) -> None:
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.concurrency.decrease()
+                if self.batch is not None:
+                    self.batch.decrease()
+                print(f"[WARN] {self.name}: throttled; concurrency -> {int(self.concurrency)}"
+                      + (f", batch -> {int(self.batch)}" if self.batch is not None else ""))
+
+    @contextmanager
+    def slot(self):
+        """Wait until fewer than the current concurrency limit of calls are in flight."""
+        with self._cond:
+            while self._in_flight >= max(int(self.concurrency), 1):
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2**attempt)]."""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # ---- calls ----
+    def call(self, fn: Callable, *args, **kwargs):
+        attempt = 0
+        while True:
+            with self.slot():
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    kind = classify_error(e)
+                    if kind == THROTTLE:
+                        self._on_throttle()
+                    if kind is None or attempt + 1 >= self.max_attempts:
+                        with self._cond:
+                            self.failures += 1
+                        raise
+                    error = e
+                else:
+                    self._on_success()
+                    return result
+            delay = self.backoff_delay(attempt)
+            with self._cond:
+                self.retries += 1
+            print(f"[WARN] {self.name}: {type(error).__name__} ({error}); retry {attempt + 1}/{self.max_attempts - 1} "
+                  f"in {delay:.1f}s")
+            self._sleep(delay)
+            attempt += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._cond:
+            out = {
+                "succeeded": self.succeeded,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "concurrency": int(self.concurrency),
+            }
+            if self.batch is not None:
+                out["batch"] = int(self.batch)
+            return out
@@ -0,0 +1,169 @@
+"""
+Final-answer cache keyed by prompt, with exact and semantic matching.
+
+    cache = AnswerCache(embed=embed_query, similarity=0.95, version=lambda: read_version())
+    hit = cache.lookup("How do I file an SED?")   -> CachedAnswer or None
+    cache.store("How do I file an SED?", answer_text)
+
+An exact hit is a prompt equal to a cached one after case/whitespace
+normalization. Otherwise the prompt is embedded and compared (cosine) with
+every cached prompt; the closest one at or above `similarity` is a semantic
+hit. Entries expire after `ttl_seconds`, the least recently used is evicted
+past `maxsize`, and everything is dropped when `version()` (the knowledge
+index version) changes.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class CachedAnswer(NamedTuple):
+    prompt: str
+    answer: str
+    match: str          # "exact" | "semantic"
+    similarity: float
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        similarity: float = 0.95,
+        maxsize: int = 1000,
+        ttl_seconds: float = 86400.0,
+        version: Optional[Callable[[], Optional[str]]] = None,
+        version_check_seconds: float = 60.0,
+    ):
+        self.embed = embed
+        self.similarity = similarity
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl_seconds = ttl_seconds
+        self._version_fn = version
+        self.version_check_seconds = version_check_seconds
+        self._version: Optional[str] = None
+        self._version_checked = 0.0
+
+        self._lock = threading.Lock()
+        # normalized prompt -> {"prompt", "answer", "vector" (unit np.ndarray or None), "stored"}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._recent_similarities: deque = deque(maxlen=500)
+
+    # ---- version / expiry ----
+    def _check_version(self) -> None:
+        if self._version_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._version_checked < self.version_check_seconds:
+            return
+        self._version_checked = now
+        try:
+            version = self._version_fn()
+        except Exception as e:
+            print(f"[WARN] Could not read knowledge index version: {e}")
+            return
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                    print(f"[INFO] Knowledge index version changed ({self._version} -> {version}); answer cache cleared")
+                self._entries.clear()
+                self._version = version
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry["stored"] > self.ttl_seconds
+
+    def _unit(self, prompt: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        v = np.asarray(self.embed(prompt), dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else None
+
+    # ---- lookups / updates ----
+    def lookup(self, prompt: str) -> Optional[CachedAnswer]:
+        self._check_version()
+        key = normalize_prompt(prompt)
+        if not key:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for k in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[k]
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits_exact += 1
+                return CachedAnswer(entry["prompt"], entry["answer"], "exact", 1.0)
+            candidates = [(k, e["vector"]) for k, e in self._entries.items() if e["vector"] is not None]
+
+        vec = self._unit(prompt) if candidates else None
+        best_key, best_sim = None, -1.0
+        if vec is not None:
+            sims = np.stack([v for _, v in candidates]) @ vec
+            i = int(np.argmax(sims))
+            best_key, best_sim = candidates[i][0], float(sims[i])
+
+        with self._lock:
+            if best_key is not None:
+                self._recent_similarities.append(best_sim)
+            entry = self._entries.get(best_key) if best_key is not None else None
+            if entry is not None and best_sim >= self.similarity:
+                self._entries.move_to_end(best_key)
+                self.hits_semantic += 1
+                return CachedAnswer(entry["prompt"], entry["answer"], "semantic", best_sim)
+            self.misses += 1
+            return None
+
+    def store(self, prompt: str, answer: str) -> None:
+        key = normalize_prompt(prompt)
+        if not key or not answer:
+            return
+        self._check_version()
+        try:
+            vec = self._unit(prompt)
+        except Exception as e:
+            print(f"[WARN] Could not embed prompt for the answer cache: {e}")
+            vec = None
+        with self._lock:
+            self._entries[key] = {"prompt": prompt, "answer": answer, "vector": vec, "stored": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Counters plus quantiles of recent best-match similarities, for tuning the threshold."""
+        with self._lock:
+            lookups = self.hits_exact + self.hits_semantic + self.misses
+            sims = np.array(self._recent_similarities, dtype=np.float32)
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "similarity_threshold": self.similarity,
+                "index_version": self._version,
+                "hits_exact": self.hits_exact,
+                "hits_semantic": self.hits_semantic,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": ((self.hits_exact + self.hits_semantic) / lookups) if lookups else None,
+                "recent_similarity_p50": float(np.quantile(sims, 0.5)) if len(sims) else None,
+                "recent_similarity_p90": float(np.quantile(sims, 0.9)) if len(sims) else None,
+            }
@@ -0,0 +1,83 @@
+"""
+Runner that serves repeated questions from an AnswerCache.
+
+On a hit the stored final answer is appended to the session as the agent's
+reply and yielded as the only event, so the model, guardrail callbacks and
+tools are skipped entirely. On a miss the normal run happens, and its final
+answer is stored when the turn is cacheable:
+  - only tools in `cacheable_tools` were called (no side effects, no
+    user-specific memory lookups),
+  - the run ended without an error, and
+  - with `first_turn_only`, the session had no earlier events (a follow-up
+    question depends on the conversation, not only on its own text).
+"""
+
+import uuid
+from typing import AsyncGenerator, Iterable, Optional
+
+from google.adk.events import Event, EventActions
+from google.adk.runners import Runner
+from google.genai import types
+
+from .answer_cache import AnswerCache
+
+
+def _content_text(content: Optional[types.Content]) -> str:
+    if not content or not content.parts:
+        return ""
+    return "".join(p.text for p in content.parts if getattr(p, "text", None))
+
+
+class CachingRunner(Runner):
+    def __init__(self, *, answer_cache: AnswerCache, cacheable_tools: Iterable[str] = (),
+                 first_turn_only: bool = True, **runner_kwargs):
+        super().__init__(**runner_kwargs)
+        self.answer_cache = answer_cache
+        self.cacheable_tools = set(cacheable_tools)
+        self.first_turn_only = first_turn_only
+
+    async def run_async(self, *, user_id: str, session_id: str, new_message: types.Content,
+                        **kwargs) -> AsyncGenerator[Event, None]:
+        prompt = _content_text(new_message)
+        session = await self.session_service.get_session(
+            app_name=self.app_name, user_id=user_id, session_id=session_id
+        )
+        eligible = bool(prompt) and session is not None and not (self.first_turn_only and session.events)
+
+        hit = None
+        if eligible:
+            try:
+                hit = self.answer_cache.lookup(prompt)
+            except Exception as e:
+                print(f"[WARN] Answer cache lookup failed: {e}")
+        if hit is not None:
+            print(f"[INFO] Answer cache hit ({hit.match}, similarity={hit.similarity:.3f})")
+            invocation_id = f"e-{uuid.uuid4()}"
+            await self.session_service.append_event(
+                session, Event(invocation_id=invocation_id, author="user", content=new_message)
+            )
+            state_delta = {self.agent.output_key: hit.answer} if getattr(self.agent, "output_key", None) else {}
+            answer = Event(
+                invocation_id=invocation_id,
+                author=self.agent.name,
+                content=types.Content(role="model", parts=[types.Part(text=hit.answer)]),
+                actions=EventActions(state_delta=state_delta),
+            )
+            await self.session_service.append_event(session, answer)
+            yield answer
+            return
+
+        final_text, cacheable = "", eligible
+        async for event in super().run_async(user_id=user_id, session_id=session_id, new_message=new_message, **kwargs):
+            if cacheable:
+                if getattr(event, "error_code", None):
+                    cacheable = False
+                for call in event.get_function_calls() or []:
+                    if call.name not in self.cacheable_tools:
+                        cacheable = False
+                if event.author == self.agent.name and event.is_final_response() and not event.partial:
+                    final_text = _content_text(event.content) or final_text
+            yield event
+
+        if cacheable and final_text:
+            self.answer_cache.store(prompt, final_text)
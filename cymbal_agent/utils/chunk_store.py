@@ -0,0 +1,56 @@
+"""
+Chunk-text store keyed by datapoint ID (local SQLite).
+
+Keeps chunk text out of the vector index: Vector Search only has to return
+IDs and distances, and the texts of all neighbors are fetched here in one
+bulk lookup. The database is a single file that ingestion can mirror to GCS
+and query-serving instances can pull on start-up.
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+from .sqlite_sidecar import SqliteSidecar
+
+
+class ChunkStore(SqliteSidecar):
+    """Thread-safe SQLite id -> (text, source, chunk_index) store."""
+
+    TABLE = "chunks"
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS chunks ("
+              "id TEXT PRIMARY KEY, text TEXT NOT NULL, source TEXT, chunk_index INTEGER)")
+
+    def get_texts(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Bulk lookup; IDs that are not stored are simply absent from the result."""
+        out: Dict[str, str] = {}
+        with self._lock:
+            for batch in self._batches(ids):
+                rows = self._conn.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({self._placeholders(batch)})", batch
+                ).fetchall()
+                out.update(rows)
+        return out
+
+    def put_many(self, rows: List[Tuple[str, str, str, int]]) -> None:
+        """rows: (id, text, source, chunk_index)"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, source, chunk_index) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete_many(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for batch in self._batches(ids):
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({self._placeholders(batch)})", batch)
+            self._conn.commit()
+
+    def iter_chunks(self, batch_size: int = 1000):
+        """Yield (id, text) for every stored chunk, without loading them all at once."""
+        cursor = self._conn.cursor()
+        cursor.execute("SELECT id, text FROM chunks ORDER BY id")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
@@ -0,0 +1,174 @@
+"""
+Process-wide registry of long-lived Google Cloud and HTTP clients.
+
+Every getter creates its client on first use and hands the same instance to
+all later callers (and threads), so tool calls reuse established TLS
+connections, gRPC channels and auth tokens instead of paying the handshakes on
+each call:
+
+  get_storage_client()             -> google.cloud.storage.Client (pooled HTTP session)
+  get_genai_client()               -> google.genai.Client (Vertex mode)
+  get_match_client(api_endpoint)   -> aiplatform_v1.MatchServiceClient (one keep-alive channel per endpoint)
+  get_matching_engine_index(name)  -> aiplatform.MatchingEngineIndex (resource looked up once)
+  get_http_session()               -> requests.Session (pooled, retries 429/5xx on GET)
+
+`warm_clients()` creates them up front (e.g. at startup).
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+PROJECT_ID = os.getenv("PROJECT_ID")
+LOCATION = os.getenv("LOCATION")
+
+# Connection pool size per HTTP client, retries for idempotent HTTP calls, gRPC keep-alive ping interval
+# (Google front ends answer pings more often than every 5 minutes with GOAWAY "too_many_pings")
+CLIENT_HTTP_POOL_SIZE = int(os.getenv("CLIENT_HTTP_POOL_SIZE", "32"))
+CLIENT_HTTP_RETRIES = int(os.getenv("CLIENT_HTTP_RETRIES", "2"))
+CLIENT_GRPC_KEEPALIVE_MS = max(int(os.getenv("CLIENT_GRPC_KEEPALIVE_MS", "300000")), 300000)
+CLIENT_WARM_TIMEOUT_SECONDS = float(os.getenv("CLIENT_WARM_TIMEOUT_SECONDS", "10"))
+
+_clients: Dict[tuple, object] = {}
+_lock = threading.RLock()   # re-entrant: a factory may create another shared client
+
+
+def _get_or_create(key: tuple, factory: Callable[[], object]):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def _pooled_adapter(retry_gets: bool = False):
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = Retry(
+        total=CLIENT_HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    ) if retry_gets else 0
+    return HTTPAdapter(pool_connections=CLIENT_HTTP_POOL_SIZE, pool_maxsize=CLIENT_HTTP_POOL_SIZE, max_retries=retries)
+
+
+# ========= GOOGLE CLIENTS =========
+def get_storage_client(project: Optional[str] = None):
+    """Shared GCS client; its authorized session keeps up to CLIENT_HTTP_POOL_SIZE connections alive."""
+    def create():
+        from google.cloud import storage
+        client = storage.Client(project=project or PROJECT_ID)
+        # the default pool (10) is smaller than the ingestion download concurrency
+        client._http.mount("https://", _pooled_adapter())
+        return client
+    return _get_or_create(("storage", project or PROJECT_ID), create)
+
+
+def _init_vertexai() -> None:
+    """Configure the Vertex AI SDK (project/location) once, right before its first client is built."""
+    def create():
+        import vertexai
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        return True
+    _get_or_create(("vertexai-init",), create)
+
+
+def get_genai_client():
+    """Shared google-genai client (Vertex AI mode, PROJECT_ID / LOCATION)."""
+    def create():
+        from google import genai
+        _init_vertexai()
+        return genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    return _get_or_create(("genai",), create)
+
+
+def get_match_client(api_endpoint: str):
+    """Shared Vector Search MatchServiceClient over one keep-alive gRPC channel per endpoint."""
+    def create():
+        from google.cloud import aiplatform_v1
+        from google.cloud.aiplatform_v1.services.match_service.transports import MatchServiceGrpcTransport
+
+        host = api_endpoint if ":" in api_endpoint else f"{api_endpoint}:443"
+        channel = MatchServiceGrpcTransport.create_channel(
+            host,
+            options=[
+                ("grpc.keepalive_time_ms", CLIENT_GRPC_KEEPALIVE_MS),
+                ("grpc.keepalive_timeout_ms", 10000),   # pings only while calls are active
+                ("grpc.max_receive_message_length", -1),
+            ],
+        )
+        return aiplatform_v1.MatchServiceClient(transport=MatchServiceGrpcTransport(host=host, channel=channel))
+    return _get_or_create(("match", api_endpoint), create)
+
+
+def get_matching_engine_index(index_resource_name: str):
+    """Shared MatchingEngineIndex handle (constructing one performs a GET on the resource)."""
+    def create():
+        from google.cloud.aiplatform import MatchingEngineIndex
+        _init_vertexai()
+        return MatchingEngineIndex(index_name=index_resource_name)
+    return _get_or_create(("index", index_resource_name), create)
+
+
+# ========= HTTP =========
+def get_http_session():
+    """Shared requests.Session with pooled keep-alive connections and retries on GET 429/5xx."""
+    def create():
+        import requests
+        session = requests.Session()
+        adapter = _pooled_adapter(retry_gets=True)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_or_create(("http",), create)
+
+
+# ========= WARM-UP =========
+def warm_clients(match_api_endpoint: Optional[str] = None) -> Dict[str, bool]:
+    """
+    Create the shared clients ahead of the first tool call. With an endpoint,
+    also opens the Vector Search channel (TCP + TLS) and waits for it to be ready.
+    Failures are reported per client and never raised.
+    """
+    status: Dict[str, bool] = {}
+    for name, getter in (("storage", get_storage_client), ("genai", get_genai_client), ("http", get_http_session)):
+        try:
+            getter()
+            status[name] = True
+        except Exception as e:
+            print(f"[WARN] Could not create {name} client: {e}")
+            status[name] = False
+
+    if match_api_endpoint:
+        try:
+            import grpc
+            client = get_match_client(match_api_endpoint)
+            grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=CLIENT_WARM_TIMEOUT_SECONDS)
+            status["match"] = True
+        except Exception as e:
+            print(f"[WARN] Could not open Vector Search channel to {match_api_endpoint}: {e}")
+            status["match"] = False
+    return status
+
+
+def close_clients() -> None:
+    """Close and forget all shared clients (e.g. at shutdown or after fork)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        fn = getattr(client, "close", None) or getattr(getattr(client, "transport", None), "close", None)
+        if fn is not None:
+            try:
+                fn()
+            except Exception:
+                pass
@@ -0,0 +1,73 @@
+"""
+Content-defined chunking and content-addressed chunk IDs.
+
+With fixed-size windows, inserting a paragraph near the top of a file moves
+every later chunk boundary, so every later chunk (and its ID) changes. Here a
+boundary is placed after a word when a hash of the last `window` words hits
+a fixed pattern (and the chunk is at least `min_chars` long; it is forced at
+`max_chars`). Boundaries depend only on nearby words, so after an edit the
+chunking re-synchronizes within a chunk or two.
+
+The ID of a chunk is a UUID of the sha256 of its text. The same text gets
+the same ID whatever file, folder or position it comes from.
+"""
+
+import hashlib
+import uuid
+import zlib
+from typing import List
+
+# Fixed namespace: content IDs must not depend on the bucket, prefix or path
+CONTENT_ID_NAMESPACE = uuid.UUID("5b0f6a34-9a51-4c1e-8f0e-6f8f3f2d7c11")
+# Assumed average word length (chars incl. the space); constant so boundaries never depend on the whole text
+_CHARS_PER_WORD = 6
+
+
+def content_chunk_id(text: str) -> str:
+    return str(uuid.uuid5(CONTENT_ID_NAMESPACE, hashlib.sha256(text.encode("utf-8")).hexdigest()))
+
+
+def _tail(text: str, max_chars: int) -> str:
+    """The last whole words of `text`, at most `max_chars` long."""
+    if max_chars <= 0 or not text:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    cut = text.find(" ", len(text) - max_chars)
+    return text[cut + 1:] if cut != -1 else ""
+
+
+def content_defined_chunks(text: str, target_chars: int = 1000, overlap: int = 100,
+                           min_chars: int = None, max_chars: int = None, window: int = 3) -> List[str]:
+    """
+    Split `text` at content-defined word boundaries (about `target_chars` per
+    chunk on average). Whitespace is normalized first, as in chunk_text:
+    chunks are words joined by single spaces, and blank text has no chunks.
+    Each chunk after the first is prefixed with up to `overlap` chars of whole
+    words from the end of the previous one.
+    """
+    words = text.split() if text else []
+    if not words:
+        return []
+    min_chars = min_chars or target_chars // 2
+    max_chars = max_chars or target_chars * 2
+    divisor = max(1, round((target_chars - min_chars) / _CHARS_PER_WORD))
+
+    bodies: List[str] = []
+    start, length = 0, 0
+    for j, word in enumerate(words):
+        length += len(word) + (1 if j > start else 0)
+        at_end = j == len(words) - 1
+        too_long = not at_end and length + 1 + len(words[j + 1]) > max_chars
+        anchor = " ".join(words[max(start, j - window + 1):j + 1]).encode("utf-8")
+        if at_end or too_long or (length >= min_chars and zlib.crc32(anchor) % divisor == 0):
+            body = " ".join(words[start:j + 1])
+            # a single word longer than max_chars is split hard
+            bodies.extend(body[k:k + max_chars] for k in range(0, len(body), max_chars))
+            start, length = j + 1, 0
+
+    chunks = [bodies[0]]
+    for prev, body in zip(bodies, bodies[1:]):
+        prefix = _tail(prev, overlap)
+        chunks.append(f"{prefix} {body}" if prefix else body)
+    return chunks
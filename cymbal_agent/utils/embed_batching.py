@@ -0,0 +1,79 @@
+"""
+Request packing (by count and size) and throughput accounting for embedding calls.
+"""
+
+import threading
+from typing import Dict, List
+
+# Rough chars-per-token ratio for English prose; good enough for request sizing.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """
+    Split `texts` into consecutive batches of indices, each holding at most
+    `max_items` texts and about `max_tokens` estimated tokens. A single text
+    over the token budget still gets a batch of its own.
+    """
+    return pack_by_size([estimate_tokens(t) for t in texts], max_items, max_tokens)
+
+
+def pack_by_size(sizes: List[int], max_items: int, max_size: int) -> List[List[int]]:
+    """
+    Same packing for arbitrary item sizes (tokens, payload bytes, ...): batches
+    of consecutive indices with at most `max_items` items and `max_size` total
+    size; an item larger than `max_size` gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_size = 0
+    for i, size in enumerate(sizes):
+        if current and (len(current) >= max_items or current_size + size > max_size):
+            batches.append(current)
+            current, current_size = [], 0
+        current.append(i)
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ThroughputStats:
+    """Cumulative counters for embedding calls (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.requests = 0
+            self.texts = 0
+            self.tokens = 0
+            self.seconds = 0.0
+
+    def record(self, texts: int, tokens: int, requests: int, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.requests += requests
+            self.texts += texts
+            self.tokens += tokens
+            self.seconds += seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            secs = self.seconds or 0.0
+            return {
+                "calls": self.calls,
+                "requests": self.requests,
+                "texts": self.texts,
+                "estimated_tokens": self.tokens,
+                "seconds": round(secs, 3),
+                "texts_per_s": round(self.texts / secs, 2) if secs else 0.0,
+                "tokens_per_s": round(self.tokens / secs, 2) if secs else 0.0,
+            }
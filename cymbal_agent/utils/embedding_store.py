@@ -0,0 +1,46 @@
+"""
+Persistent, content-addressed embedding store (local SQLite).
+
+Vectors are keyed on sha256(model, dim, chunk text), so a chunk that has been
+embedded once is never sent to the embedding model again, whichever file or
+run it came from. The database is a single file and can be mirrored to GCS
+as a sidecar between runs.
+"""
+
+import hashlib
+from typing import Dict, Iterable
+
+import numpy as np
+
+from .sqlite_sidecar import SqliteSidecar
+
+
+def embedding_key(text: str, model: str, dim: int) -> str:
+    h = hashlib.sha256()
+    h.update(f"{model}\x00{dim}\x00".encode("utf-8"))
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingStore(SqliteSidecar):
+    """Thread-safe SQLite key -> float32 vector store (vectors in and out as float32 arrays)."""
+
+    TABLE = "embeddings"
+    SCHEMA = "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL)"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for batch in self._batches(keys):
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({self._placeholders(batch)})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    out[key] = np.frombuffer(blob, dtype=np.float32)
+        return out
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        rows = [(key, len(vec), np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
@@ -0,0 +1,64 @@
+"""
+Persistent cache of extracted document text (local SQLite).
+
+Entries are keyed by (object URI, generation, extractor cache_id): an object
+version is parsed once per engine, across reruns and retries. Storing a new
+generation of an object drops its older ones. Texts are zlib-compressed. The
+database is a single file and can be mirrored to GCS as a sidecar between
+runs, like the embedding store.
+"""
+
+import zlib
+from typing import Optional
+
+from .sqlite_sidecar import SqliteSidecar
+
+
+class ExtractedTextStore(SqliteSidecar):
+    """Thread-safe SQLite (uri, generation, engine) -> text store."""
+
+    TABLE = "extracted"
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS extracted ("
+              " uri TEXT NOT NULL, generation TEXT NOT NULL, engine TEXT NOT NULL, text BLOB NOT NULL,"
+              " PRIMARY KEY (uri, generation, engine))")
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uri: str, generation, engine: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM extracted WHERE uri = ? AND generation = ? AND engine = ?",
+                (uri, str(generation), engine),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, uri: str, generation, engine: str, text: str) -> None:
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute("DELETE FROM extracted WHERE uri = ? AND generation != ?", (uri, str(generation)))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extracted (uri, generation, engine, text) VALUES (?, ?, ?, ?)",
+                (uri, str(generation), engine, blob),
+            )
+            self._conn.commit()
+
+    def _merge_attached(self) -> int:
+        # an object's incoming generation replaces the versions cached here, as in put()
+        self._conn.execute(
+            "DELETE FROM extracted WHERE EXISTS (SELECT 1 FROM other.extracted o"
+            " WHERE o.uri = extracted.uri AND o.generation != extracted.generation)"
+        )
+        return super()._merge_attached()
+
+    def forget(self, uri: str) -> None:
+        """Drop every cached version of an object (e.g. it was deleted from the bucket)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM extracted WHERE uri = ?", (uri,))
+            self._conn.commit()
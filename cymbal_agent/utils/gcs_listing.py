@@ -0,0 +1,135 @@
+"""
+Parallel, prefix-partitioned GCS object listing.
+
+    for obj in iter_objects(client, "my-bucket", "docs/", exts={".pdf", ".txt"}, workers=8, depth=1):
+        ...   # {"uri", "generation", "crc32c", "size"}, while the rest is still being listed
+
+A single `list_blobs` iterator fetches one page (1000 objects) per request,
+strictly one after another. Here the prefix is first listed with
+delimiter "/" (to `depth` levels); every sub-prefix found is then listed in
+full by its own worker, and objects are yielded as pages arrive, in no
+particular order. Objects directly under a partitioned level come from the
+delimiter listing itself.
+
+Extension filtering is done by the server through `match_glob`
+(case-insensitive, e.g. "**.{[pP][dD][fF],[tT][xX][tT]}"), and responses are
+projected (`fields`) to the four properties ingestion uses. Names are still
+checked client-side (delimiter listings cannot be globbed, and older
+google-cloud-storage releases lack `match_glob`).
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
+
+_ITEM_FIELDS = "items(name,generation,crc32c,size)"
+_LIST_FIELDS = f"{_ITEM_FIELDS},nextPageToken"
+_WALK_FIELDS = f"{_ITEM_FIELDS},prefixes,nextPageToken"
+_DONE = object()
+
+
+def ext_glob(exts: Iterable[str]) -> Optional[str]:
+    """{'.pdf', '.txt'} -> '**.{[pP][dD][fF],[tT][xX][tT]}'; None when there is nothing to filter on."""
+    alternatives = []
+    for ext in sorted({e.lower().lstrip(".") for e in exts if e}):
+        alternatives.append("".join(f"[{c}{c.upper()}]" if c.isalpha() else c for c in ext))
+    if not alternatives:
+        return None
+    return "**." + (alternatives[0] if len(alternatives) == 1 else "{" + ",".join(alternatives) + "}")
+
+
+def iter_objects(client, bucket_name: str, prefix: str = "", exts: Optional[Iterable[str]] = None,
+                 workers: int = 8, depth: int = 1) -> Iterator[Dict]:
+    """
+    Yield every object under `prefix` whose name ends with one of `exts`
+    (all objects if None), listing sub-prefixes `depth` levels down
+    concurrently on `workers` threads. `depth=0` lists the prefix with a
+    single iterator. An error in any listing is raised to the caller.
+    """
+    exts = tuple(e.lower() for e in exts) if exts else None
+    glob = ext_glob(exts) if exts else None
+    bucket = client.bucket(bucket_name)
+    out: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    lock = threading.Lock()
+    tasks = [0]
+    no_glob = []   # set once list_blobs turned out not to accept match_glob
+
+    def emit(blob):
+        if exts is None or blob.name.lower().endswith(exts):
+            out.put({
+                "uri": f"gs://{bucket_name}/{blob.name}",
+                "generation": blob.generation,
+                "crc32c": blob.crc32c,
+                "size": blob.size,
+            })
+
+    def list_all(p: str):
+        kwargs = {"prefix": p, "fields": _LIST_FIELDS}
+        if glob and not no_glob:
+            kwargs["match_glob"] = glob
+        try:
+            blobs = client.list_blobs(bucket, **kwargs)
+        except TypeError:
+            # google-cloud-storage < 2.10: filter client-side only
+            if not no_glob:
+                no_glob.append(True)
+                print("[WARN] list_blobs has no match_glob (upgrade google-cloud-storage); filtering client-side")
+            kwargs.pop("match_glob", None)
+            blobs = client.list_blobs(bucket, **kwargs)
+        for page in blobs.pages:
+            if stop.is_set():
+                return
+            for blob in page:
+                emit(blob)
+
+    def walk(p: str, levels: int):
+        blobs = client.list_blobs(bucket, prefix=p, delimiter="/", fields=_WALK_FIELDS)
+        for page in blobs.pages:
+            if stop.is_set():
+                return
+            for blob in page:
+                emit(blob)
+            for sub in page.prefixes:
+                if levels > 1:
+                    submit(walk, sub, levels - 1)
+                else:
+                    submit(list_all, sub)
+
+    def run(fn, *args):
+        try:
+            fn(*args)
+        except BaseException as e:
+            stop.set()
+            out.put(e)
+        finally:
+            with lock:
+                tasks[0] -= 1
+                last = tasks[0] == 0
+            if last:
+                out.put(_DONE)
+
+    pool = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="gcs-list")
+
+    def submit(fn, *args):
+        # counted before the parent task finishes, so the count only reaches 0 once everything is listed
+        with lock:
+            tasks[0] += 1
+        pool.submit(run, fn, *args)
+
+    if depth > 0:
+        submit(walk, prefix, depth)
+    else:
+        submit(list_all, prefix)
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)
@@ -0,0 +1,83 @@
+"""
+Durable progress checkpoint for build_and_upsert.
+
+A checkpoint belongs to one logical run (`run_key`: prefix, index, mapping,
+mode). It records:
+  - completed: objects whose every chunk has been upserted,
+  - partial:   objects with some upserted chunks, and which chunk IDs those are,
+  - batches:   number of upsert batches committed so far.
+A restarted run with the same key skips completed objects and already
+committed chunks, and resumes from the last committed batch. Datapoints
+queued for removal are kept in the manifest (IngestManifest.stale_ids), not
+here, so they survive a checkpoint that is discarded because the next run has
+a different key.
+"""
+
+import json
+import time
+from typing import Dict, Iterable, List, Set
+
+CHECKPOINT_VERSION = 1
+
+
+class IngestCheckpoint:
+    def __init__(self, run_key: str, completed: Dict[str, str] = None, partial: Dict[str, Dict] = None,
+                 stale_ids: List[str] = None, batches: int = 0, started: float = None):
+        self.run_key = run_key
+        self.completed: Dict[str, str] = dict(completed or {})   # uri -> generation
+        self.partial: Dict[str, Dict] = dict(partial or {})       # uri -> {"generation", "ids": [...]}
+        self.stale_ids: List[str] = list(stale_ids or [])   # only read from checkpoints written before the manifest kept them
+        self.batches = int(batches)
+        self.started = started or time.time()
+
+    # ---- (de)serialization ----
+    @classmethod
+    def from_json(cls, raw: str, run_key: str) -> "IngestCheckpoint":
+        """Parse `raw`; a checkpoint written for another run is ignored."""
+        data = json.loads(raw) if raw else {}
+        if data.get("run_key") != run_key:
+            return cls(run_key)
+        return cls(
+            run_key,
+            completed=data.get("completed"),
+            partial=data.get("partial"),
+            stale_ids=data.get("stale_ids"),
+            batches=data.get("batches", 0),
+            started=data.get("started"),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "version": CHECKPOINT_VERSION,
+            "run_key": self.run_key,
+            "started": self.started,
+            "updated": time.time(),
+            "batches": self.batches,
+            "completed": self.completed,
+            "partial": self.partial,
+        }, ensure_ascii=False)
+
+    # ---- queries ----
+    def is_completed(self, uri: str, generation) -> bool:
+        return self.completed.get(uri) == str(generation)
+
+    def committed_ids(self, uri: str, generation) -> Set[str]:
+        entry = self.partial.get(uri)
+        if not entry or entry.get("generation") != str(generation):
+            return set()
+        return set(entry.get("ids", []))
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.completed or self.partial or self.batches)
+
+    # ---- updates ----
+    def mark_committed(self, uri: str, generation, ids: Iterable[str]) -> None:
+        entry = self.partial.get(uri)
+        if not entry or entry.get("generation") != str(generation):
+            entry = self.partial[uri] = {"generation": str(generation), "ids": []}
+        entry["ids"].extend(ids)
+
+    def mark_completed(self, uri: str, generation) -> None:
+        self.partial.pop(uri, None)
+        self.completed[uri] = str(generation)
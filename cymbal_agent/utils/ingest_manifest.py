@@ -0,0 +1,117 @@
+"""
+Per-object ingestion manifest.
+
+Records, for every GCS object that has been ingested, the object `generation`
+and `crc32c` it was ingested at and the datapoint IDs it produced. Comparing
+a fresh listing against the manifest tells build_and_upsert which objects are
+new or modified (re-ingest), which disappeared (remove their datapoints), and
+which datapoints a modified object no longer produces (trailing chunks of a
+file that shrank).
+
+With content-addressed IDs several objects can produce the same datapoint;
+`is_referenced` tells whether any object still does.
+
+`stale_ids` are datapoints no recorded object produces any more that have not
+been removed from the index yet. They are saved with the manifest, so they
+are removed by a later run even if the run that dropped them died.
+"""
+
+import json
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+MANIFEST_VERSION = 1
+
+
+class IngestManifest:
+    def __init__(self, entries: Dict[str, Dict] = None, id_mode: str = "path", stale_ids: List[str] = None):
+        # uri -> {"generation": int, "crc32c": str, "ids": [datapoint ids]}
+        self.entries: Dict[str, Dict] = dict(entries or {})
+        self.id_mode = id_mode   # how the recorded IDs were derived ("path" or "content")
+        self.stale_ids: List[str] = list(stale_ids or [])   # dropped by objects, not yet removed from the index
+        self._refs: Optional[Counter] = None   # datapoint id -> number of objects producing it
+
+    # ---- (de)serialization ----
+    @classmethod
+    def from_json(cls, raw: str) -> "IngestManifest":
+        data = json.loads(raw) if raw else {}
+        return cls(data.get("objects", {}), id_mode=data.get("id_mode", "path"), stale_ids=data.get("stale_ids"))
+
+    def to_json(self) -> str:
+        return json.dumps({"version": MANIFEST_VERSION, "id_mode": self.id_mode, "objects": self.entries,
+                           "stale_ids": self.stale_ids}, ensure_ascii=False)
+
+    def _ref_counts(self) -> Counter:
+        if self._refs is None:
+            self._refs = Counter(cid for e in self.entries.values() for cid in set(e.get("ids", [])))
+        return self._refs
+
+    def _unref(self, ids: Iterable[str]) -> None:
+        refs = self._ref_counts()
+        for cid in set(ids):
+            refs[cid] -= 1
+            if refs[cid] <= 0:
+                del refs[cid]
+
+    # ---- queries ----
+    def is_current(self, uri: str, generation, crc32c) -> bool:
+        entry = self.entries.get(uri)
+        return (
+            entry is not None
+            and str(entry.get("generation")) == str(generation)
+            and entry.get("crc32c") == crc32c
+        )
+
+    def is_referenced(self, cid: str) -> bool:
+        """True if some recorded object still produces datapoint `cid`."""
+        return self._ref_counts()[cid] > 0
+
+    def ids_for(self, uri: str) -> List[str]:
+        entry = self.entries.get(uri)
+        return list(entry.get("ids", [])) if entry else []
+
+    def diff(self, objects: Iterable[Dict], prefix: str = "") -> Tuple[List[Dict], List[str]]:
+        """
+        objects: listing entries with "uri", "generation", "crc32c".
+        Returns (changed objects, uris of manifest entries under `prefix` that are gone).
+        """
+        seen: Set[str] = set()
+        changed = list(self.iter_changed(objects, seen))
+        return changed, self.missing(seen, prefix)
+
+    def iter_changed(self, objects: Iterable[Dict], seen: Set[str], force: bool = False) -> Iterator[Dict]:
+        """Streaming diff: yield objects that are new or modified (all if `force`), adding every uri to `seen`."""
+        for obj in objects:
+            seen.add(obj["uri"])
+            if force or not self.is_current(obj["uri"], obj["generation"], obj["crc32c"]):
+                yield obj
+
+    def missing(self, seen: Set[str], prefix: str = "") -> List[str]:
+        """uris of entries under `prefix` that are not in `seen` (a complete listing)."""
+        return [uri for uri in self.entries if uri.startswith(prefix) and uri not in seen]
+
+    # ---- updates ----
+    def record(self, uri: str, generation, crc32c, ids: List[str]) -> List[str]:
+        """Store the new state of `uri`; returns the IDs it used to produce but no longer does."""
+        stale = set(self.ids_for(uri)) - set(ids)
+        self._unref(self.ids_for(uri))
+        self._ref_counts().update(set(ids))
+        self.entries[uri] = {"generation": generation, "crc32c": crc32c, "ids": list(ids)}
+        return sorted(stale)
+
+    def invalidate(self, uri: str) -> None:
+        """Keep `uri`'s IDs but make the next diff report it as changed."""
+        entry = self.entries.get(uri)
+        if entry is not None:
+            entry["generation"] = None
+            entry["crc32c"] = None
+
+    def forget(self, uri: str) -> List[str]:
+        """Drop `uri`; returns the IDs it produced."""
+        entry = self.entries.pop(uri, None)
+        ids = list(entry.get("ids", [])) if entry else []
+        self._unref(ids)
+        return ids
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,307 @@
+"""
+Shard assignment and lease records for sharded ingestion.
+
+Objects are assigned to one of N shards by a hash of their URI, so every
+process computes the same partition without coordination. Workers claim a
+shard through its lease record:
+
+  <lease root>/shard-0003.json -> {"shard": 3, "state": "leased" | "done", "owner": "host:pid:xxxx",
+                                   "expires_at": <unix time>, "attempt": 2}
+
+A free shard is claimed by creating its record; a lease whose `expires_at` has
+passed (its worker died or hung) can be taken over by any worker. A live
+worker renews its lease in the background (LeaseKeeper) and calls
+`LeaseKeeper.check()` before each write of shard state, so a worker whose
+lease lapsed stops instead of overwriting the new owner's progress. Records are only
+changed with compare-and-swap, so two workers never both win a shard:
+  - gs:// roots: object generation preconditions (if_generation_match),
+  - local directories (a single-host stand-in): atomic hard-link create, and
+    flock around read-compare-write.
+"""
+
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+def shard_of(uri: str, shards: int) -> int:
+    """Stable shard number of an object URI (independent of listing order and process)."""
+    return int.from_bytes(hashlib.sha256(uri.encode("utf-8")).digest()[:8], "big") % max(int(shards), 1)
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# ========= BACKENDS =========
+class LocalLeaseBackend:
+    """Lease records as files in a local directory; the token is a hash of the content."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @staticmethod
+    def _token(data: bytes) -> str:
+        return hashlib.sha1(data).hexdigest()
+
+    def read(self, name: str) -> Optional[Tuple[bytes, str]]:
+        import fcntl
+
+        try:
+            with open(self._path(name), "rb") as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data, self._token(data)
+
+    def create(self, name: str, data: bytes) -> Optional[str]:
+        tmp = self._path(f".{name}.{uuid.uuid4().hex}")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        try:
+            os.link(tmp, self._path(name))   # fails if the record exists; never exposes a half-written file
+        except FileExistsError:
+            return None
+        finally:
+            os.remove(tmp)
+        return self._token(data)
+
+    def replace(self, name: str, data: bytes, token: str) -> Optional[str]:
+        import fcntl
+
+        try:
+            with open(self._path(name), "r+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if self._token(f.read()) != token:
+                    return None
+                f.seek(0)
+                f.truncate()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            return None
+        return self._token(data)
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+def _is_conflict(exc: Exception) -> bool:
+    """Precondition failed (someone else changed the object) or it vanished."""
+    return getattr(exc, "code", None) in (404, 412) or type(exc).__name__ in ("PreconditionFailed", "NotFound")
+
+
+class GcsLeaseBackend:
+    """Lease records as GCS objects; the token is the object generation."""
+
+    def __init__(self, client, root_uri: str):
+        bucket_name, _, prefix = root_uri[len("gs://"):].partition("/")
+        self._bucket = client.bucket(bucket_name)
+        self.prefix = prefix if not prefix or prefix.endswith("/") else prefix + "/"
+
+    def read(self, name: str) -> Optional[Tuple[bytes, str]]:
+        blob = self._bucket.get_blob(self.prefix + name)
+        if blob is None:
+            return None
+        try:
+            data = blob.download_as_bytes(if_generation_match=blob.generation)
+        except Exception as e:
+            if _is_conflict(e):
+                return None
+            raise
+        return data, str(blob.generation)
+
+    def _upload(self, name: str, data: bytes, generation: int) -> Optional[str]:
+        blob = self._bucket.blob(self.prefix + name)
+        try:
+            blob.upload_from_string(data, content_type="application/json", if_generation_match=generation)
+        except Exception as e:
+            if _is_conflict(e):
+                return None
+            raise
+        return str(blob.generation)
+
+    def create(self, name: str, data: bytes) -> Optional[str]:
+        return self._upload(name, data, 0)
+
+    def replace(self, name: str, data: bytes, token: str) -> Optional[str]:
+        return self._upload(name, data, int(token))
+
+    def delete(self, name: str) -> None:
+        blob = self._bucket.blob(self.prefix + name)
+        try:
+            blob.delete()
+        except Exception as e:
+            if not _is_conflict(e):
+                raise
+
+
+# ========= LEASES =========
+class ShardLeases:
+    """Claim, renew, complete and release shard leases for one worker (`owner`)."""
+
+    def __init__(self, backend, shards: int, ttl_seconds: float = 600.0, owner: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.shards = max(int(shards), 1)
+        self.ttl_seconds = float(ttl_seconds)
+        self.owner = owner or default_owner()
+        self._clock = clock
+        self._tokens: Dict[int, str] = {}
+
+    @staticmethod
+    def _name(shard: int) -> str:
+        return f"shard-{shard:04d}.json"
+
+    def _read(self, shard: int) -> Tuple[Optional[Dict], Optional[str]]:
+        found = self.backend.read(self._name(shard))
+        if found is None:
+            return None, None
+        data, token = found
+        try:
+            return json.loads(data.decode("utf-8")), token
+        except ValueError:
+            return {"state": "unreadable"}, token
+
+    def _record(self, shard: int, state: str, attempt: int, **extra) -> bytes:
+        return json.dumps({
+            "shard": shard, "state": state, "owner": self.owner,
+            "expires_at": self._clock() + self.ttl_seconds if state == "leased" else None,
+            "attempt": attempt, "updated": self._clock(), **extra,
+        }).encode("utf-8")
+
+    def claim(self, exclude: Iterable[int] = ()) -> Optional[int]:
+        """Take a free or expired shard (scanning from a random start to spread workers); None if there is none."""
+        skip = set(exclude)
+        start = random.randrange(self.shards)
+        for k in range(self.shards):
+            shard = (start + k) % self.shards
+            if shard in skip:
+                continue
+            record, token = self._read(shard)
+            if record is None:
+                new = self.backend.create(self._name(shard), self._record(shard, "leased", 1))
+            elif record.get("state") == "leased" and (record.get("expires_at") or 0) < self._clock():
+                print(f"[WARN] Lease on shard {shard} held by {record.get('owner')} expired; taking it over")
+                new = self.backend.replace(self._name(shard),
+                                           self._record(shard, "leased", record.get("attempt", 1) + 1), token)
+            else:
+                continue
+            if new is not None:
+                self._tokens[shard] = new
+                return shard
+        return None
+
+    def _update(self, shard: int, state: str, **extra) -> bool:
+        """Compare-and-swap our own record; False if the lease is no longer ours."""
+        token = self._tokens.get(shard)
+        record, current = self._read(shard)
+        if token is None or record is None or current != token or record.get("owner") != self.owner:
+            self._tokens.pop(shard, None)
+            return False
+        new = self.backend.replace(self._name(shard), self._record(shard, state, record.get("attempt", 1), **extra),
+                                   token)
+        if new is None:
+            self._tokens.pop(shard, None)
+            return False
+        self._tokens[shard] = new
+        return True
+
+    def renew(self, shard: int) -> bool:
+        return self._update(shard, "leased")
+
+    def complete(self, shard: int, **info) -> bool:
+        done = self._update(shard, "done", **info)
+        self._tokens.pop(shard, None)
+        return done
+
+    def release(self, shard: int) -> bool:
+        """Give a shard back (e.g. after a failure) so another worker can claim it right away."""
+        token = self._tokens.pop(shard, None)
+        record, current = self._read(shard)
+        if token is None or current != token:
+            return False
+        record = {**record, "expires_at": 0, "updated": self._clock()}
+        return self.backend.replace(self._name(shard), json.dumps(record).encode("utf-8"), token) is not None
+
+    def status(self) -> Dict[int, Dict]:
+        """shard -> its lease record ({"state": "pending"} if never claimed)."""
+        out = {}
+        for shard in range(self.shards):
+            record, _ = self._read(shard)
+            out[shard] = record or {"shard": shard, "state": "pending"}
+        return out
+
+    def all_done(self) -> bool:
+        return all(r.get("state") == "done" for r in self.status().values())
+
+    def clear(self) -> None:
+        for shard in range(self.shards):
+            self.backend.delete(self._name(shard))
+
+
+class LeaseLost(RuntimeError):
+    """The worker no longer holds its shard's lease; it must not write that shard's state."""
+
+
+class LeaseKeeper:
+    """Renews one lease every ttl/3 on a background thread; `lost` is set once a renewal fails."""
+
+    def __init__(self, leases: ShardLeases, shard: int):
+        self.leases = leases
+        self.shard = shard
+        self.lost = threading.Event()
+        # when the lease lapses unless renewed (counted from before each renewal, so never late)
+        self.expires_at = leases._clock() + leases.ttl_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{shard}", daemon=True)
+
+    def renew(self) -> bool:
+        started = self.leases._clock()
+        if not self.leases.renew(self.shard):
+            print(f"[WARN] Lost the lease on shard {self.shard}")
+            self.lost.set()
+            return False
+        self.expires_at = started + self.leases.ttl_seconds
+        return True
+
+    def check(self) -> None:
+        """Raise LeaseLost if a renewal failed or the lease has lapsed (another worker may own the shard)."""
+        if self.lost.is_set():
+            raise LeaseLost(f"Lease on shard {self.shard} was taken over")
+        if self.leases._clock() >= self.expires_at:
+            self.lost.set()
+            raise LeaseLost(f"Lease on shard {self.shard} expired before it could be renewed")
+
+    def _run(self):
+        interval = max(self.leases.ttl_seconds / 3, 1.0)
+        while not self._stop.wait(interval):
+            try:
+                if not self.renew():
+                    return
+            except Exception as e:
+                print(f"[WARN] Could not renew lease on shard {self.shard}: {e}")
+                continue   # transient; the lease is still ours until it expires
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
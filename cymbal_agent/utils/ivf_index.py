@@ -0,0 +1,140 @@
+"""
+Inverted-file (IVF) approximate search for the local vector index.
+
+The unit vectors of an index version are clustered with spherical k-means
+into `nlist` lists. A query is compared with the centroids, and only the rows
+of the `nprobe` closest lists are scored: more lists probed means higher
+recall and more latency.
+
+Files in a version directory:
+  ivf.json           -> {"nlist", "dim", "count", "trained_count"}
+  ivf.centroids.f32  -> nlist x dim float32 unit centroids
+  ivf.labels.i32     -> list number of every row (int32, row order)
+
+Incremental updates keep the centroids: surviving rows carry their label over
+and new rows are assigned to their nearest centroid, so an update never
+re-clusters. Training is repeated only when the index has grown past
+`retrain_growth` times the size the centroids were trained on.
+"""
+
+import json
+import os
+import uuid
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+ASSIGN_BLOCK_ROWS = 16384
+
+
+class IvfConfig(NamedTuple):
+    nlist: int = 0                # 0 = about 4 * sqrt(count)
+    nprobe: int = 16              # lists scored per query
+    train_sample: int = 100000    # rows sampled for k-means
+    iters: int = 10
+    retrain_growth: float = 2.0
+
+
+def auto_nlist(count: int) -> int:
+    return int(max(1, min(count, round(4 * np.sqrt(count)))))
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest (highest dot product) centroid of every row, computed blockwise."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, config: IvfConfig, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a row sample of `vectors` (count x dim, unit rows)."""
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    nlist = max(1, min(nlist, count))
+    sample_rows = np.sort(rng.choice(count, size=min(count, max(config.train_sample, nlist)), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(config.iters):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        sizes = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        sums = np.zeros_like(centroids)
+        filled = sizes > 0
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        empty = np.flatnonzero(sizes == 0)
+        if len(empty):
+            # re-seed empty lists with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+        centroids = _unit(sums)
+    return centroids.astype(np.float32)
+
+
+class IvfLists:
+    """Centroids plus the rows of every list (ascending row order inside a list)."""
+
+    def __init__(self, centroids: np.ndarray, labels: np.ndarray, trained_count: int):
+        self.centroids = centroids
+        self.labels = labels
+        self.trained_count = trained_count
+        self.nlist = len(centroids)
+        self.rows = np.argsort(labels, kind="stable").astype(np.int64)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=self.nlist), out=self.offsets[1:])
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers in the `nprobe` lists closest to one unit query, sorted."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        scores = self.centroids @ query
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        parts = [self.rows[self.offsets[c]:self.offsets[c + 1]] for c in lists]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+
+def write_ivf(version_dir: str, centroids: np.ndarray, labels: np.ndarray, trained_count: int) -> None:
+    tmp = os.path.join(version_dir, f"ivf.{uuid.uuid4().hex}")
+    np.ascontiguousarray(centroids, dtype=np.float32).tofile(tmp + ".c")
+    os.replace(tmp + ".c", os.path.join(version_dir, "ivf.centroids.f32"))
+    np.ascontiguousarray(labels, dtype=np.int32).tofile(tmp + ".l")
+    os.replace(tmp + ".l", os.path.join(version_dir, "ivf.labels.i32"))
+    with open(tmp + ".json", "w", encoding="utf-8") as f:
+        json.dump({"nlist": int(len(centroids)), "dim": int(centroids.shape[1]), "count": int(len(labels)),
+                   "trained_count": int(trained_count)}, f)
+    os.replace(tmp + ".json", os.path.join(version_dir, "ivf.json"))   # written last: marks the lists complete
+
+
+def load_ivf(version_dir: str) -> Optional[IvfLists]:
+    try:
+        with open(os.path.join(version_dir, "ivf.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    centroids = np.fromfile(os.path.join(version_dir, "ivf.centroids.f32"), dtype=np.float32)
+    centroids = centroids.reshape(int(meta["nlist"]), int(meta["dim"]))
+    labels = np.fromfile(os.path.join(version_dir, "ivf.labels.i32"), dtype=np.int32)
+    if len(labels) != int(meta["count"]):
+        return None
+    return IvfLists(centroids, labels, int(meta.get("trained_count", len(labels))))
+
+
+def build_ivf(version_dir: str, vectors: np.ndarray, config: IvfConfig) -> IvfLists:
+    """Train centroids on `vectors`, assign every row and persist the lists."""
+    count = len(vectors)
+    centroids = train_centroids(vectors, config.nlist or auto_nlist(count), config)
+    labels = assign(vectors, centroids)
+    write_ivf(version_dir, centroids, labels, count)
+    return IvfLists(centroids, labels, count)
+
+
+def needs_retrain(ivf: IvfLists, count: int, config: IvfConfig) -> bool:
+    if config.nlist and config.nlist != ivf.nlist:
+        return True
+    return count > ivf.trained_count * config.retrain_growth
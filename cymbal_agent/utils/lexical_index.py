@@ -0,0 +1,189 @@
+"""
+In-memory BM25 index over chunk texts.
+
+Postings are stored CSR-style in typed arrays rather than per-term Python
+lists: for term t, documents are `docs[offsets[t]:offsets[t + 1]]` (uint32
+row numbers, ascending) and `tfs[...]` the matching term frequencies (uint16).
+That keeps a corpus of a few million postings in tens of MB.
+
+    index = LexicalIndex.build((id, text) for ...)
+    index.search("HS code", k=5)         -> [LexicalHit(id, score), ...]
+    index.is_confident("HS code", hits)  -> True when the top hit is a clear lexical match
+
+The serialized form is one blob (header JSON + raw arrays) so it can live in
+GCS next to the other index artifacts.
+"""
+
+import json
+import math
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FORMAT_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it of on or the this to was what when where which who why with".split()
+)
+
+
+class LexicalHit(NamedTuple):
+    id: str
+    score: float
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, ids: List[str], doc_len: array, vocab: Dict[str, int], offsets: array,
+                 docs: array, tfs: array, texts: Optional[List[str]] = None):
+        self.ids = ids
+        self.doc_len = doc_len
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.texts = texts
+        self._row_of: Optional[Dict[str, int]] = None
+        self.avgdl = (sum(doc_len) / len(doc_len)) if len(doc_len) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---- build ----
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[str, str]], keep_texts: bool = False) -> "LexicalIndex":
+        """rows: (id, text). With `keep_texts`, texts are kept so hits can be served without another store."""
+        ids: List[str] = []
+        texts: Optional[List[str]] = [] if keep_texts else None
+        doc_len = array("I")
+        vocab: Dict[str, int] = {}
+        term_docs: List[array] = []
+        term_tfs: List[array] = []
+        for cid, text in rows:
+            row = len(ids)
+            ids.append(cid)
+            if texts is not None:
+                texts.append(text)
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            doc_len.append(len(tokens))
+            for tok, tf in counts.items():
+                tid = vocab.get(tok)
+                if tid is None:
+                    tid = vocab[tok] = len(term_docs)
+                    term_docs.append(array("I"))
+                    term_tfs.append(array("H"))
+                term_docs[tid].append(row)
+                term_tfs[tid].append(min(tf, 0xFFFF))
+
+        offsets = array("Q", [0])
+        docs, tfs = array("I"), array("H")
+        for d, f in zip(term_docs, term_tfs):
+            docs.extend(d)
+            tfs.extend(f)
+            offsets.append(len(docs))
+        return cls(ids, doc_len, vocab, offsets, docs, tfs, texts)
+
+    # ---- query ----
+    def _idf(self, df: int) -> float:
+        n = len(self.ids)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int) -> List[LexicalHit]:
+        scores: Dict[int, float] = {}
+        for tok in set(tokenize(query)):
+            tid = self.vocab.get(tok)
+            if tid is None:
+                continue
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            idf = self._idf(end - start)
+            for j in range(start, end):
+                row, tf = self.docs[j], self.tfs[j]
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_len[row] / (self.avgdl or 1.0))
+                scores[row] = scores.get(row, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        top = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+        return [LexicalHit(self.ids[row], score) for row, score in top]
+
+    def is_confident(self, query: str, hits: List[LexicalHit], min_score: float = 0.6, max_terms: int = 4) -> bool:
+        """
+        True when a short query is answered lexically: the top hit contains
+        every query term and scores at least `min_score` of what one occurrence
+        of each term in an average-length chunk would score (the sum of idfs).
+        """
+        terms = set(tokenize(query))
+        if not hits or not terms or len(terms) > max_terms:
+            return False
+        top_row = self._row(hits[0].id)
+        reference = 0.0
+        for tok in terms:
+            tid = self.vocab.get(tok)
+            if tid is None:
+                return False
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            pos = bisect_left(self.docs, top_row, start, end)
+            if pos == end or self.docs[pos] != top_row:
+                return False
+            reference += self._idf(end - start)
+        return reference > 0 and hits[0].score / reference >= min_score
+
+    def _row(self, cid: str) -> Optional[int]:
+        if self._row_of is None:
+            self._row_of = {c: i for i, c in enumerate(self.ids)}
+        return self._row_of.get(cid)
+
+    def text_of(self, cid: str) -> str:
+        if self.texts is None:
+            return ""
+        row = self._row(cid)
+        return self.texts[row] if row is not None else ""
+
+    # ---- (de)serialization ----
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "ids": self.ids,
+            "terms": sorted(self.vocab, key=self.vocab.get),
+            "texts": self.texts,
+            "sizes": [len(self.doc_len), len(self.offsets), len(self.docs), len(self.tfs)],
+        }, ensure_ascii=False).encode("utf-8")
+        return b"".join([
+            struct.pack("<Q", len(header)), header,
+            self.doc_len.tobytes(), self.offsets.tobytes(), self.docs.tobytes(), self.tfs.tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "LexicalIndex":
+        (hlen,) = struct.unpack_from("<Q", raw, 0)
+        header = json.loads(raw[8:8 + hlen].decode("utf-8"))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported lexical index version {header.get('version')}")
+        pos = 8 + hlen
+        arrays = []
+        for typecode, size in zip(("I", "Q", "I", "H"), header["sizes"]):
+            arr = array(typecode)
+            nbytes = size * arr.itemsize
+            arr.frombytes(raw[pos:pos + nbytes])
+            pos += nbytes
+            arrays.append(arr)
+        doc_len, offsets, docs, tfs = arrays
+        vocab = {t: i for i, t in enumerate(header["terms"])}
+        return cls(header["ids"], doc_len, vocab, offsets, docs, tfs, header.get("texts"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked ID lists: score(id) = sum 1 / (k + rank). Best first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, 1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,549 @@
+"""
+In-process vector index backed by memory-mapped files.
+
+Layout of an index directory:
+  CURRENT                  -> name of the active version directory (swapped atomically)
+  v-<version>/meta.json    -> {"dim", "count", "version"}
+  v-<version>/vectors.f32  -> row-major float32 matrix (count x dim), L2-normalized
+  v-<version>/ids.bin/.off -> datapoint IDs (utf-8 blob + uint64 offsets)
+  v-<version>/texts.bin/.off -> chunk texts (utf-8 blob + uint64 offsets)
+  v-<version>/coarse-*     -> optional compressed codes, built on first use (see vector_compression)
+  v-<version>/ivf.*        -> optional IVF lists for approximate search (see ivf_index)
+
+Every file is opened with np.memmap in read-only mode, so all worker processes
+on an instance share the same pages through the OS page cache instead of each
+holding its own copy of the matrix.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import uuid
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .ivf_index import IvfConfig, IvfLists, assign, build_ivf, load_ivf, needs_retrain, write_ivf
+from .vector_compression import CoarseCodes, CompressionConfig, open_codes
+
+# Rows scored per matmul block; bounds the temporary score buffer for big corpora.
+SEARCH_BLOCK_ROWS = 65536
+# How many old version directories to keep around for readers still using them.
+KEEP_VERSIONS = 2
+
+
+class Neighbor(NamedTuple):
+    """One search hit. `score` is a similarity: higher means closer. `vector` only when requested."""
+    id: str
+    score: float
+    text: str
+    vector: Optional[Sequence[float]] = None
+
+
+# ========= STRING TABLES =========
+class _StringWriter:
+    """
+    Streams strings to <base>.bin and writes their offsets to <base>.off on
+    sync/close. With `resume_rows`, reopens an existing pair truncated to the
+    first `resume_rows` strings of the last sync.
+    """
+
+    def __init__(self, base_path: str, resume_rows: Optional[int] = None):
+        self._base = base_path
+        if resume_rows is None:
+            self._f = open(base_path + ".bin", "wb")
+            self._offsets = array("Q", [0])
+            return
+        self._offsets = array("Q")
+        with open(base_path + ".off", "rb") as f:
+            self._offsets.frombytes(f.read())
+        del self._offsets[resume_rows + 1:]
+        self._f = open(base_path + ".bin", "r+b")
+        self._f.truncate(self._offsets[-1])
+        self._f.seek(0, os.SEEK_END)
+
+    def write(self, value: str) -> None:
+        raw = value.encode("utf-8")
+        self._f.write(raw)
+        self._offsets.append(self._offsets[-1] + len(raw))
+
+    def sync(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        tmp = self._base + ".off.tmp"
+        with open(tmp, "wb") as f:
+            self._offsets.tofile(f)
+        os.replace(tmp, self._base + ".off")
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self._f.close()
+        with open(self._base + ".off", "wb") as f:
+            self._offsets.tofile(f)
+
+
+def _write_strings(base_path: str, values: Iterable[str]) -> None:
+    writer = _StringWriter(base_path)
+    for v in values:
+        writer.write(v)
+    writer.close()
+
+
+class _StringTable:
+    """Read-only, memory-mapped list of utf-8 strings."""
+
+    def __init__(self, base_path: str):
+        self._off = np.memmap(base_path + ".off", dtype=np.uint64, mode="r")
+        size = int(self._off[-1]) if len(self._off) else 0
+        # np.memmap cannot map an empty file
+        self._blob = np.memmap(base_path + ".bin", dtype=np.uint8, mode="r") if size else None
+
+    def __len__(self) -> int:
+        return max(len(self._off) - 1, 0)
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self._off[i]), int(self._off[i + 1])
+        if self._blob is None or start == end:
+            return ""
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# ========= INDEX =========
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class LocalVectorIndex:
+    """
+    Read-only view over one version of an on-disk index.
+
+    With a `compression` config, searches first scan the compressed codes for
+    `k * rescore` candidates and then rescore only those rows exactly, so the
+    hot working set is the (much smaller) code matrix instead of vectors.f32.
+    With an `ann` config, only the rows of the `nprobe` closest IVF lists are
+    considered (approximate; both stages combine).
+    """
+
+    def __init__(self, version_dir: str, compression: Optional[CompressionConfig] = None,
+                 ann: Optional[IvfConfig] = None):
+        with open(os.path.join(version_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = version_dir
+        self.dim = int(meta["dim"])
+        self.count = int(meta["count"])
+        self.version = meta.get("version", "")
+        if self.count:
+            self.vectors = np.memmap(
+                os.path.join(version_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                shape=(self.count, self.dim),
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.ids = _StringTable(os.path.join(version_dir, "ids"))
+        self.texts = _StringTable(os.path.join(version_dir, "texts"))
+        self.compression = compression
+        self._coarse: Optional[CoarseCodes] = None
+        self._coarse_lock = threading.Lock()
+        self.ann = ann
+        self._ivf: Optional[IvfLists] = None
+
+    def coarse_codes(self) -> Optional[CoarseCodes]:
+        """The compressed codes for this version (built and cached on first call), or None."""
+        if self.compression is None or self.count == 0:
+            return None
+        with self._coarse_lock:
+            if self._coarse is None:
+                t0 = time.monotonic()
+                self._coarse = open_codes(self.path, self.vectors, self.compression)
+                print(f"[INFO] Coarse {self.compression.mode} codes ready for {self.count} rows "
+                      f"({self._coarse.nbytes} bytes, {time.monotonic() - t0:.2f}s)")
+            return self._coarse
+
+    def ivf_lists(self) -> Optional[IvfLists]:
+        """The IVF lists of this version (built here if the writer did not), or None without `ann`."""
+        if self.ann is None or self.count == 0:
+            return None
+        with self._coarse_lock:
+            if self._ivf is None:
+                self._ivf = load_ivf(self.path)
+                if self._ivf is None:
+                    t0 = time.monotonic()
+                    self._ivf = build_ivf(self.path, self.vectors, self.ann)
+                    print(f"[INFO] Built IVF lists ({self._ivf.nlist}) for {self.count} rows "
+                          f"in {time.monotonic() - t0:.2f}s")
+            return self._ivf
+
+    def _prepare_queries(self, queries) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Query dim {q.shape[1]} does not match index dim {self.dim}")
+        return _normalize_rows(q)
+
+    def search(self, query_vector: Sequence[float], k: int, with_vectors: bool = False) -> List[Neighbor]:
+        """Exact top-k by cosine similarity."""
+        return self.search_many([query_vector], k, with_vectors=with_vectors)[0]
+
+    def search_many(self, query_vectors, k: int, with_vectors: bool = False) -> List[List[Neighbor]]:
+        """Exact top-k for several queries in one pass over the matrix (optionally with the stored unit vectors)."""
+        q = self._prepare_queries(query_vectors)
+        if self.count == 0 or k <= 0:
+            return [[] for _ in range(len(q))]
+        k = min(k, self.count)
+        coarse = self.coarse_codes()
+        ivf = self.ivf_lists()
+        if ivf is not None and ivf.nlist > 1:
+            return [self._search_ivf(ivf, coarse, qv, k, with_vectors) for qv in q]
+        if coarse is not None and k * self.compression.rescore < self.count:
+            best_rows = coarse.candidates(q, k * self.compression.rescore)
+            return [self._rescore(qv, rows, k, with_vectors) for qv, rows in zip(q, best_rows)]
+
+        best_scores = np.full((len(q), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(q), 0), dtype=np.int64)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores = q @ block.T                                  # (nq, rows)
+            kk = min(k, scores.shape[1])
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        out = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            out.append([
+                Neighbor(self.ids[int(rows[j])], float(scores[j]), self.texts[int(rows[j])],
+                         self.vectors[int(rows[j])] if with_vectors else None)
+                for j in order
+            ])
+        return out
+
+    def _search_ivf(self, ivf: IvfLists, coarse: Optional[CoarseCodes], q: np.ndarray, k: int,
+                    with_vectors: bool) -> List[Neighbor]:
+        nprobe = self.ann.nprobe
+        rows = ivf.probe(q, nprobe)
+        while len(rows) < k and nprobe < ivf.nlist:
+            nprobe *= 2
+            rows = ivf.probe(q, nprobe)
+        if coarse is not None:
+            rows = np.sort(coarse.candidates_in(q, rows, k * self.compression.rescore))
+        return self._rescore(q, rows, k, with_vectors)
+
+    def _rescore(self, q: np.ndarray, rows: np.ndarray, k: int, with_vectors: bool) -> List[Neighbor]:
+        """Exact cosine over the candidate rows only (read in row order to keep page access sequential)."""
+        rows = np.sort(rows)
+        vecs = np.asarray(self.vectors[rows])
+        scores = vecs @ q
+        order = np.argsort(-scores)[:k]
+        return [
+            Neighbor(self.ids[int(rows[j])], float(scores[j]), self.texts[int(rows[j])],
+                     vecs[j] if with_vectors else None)
+            for j in order
+        ]
+
+
+# ========= BUILD / UPDATE =========
+def _current_version_dir(index_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(index_dir, name)
+    return path if os.path.isdir(path) else None
+
+
+def _new_version_dir(index_dir: str):
+    os.makedirs(index_dir, exist_ok=True)
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    vdir = os.path.join(index_dir, f"v-{version}")
+    os.makedirs(vdir)
+    return version, vdir
+
+
+def _publish(index_dir: str, version: str, vdir: str, dim: int, count: int) -> str:
+    with open(os.path.join(vdir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dim": dim, "count": count, "version": version}, f)
+
+    tmp = os.path.join(index_dir, f"CURRENT.{uuid.uuid4().hex}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"v-{version}")
+    os.replace(tmp, os.path.join(index_dir, "CURRENT"))
+
+    _prune_versions(index_dir, keep=f"v-{version}")
+    return version
+
+
+def write_index(index_dir: str, ids: List[str], texts: List[str], vectors,
+                ann: Optional[IvfConfig] = None) -> str:
+    """Write a new index version (with IVF lists when `ann` is given) and atomically point CURRENT at it."""
+    mat = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+    if len(ids) != len(texts):
+        raise ValueError("ids and texts must have the same length")
+    mat = _normalize_rows(mat) if len(ids) else mat
+
+    version, vdir = _new_version_dir(index_dir)
+    mat.tofile(os.path.join(vdir, "vectors.f32"))
+    _write_strings(os.path.join(vdir, "ids"), ids)
+    _write_strings(os.path.join(vdir, "texts"), texts)
+    if ann is not None and len(ids):
+        build_ivf(vdir, mat, ann)
+    return _publish(index_dir, version, vdir, int(mat.shape[1]) if mat.ndim == 2 else 0, len(ids))
+
+
+def _prune_versions(index_dir: str, keep: str) -> None:
+    versions = sorted(
+        (d for d in os.listdir(index_dir) if d.startswith("v-") and d != keep),
+        key=lambda d: os.path.getmtime(os.path.join(index_dir, d)),
+    )
+    for d in versions[:max(len(versions) - (KEEP_VERSIONS - 1), 0)]:
+        shutil.rmtree(os.path.join(index_dir, d), ignore_errors=True)
+
+
+class IndexUpdate:
+    """
+    Incremental update that stages new rows on disk, so callers can feed it
+    batch by batch without holding the corpus in memory. `commit()` streams
+    the current rows (minus replaced/deleted IDs) plus the staged rows into a
+    new version and publishes it.
+
+    A `durable` update stages into a fixed directory and can `sync()` its
+    state; a later durable update on the same index picks the staged rows up
+    again, so an interrupted build loses nothing it had synced.
+
+    With `ann`, the new version gets IVF lists: surviving rows keep their list
+    and new rows are assigned to the existing centroids, unless the index grew
+    enough to retrain them.
+
+    A commit rewrites every row of the index, so it costs O(corpus) whatever
+    the size of the change: stage a whole run's adds and deletes in one update
+    and commit once rather than committing per batch.
+    """
+
+    def __init__(self, index_dir: str, durable: bool = False, ann: Optional[IvfConfig] = None):
+        self.index_dir = index_dir
+        self.durable = durable
+        self.ann = ann
+        os.makedirs(index_dir, exist_ok=True)
+        name = ".staging-pending" if durable else f".staging-{uuid.uuid4().hex}"
+        self._staging = os.path.join(index_dir, name)
+        self._last_row: Dict[str, int] = {}   # staged id -> its latest staged row
+        self._delete = set()
+        self._rows = 0
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+
+        state_path = os.path.join(self._staging, "state.json")
+        if durable and os.path.exists(state_path):
+            self._resume(state_path)
+            return
+        shutil.rmtree(self._staging, ignore_errors=True)
+        os.makedirs(self._staging)
+        self._vec_f = open(os.path.join(self._staging, "vectors.f32"), "wb")
+        self._ids = _StringWriter(os.path.join(self._staging, "ids"))
+        self._texts = _StringWriter(os.path.join(self._staging, "texts"))
+
+    def _resume(self, state_path: str) -> None:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self._rows = int(state["rows"])
+        self.dim = state.get("dim")
+        vec_path = os.path.join(self._staging, "vectors.f32")
+        self._vec_f = open(vec_path, "r+b")
+        self._vec_f.truncate(self._rows * (self.dim or 0) * 4)
+        self._vec_f.seek(0, os.SEEK_END)
+        self._ids = _StringWriter(os.path.join(self._staging, "ids"), resume_rows=self._rows)
+        self._texts = _StringWriter(os.path.join(self._staging, "texts"), resume_rows=self._rows)
+        staged_ids = _StringTable(os.path.join(self._staging, "ids"))
+        for r in range(self._rows):
+            self._last_row[staged_ids[r]] = r
+        self._delete = set(state.get("delete", []))
+        for cid in self._delete:
+            self._last_row.pop(cid, None)
+        print(f"[INFO] Resumed {len(self._last_row)} staged rows for local index {self.index_dir}")
+
+    def sync(self) -> None:
+        """Make everything added/deleted so far survive a crash (durable updates only)."""
+        with self._lock:
+            self._vec_f.flush()
+            os.fsync(self._vec_f.fileno())
+            self._ids.sync()
+            self._texts.sync()
+            tmp = os.path.join(self._staging, "state.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"rows": self._rows, "dim": self.dim, "delete": sorted(self._delete)}, f)
+            os.replace(tmp, os.path.join(self._staging, "state.json"))
+
+    def close(self) -> None:
+        """Stop without publishing; a durable update keeps its synced staging for the next run."""
+        if self.durable:
+            self.sync()
+            self._vec_f.close()
+            self._ids.close()
+            self._texts.close()
+        else:
+            self.abort()
+
+    def add(self, ids: List[str], texts: List[str], vectors) -> None:
+        if not ids:
+            return
+        mat = _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(mat.shape[1])
+            elif mat.shape[1] != self.dim:
+                raise ValueError(f"Vector dim {mat.shape[1]} does not match staged dim {self.dim}")
+            self._vec_f.write(np.ascontiguousarray(mat).tobytes())
+            for cid, text in zip(ids, texts):
+                self._ids.write(cid)
+                self._texts.write(text)
+                self._last_row[cid] = self._rows
+                self._delete.discard(cid)
+                self._rows += 1
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for cid in ids:
+                self._delete.add(cid)
+                self._last_row.pop(cid, None)
+
+    def abort(self) -> None:
+        """Discard everything staged."""
+        self._vec_f.close()
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+    def _write_ivf(self, vdir: str, dim: int, count: int, old_ivf: Optional[IvfLists],
+                   labels: List[np.ndarray]) -> None:
+        if old_ivf is not None and not needs_retrain(old_ivf, count, self.ann):
+            write_ivf(vdir, old_ivf.centroids, np.concatenate(labels), old_ivf.trained_count)
+            return
+        t0 = time.monotonic()
+        vectors = np.memmap(os.path.join(vdir, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+        ivf = build_ivf(vdir, vectors, self.ann)
+        print(f"[INFO] Trained IVF lists ({ivf.nlist}) for {count} rows in {time.monotonic() - t0:.2f}s")
+
+    def commit(self) -> Optional[str]:
+        """Publish the merged index; returns the new version, or None if nothing changed."""
+        self._vec_f.close()
+        self._ids.close()
+        self._texts.close()
+        try:
+            if not self._last_row and not self._delete:
+                return None
+            current = _current_version_dir(self.index_dir)
+            old = LocalVectorIndex(current) if current else None
+            if old is None and not self._last_row:
+                return None
+            dim = self.dim if self.dim is not None else old.dim
+            if old is not None and old.count and old.dim != dim:
+                raise ValueError(f"Staged dim {dim} does not match index dim {old.dim}")
+
+            old_ivf = load_ivf(old.path) if self.ann is not None and old is not None else None
+            labels: List[np.ndarray] = []
+
+            version, vdir = _new_version_dir(self.index_dir)
+            ids_out = _StringWriter(os.path.join(vdir, "ids"))
+            texts_out = _StringWriter(os.path.join(vdir, "texts"))
+            count = 0
+            with open(os.path.join(vdir, "vectors.f32"), "wb") as vec_out:
+                if old is not None:
+                    for start in range(0, old.count, SEARCH_BLOCK_ROWS):
+                        stop = min(start + SEARCH_BLOCK_ROWS, old.count)
+                        keep = [r for r in range(start, stop)
+                                if old.ids[r] not in self._last_row and old.ids[r] not in self._delete]
+                        if keep:
+                            vec_out.write(np.ascontiguousarray(old.vectors[keep]).tobytes())
+                            if old_ivf is not None:
+                                labels.append(old_ivf.labels[keep])
+                        for r in keep:
+                            ids_out.write(old.ids[r])
+                            texts_out.write(old.texts[r])
+                        count += len(keep)
+
+                if self._rows:
+                    staged = np.memmap(os.path.join(self._staging, "vectors.f32"), dtype=np.float32,
+                                       mode="r", shape=(self._rows, dim))
+                    staged_ids = _StringTable(os.path.join(self._staging, "ids"))
+                    staged_texts = _StringTable(os.path.join(self._staging, "texts"))
+                    for start in range(0, self._rows, SEARCH_BLOCK_ROWS):
+                        stop = min(start + SEARCH_BLOCK_ROWS, self._rows)
+                        keep = [r for r in range(start, stop) if self._last_row.get(staged_ids[r]) == r]
+                        if keep:
+                            vec_out.write(np.ascontiguousarray(staged[keep]).tobytes())
+                            if old_ivf is not None:
+                                labels.append(assign(staged[keep], old_ivf.centroids))
+                        for r in keep:
+                            ids_out.write(staged_ids[r])
+                            texts_out.write(staged_texts[r])
+                        count += len(keep)
+            ids_out.close()
+            texts_out.close()
+            if self.ann is not None and count:
+                self._write_ivf(vdir, dim, count, old_ivf, labels)
+            return _publish(self.index_dir, version, vdir, dim, count)
+        finally:
+            shutil.rmtree(self._staging, ignore_errors=True)
+
+
+def upsert(index_dir: str, ids: List[str], texts: List[str], vectors, delete_ids: Iterable[str] = (),
+           ann: Optional[IvfConfig] = None) -> Optional[str]:
+    """
+    Merge new rows into the existing index (same-ID rows are replaced) and
+    drop `delete_ids`, then publish the result as a new version.
+    Returns None when there is nothing to write.
+
+    Each call is a full IndexUpdate commit (O(corpus)); callers applying
+    several batches should feed one IndexUpdate and commit it once.
+    """
+    update = IndexUpdate(index_dir, ann=ann)
+    try:
+        update.delete(delete_ids)
+        update.add(list(ids), list(texts), vectors)
+    except BaseException:
+        update.abort()
+        raise
+    return update.commit()
+
+
+# ========= PROCESS-WIDE HANDLE =========
+_open_lock = threading.Lock()
+_open_indexes: Dict[str, Dict] = {}
+
+
+def open_index(index_dir: str, reload_seconds: float = 30.0,
+               compression: Optional[CompressionConfig] = None, ann: Optional[IvfConfig] = None) -> LocalVectorIndex:
+    """
+    Return the active index for `index_dir`, re-reading CURRENT at most every
+    `reload_seconds` so a rebuild is picked up without restarting the process.
+    `compression` and `ann` enable the coarse-to-fine and IVF searches on the returned index.
+    """
+    now = time.monotonic()
+    with _open_lock:
+        entry = _open_indexes.get(index_dir)
+        if entry and now - entry["checked"] < reload_seconds:
+            return entry["index"]
+
+        current = _current_version_dir(index_dir)
+        if current is None:
+            raise FileNotFoundError(f"No local vector index found in {index_dir}")
+        index = entry["index"] if entry else None
+        if index is None or index.path != current or index.compression != compression or index.ann != ann:
+            entry = {"index": LocalVectorIndex(current, compression=compression, ann=ann)}
+        entry["checked"] = now
+        _open_indexes[index_dir] = entry
+        return entry["index"]
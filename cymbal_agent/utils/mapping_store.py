@@ -0,0 +1,352 @@
+"""
+Datapoint mapping stores (datapoint id -> {"source", "chunk_index", "text"}).
+
+SegmentedMappingStore keeps the mapping as append-only, gzip-compressed JSONL
+segments under a root (a gs:// prefix or a local directory):
+
+  <root>/index.json              -> {"version", "generation", "next_seq", "segments": [...]}
+  <root>/seg-000001.jsonl.gz     -> one entry per line: {"id", "source", "chunk_index", "text"}
+                                    or a tombstone {"id", "deleted": true}
+  <root>/seg-000001.ids.gz       -> the segment's IDs, sorted, one per line ("!" prefix = tombstone)
+  <root>/seg-000001.bloom        -> bloom filter of the segment's IDs (~10 bits per ID)
+
+A run only appends a segment with the entries it changed and then rewrites the
+small index.json, so saving is O(changes). A lookup checks the segments'
+bloom filters newest first and only opens the sorted ID file (bisect) of a
+segment whose filter matches, then decodes just the segments that hold the
+requested IDs; nothing is loaded per corpus entry. Segments written before
+bloom filters existed get one built in memory the first time their IDs are
+read. `compact()` folds all segments into a few, dropping superseded entries
+and tombstones.
+
+JsonMappingStore wraps the original single JSON document behind the same
+interface for mapping URIs that end in .json.
+"""
+
+import gzip
+import hashlib
+import json
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+INDEX_VERSION = 1
+
+ReadBytes = Callable[[str], Optional[bytes]]
+WriteBytes = Callable[..., None]
+DeleteUri = Callable[[str], None]
+
+
+class _IdFilter:
+    """Bloom filter over datapoint IDs (~1% false positives at 10 bits per ID, 7 probes)."""
+
+    _HEADER = struct.Struct("<IB")
+
+    def __init__(self, bits: int, hashes: int = 7, data: Optional[bytearray] = None):
+        self.bits = max(int(bits), 8)
+        self.hashes = hashes
+        self.data = data if data is not None else bytearray((self.bits + 7) // 8)
+
+    @classmethod
+    def build(cls, ids: List[str], bits_per_id: int = 10) -> "_IdFilter":
+        f = cls(len(ids) * bits_per_id)
+        for cid in ids:
+            for pos in f._positions(cls.key(cid)):
+                f.data[pos >> 3] |= 1 << (pos & 7)
+        return f
+
+    @staticmethod
+    def key(cid: str) -> Tuple[int, int]:
+        """The ID's two base hashes; computed once and probed against any number of filters."""
+        digest = hashlib.blake2b(cid.encode("utf-8"), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def _positions(self, key: Tuple[int, int]) -> Iterator[int]:
+        h1, h2 = key
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def might_contain(self, key: Tuple[int, int]) -> bool:
+        return all(self.data[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_bytes(self) -> bytes:
+        return self._HEADER.pack(self.bits, self.hashes) + bytes(self.data)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "_IdFilter":
+        bits, hashes = cls._HEADER.unpack_from(raw)
+        return cls(bits, hashes, bytearray(raw[cls._HEADER.size:]))
+
+
+class SegmentedMappingStore:
+    def __init__(self, root: str, read_bytes: ReadBytes, write_bytes: WriteBytes, delete_uri: DeleteUri,
+                 segment_max_entries: int = 50000, cached_segments: int = 4):
+        self.root = root if root.endswith("/") else root + "/"
+        self._read = read_bytes
+        self._write = write_bytes
+        self._delete = delete_uri
+        self.segment_max_entries = segment_max_entries
+        raw = self._read(self._uri("index.json"))
+        self._index = json.loads(raw.decode("utf-8")) if raw else {
+            "version": INDEX_VERSION, "generation": 0, "next_seq": 1, "segments": [],
+        }
+        self._pending: "OrderedDict[str, Optional[Dict]]" = OrderedDict()  # id -> entry, None = delete
+        self._filters: Dict[str, _IdFilter] = {}   # segment name -> bloom filter of its IDs
+        self._ids_cache: "OrderedDict[str, Tuple[List[str], List[bool]]]" = OrderedDict()  # sorted ids, live flags
+        self._segment_cache: "OrderedDict[str, Dict[str, Dict]]" = OrderedDict()
+        self._cached_segments = cached_segments
+
+    def _uri(self, name: str) -> str:
+        return self.root + name
+
+    # ---- segment IO ----
+    def _read_segment(self, name: str) -> Dict[str, Optional[Dict]]:
+        if name in self._segment_cache:
+            self._segment_cache.move_to_end(name)
+            return self._segment_cache[name]
+        raw = self._read(self._uri(name))
+        entries: Dict[str, Optional[Dict]] = {}
+        for line in gzip.decompress(raw).decode("utf-8").splitlines():
+            if line:
+                row = json.loads(line)
+                cid = row.pop("id")
+                entries[cid] = None if row.get("deleted") else row
+        self._segment_cache[name] = entries
+        while len(self._segment_cache) > self._cached_segments:
+            self._segment_cache.popitem(last=False)
+        return entries
+
+    def _read_segment_ids(self, seg: Dict) -> Tuple[List[str], List[bool]]:
+        """The segment's IDs in sorted order and whether each is live (False = tombstone)."""
+        name = seg["name"]
+        if name in self._ids_cache:
+            self._ids_cache.move_to_end(name)
+            return self._ids_cache[name]
+        raw = self._read(self._uri(seg["ids"]))
+        rows = []
+        for line in gzip.decompress(raw).decode("utf-8").splitlines():
+            if line:
+                rows.append((line[1:], False) if line.startswith("!") else (line, True))
+        if "bloom" not in seg:
+            rows.sort()   # written before ID files were sorted
+        ids, live = [cid for cid, _ in rows], [flag for _, flag in rows]
+        self._filters.setdefault(name, _IdFilter.build(ids))
+        return self._cache_ids(name, ids, live)
+
+    def _cache_ids(self, name: str, ids: List[str], live: List[bool]) -> Tuple[List[str], List[bool]]:
+        self._ids_cache[name] = (ids, live)
+        while len(self._ids_cache) > self._cached_segments:
+            self._ids_cache.popitem(last=False)
+        return ids, live
+
+    def _filter(self, seg: Dict) -> Optional[_IdFilter]:
+        """The segment's bloom filter; None if it has none yet (the caller reads its IDs instead)."""
+        name = seg["name"]
+        if name not in self._filters and "bloom" in seg:
+            raw = self._read(self._uri(seg["bloom"]))
+            if raw:
+                self._filters[name] = _IdFilter.from_bytes(raw)
+        return self._filters.get(name)
+
+    def _write_segment(self, rows: List[Tuple[str, Optional[Dict]]]) -> Dict:
+        seq = self._index["next_seq"]
+        self._index["next_seq"] = seq + 1
+        name, ids_name, bloom_name = f"seg-{seq:06d}.jsonl.gz", f"seg-{seq:06d}.ids.gz", f"seg-{seq:06d}.bloom"
+        lines = []
+        for cid, entry in rows:
+            if entry is None:
+                lines.append(json.dumps({"id": cid, "deleted": True}, ensure_ascii=False))
+            else:
+                lines.append(json.dumps({"id": cid, **entry}, ensure_ascii=False))
+        ids = sorted(cid for cid, _ in rows)
+        deleted = {cid for cid, entry in rows if entry is None}
+        live = [cid not in deleted for cid in ids]
+        id_lines = [cid if flag else "!" + cid for cid, flag in zip(ids, live)]
+        id_filter = _IdFilter.build(ids)
+        self._write(self._uri(name), gzip.compress("\n".join(lines).encode("utf-8")), content_type="application/gzip")
+        self._write(self._uri(ids_name), gzip.compress("\n".join(id_lines).encode("utf-8")), content_type="application/gzip")
+        self._write(self._uri(bloom_name), id_filter.to_bytes(), content_type="application/octet-stream")
+        self._filters[name] = id_filter
+        self._cache_ids(name, ids, live)
+        return {"name": name, "ids": ids_name, "bloom": bloom_name, "count": len(rows)}
+
+    def _write_index(self) -> None:
+        self._index["generation"] += 1
+        self._write(self._uri("index.json"), json.dumps(self._index).encode("utf-8"), content_type="application/json")
+
+    # ---- lookups ----
+    def _find(self, cid: str) -> Optional[Tuple[int, bool]]:
+        """(position, live) of the newest segment that records `cid`; None if none does."""
+        segments = self._index["segments"]
+        key = _IdFilter.key(cid)
+        for pos in range(len(segments) - 1, -1, -1):
+            seg = segments[pos]
+            id_filter = self._filter(seg)
+            if id_filter is not None and not id_filter.might_contain(key):
+                continue
+            ids, live = self._read_segment_ids(seg)
+            i = bisect_left(ids, cid)
+            if i < len(ids) and ids[i] == cid:
+                return pos, live[i]
+        return None
+
+    def get(self, cid: str) -> Optional[Dict]:
+        return self.get_many([cid]).get(cid)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Dict]:
+        out: Dict[str, Dict] = {}
+        by_segment: Dict[str, List[str]] = {}
+        for cid in ids:
+            if cid in self._pending:
+                if self._pending[cid] is not None:
+                    out[cid] = self._pending[cid]
+                continue
+            found = self._find(cid)
+            if found is not None and found[1]:
+                by_segment.setdefault(self._index["segments"][found[0]]["name"], []).append(cid)
+        for seg, seg_ids in by_segment.items():
+            entries = self._read_segment(seg)
+            for cid in seg_ids:
+                if entries.get(cid) is not None:
+                    out[cid] = entries[cid]
+        return out
+
+    def __contains__(self, cid: str) -> bool:
+        return bool(self.get_many([cid]))
+
+    def _iter_current(self, segments: List[Dict], skip: Iterable[str] = ()) -> Iterator[Tuple[str, Dict]]:
+        """Live entries not superseded by a newer segment, newest segment first (a full scan: tracks seen IDs)."""
+        seen = set(skip)
+        for seg in reversed(segments):
+            for cid, entry in self._read_segment(seg["name"]).items():
+                if cid not in seen:
+                    seen.add(cid)
+                    if entry is not None:
+                        yield cid, entry
+
+    def iter_items(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield every live (id, entry), one segment in memory at a time (pending entries first)."""
+        for cid, entry in self._pending.items():
+            if entry is not None:
+                yield cid, entry
+        yield from self._iter_current(list(self._index["segments"]), skip=self._pending)
+
+    # ---- updates ----
+    def put_many(self, entries: Dict[str, Dict]) -> None:
+        for cid, entry in entries.items():
+            self._pending[cid] = entry
+
+    def delete_many(self, ids: Iterable[str]) -> None:
+        for cid in ids:
+            self._pending[cid] = None
+
+    def flush(self) -> int:
+        """Append pending changes as new segment(s) and publish a new index.json. Returns entries written."""
+        if not self._pending:
+            return 0
+        rows = list(self._pending.items())
+        for i in range(0, len(rows), self.segment_max_entries):
+            self._index["segments"].append(self._write_segment(rows[i:i + self.segment_max_entries]))
+        self._write_index()
+        self._pending.clear()
+        print(f"Saved mapping: +{len(rows)} entries, {len(self._index['segments'])} segments under {self.root}")
+        return len(rows)
+
+    def compact(self, max_segments: int = 0) -> bool:
+        """
+        Rewrite the live entries into as few segments as possible and drop the
+        old ones. With `max_segments`, only compacts once there are more segments
+        than that. Returns True if it compacted.
+        """
+        self.flush()
+        old = list(self._index["segments"])
+        if len(old) <= 1 or (max_segments and len(old) <= max_segments):
+            return False
+        new_segments: List[Dict] = []
+        buf: List[Tuple[str, Dict]] = []
+        for cid, entry in self._iter_current(old):
+            buf.append((cid, entry))
+            if len(buf) >= self.segment_max_entries:
+                new_segments.append(self._write_segment(buf))
+                buf = []
+        if buf:
+            new_segments.append(self._write_segment(buf))
+
+        self._index["segments"] = new_segments
+        self._write_index()
+        self._delete_segments(old)
+        for seg in old:
+            self._filters.pop(seg["name"], None)
+            self._ids_cache.pop(seg["name"], None)
+            self._segment_cache.pop(seg["name"], None)
+        print(f"Compacted mapping: {len(old)} -> {len(new_segments)} segments")
+        return True
+
+    def destroy(self) -> None:
+        """Delete every segment and the index; the store is empty afterwards."""
+        self._delete_segments(self._index["segments"])
+        self._delete(self._uri("index.json"))
+        self._index = {"version": INDEX_VERSION, "generation": 0, "next_seq": 1, "segments": []}
+        self._pending.clear()
+        self.close()
+
+    def _delete_segments(self, segments: List[Dict]) -> None:
+        for seg in segments:
+            for key in ("name", "ids", "bloom"):
+                if key in seg:
+                    self._delete(self._uri(seg[key]))
+
+    def close(self) -> None:
+        self._segment_cache.clear()
+        self._ids_cache.clear()
+        self._filters.clear()
+
+
+class JsonMappingStore:
+    """The legacy single-document mapping (whole dict in memory, rewritten on flush)."""
+
+    def __init__(self, mapping_uri: str, load: Callable[[str], Dict[str, Dict]],
+                 save: Callable[[str, Dict[str, Dict]], None], local_backup: Optional[str] = None):
+        self.mapping_uri = mapping_uri
+        self._save = save
+        self.local_backup = local_backup
+        self.mapping = load(mapping_uri)
+        self._dirty = False
+
+    def get(self, cid: str) -> Optional[Dict]:
+        return self.mapping.get(cid)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Dict]:
+        return {cid: self.mapping[cid] for cid in ids if cid in self.mapping}
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self.mapping
+
+    def iter_items(self) -> Iterator[Tuple[str, Dict]]:
+        return iter(list(self.mapping.items()))
+
+    def put_many(self, entries: Dict[str, Dict]) -> None:
+        self.mapping.update(entries)
+        self._dirty = True
+
+    def delete_many(self, ids: Iterable[str]) -> None:
+        for cid in ids:
+            self._dirty = self.mapping.pop(cid, None) is not None or self._dirty
+
+    def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        if self.local_backup:
+            with open(self.local_backup, "w", encoding="utf-8") as f:
+                json.dump(self.mapping, f, ensure_ascii=False, indent=2)
+            print(f"Saved local {self.local_backup}")
+        self._save(self.mapping_uri, self.mapping)
+        self._dirty = False
+        return len(self.mapping)
+
+    def compact(self, max_segments: int = 0) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,182 @@
+"""
+Near-duplicate chunk detection with MinHash signatures and LSH banding.
+
+Each chunk is reduced to a set of word shingles, hashed into a `num_perm`
+MinHash signature (uint32), and the signature is split into `bands` bands.
+Chunks sharing any band are candidates; a candidate counts as a duplicate
+when the fraction of equal signature positions (an estimate of the Jaccard
+similarity of the shingle sets) reaches `threshold`.
+
+Only canonical chunks (the first copy seen) are kept in the index, together
+with the sources whose copies were collapsed onto them ("dependents"). When a
+canonical chunk is replaced or removed, `release()` hands those sources back
+so they can be re-ingested and a new canonical copy indexed.
+"""
+
+import json
+import re
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+FORMAT_VERSION = 1
+_MERSENNE_61 = np.uint64((1 << 61) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+class NearDupStats:
+    def __init__(self):
+        self.checked = 0
+        self.duplicates = 0
+        self.duplicate_chars = 0
+
+    def snapshot(self, bytes_per_vector: int = 0) -> Dict[str, float]:
+        return {
+            "chunks_checked": self.checked,
+            "duplicates_skipped": self.duplicates,
+            "embeddings_saved": self.duplicates,
+            "index_bytes_saved": self.duplicates * bytes_per_vector + self.duplicate_chars,
+            "duplicate_rate": round(self.duplicates / self.checked, 4) if self.checked else 0.0,
+        }
+
+
+class NearDupIndex:
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, bands: int = 16, shingle_words: int = 5,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # a < 2**31 and x < 2**32 keep a * x + b inside uint64
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+        self.signatures: Dict[str, np.ndarray] = {}      # canonical id -> signature
+        self.dependents: Dict[str, List[str]] = {}       # canonical id -> sources of collapsed copies
+        self.reingest: Set[str] = set()                  # sources to re-ingest (their canonical went away)
+        self._buckets: List[Dict[bytes, Set[str]]] = [dict() for _ in range(bands)]
+        self.stats = NearDupStats()
+
+    # ---- signatures ----
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        words = _WORD_RE.findall(text.lower())
+        if not words:
+            return None
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) % _MERSENNE_61
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    # ---- lookups / updates ----
+    def find(self, sig: np.ndarray) -> Optional[str]:
+        """The canonical ID of the most similar indexed chunk at/above the threshold, if any."""
+        candidates: Set[str] = set()
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            candidates |= band.get(key, set())
+        best, best_sim = None, self.threshold
+        for cid in candidates:
+            sim = float(np.count_nonzero(self.signatures[cid] == sig)) / self.num_perm
+            if sim >= best_sim:
+                best, best_sim = cid, sim
+        return best
+
+    def add(self, cid: str, sig: np.ndarray) -> None:
+        self.signatures[cid] = sig
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(key, set()).add(cid)
+
+    def check(self, cid: str, text: str, source: str) -> Optional[str]:
+        """
+        Index `cid` as canonical, or return the canonical ID it duplicates
+        (recording `source` as a dependent of that canonical chunk).
+        """
+        self.stats.checked += 1
+        sig = self.signature(text)
+        if sig is None:
+            return None
+        old = self.signatures.get(cid)
+        if old is not None:
+            if np.count_nonzero(old == sig) / self.num_perm >= self.threshold:
+                return None  # a canonical chunk re-ingested with (nearly) the same content keeps its dependents
+            self.release([cid])
+        canonical = self.find(sig)
+        if canonical is not None and canonical != cid:
+            deps = self.dependents.setdefault(canonical, [])
+            if source not in deps:
+                deps.append(source)
+            self.stats.duplicates += 1
+            self.stats.duplicate_chars += len(text.encode("utf-8"))
+            return canonical
+        self.add(cid, sig)
+        return None
+
+    def release(self, ids: Iterable[str]) -> List[str]:
+        """
+        Drop canonical chunks that are being replaced or removed; their
+        dependents' sources are queued in `reingest` and returned.
+        """
+        released: List[str] = []
+        for cid in ids:
+            sig = self.signatures.pop(cid, None)
+            if sig is None:
+                continue
+            for band, key in zip(self._buckets, self._band_keys(sig)):
+                members = band.get(key)
+                if members is not None:
+                    members.discard(cid)
+                    if not members:
+                        del band[key]
+            for source in self.dependents.pop(cid, []):
+                if source not in self.reingest:
+                    self.reingest.add(source)
+                    released.append(source)
+        return released
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    # ---- (de)serialization ----
+    def to_bytes(self) -> bytes:
+        ids = list(self.signatures)
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "shingle_words": self.shingle_words,
+            "seed": self.seed,
+            "ids": ids,
+            "dependents": self.dependents,
+            "reingest": sorted(self.reingest),
+        }, ensure_ascii=False).encode("utf-8")
+        matrix = np.stack([self.signatures[c] for c in ids]) if ids else np.zeros((0, self.num_perm), np.uint32)
+        return struct.pack("<Q", len(header)) + header + matrix.astype("<u4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, threshold: Optional[float] = None) -> "NearDupIndex":
+        (hlen,) = struct.unpack_from("<Q", raw, 0)
+        header = json.loads(raw[8:8 + hlen].decode("utf-8"))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported near-duplicate index version {header.get('version')}")
+        index = cls(
+            threshold=header["threshold"] if threshold is None else threshold,
+            num_perm=header["num_perm"], bands=header["bands"],
+            shingle_words=header["shingle_words"], seed=header["seed"],
+        )
+        matrix = np.frombuffer(raw, dtype="<u4", offset=8 + hlen).reshape(len(header["ids"]), index.num_perm)
+        for cid, sig in zip(header["ids"], matrix):
+            index.add(cid, sig.astype(np.uint32))
+        index.dependents = {k: list(v) for k, v in header.get("dependents", {}).items()}
+        index.reingest = set(header.get("reingest", []))
+        return index
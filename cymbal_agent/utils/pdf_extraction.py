@@ -0,0 +1,160 @@
+"""
+Process-isolated PDF text extraction.
+
+Every PDF is parsed by PyPDF2 in a child process, which gives us:
+  - real CPU parallelism (one process per file, up to the caller's concurrency),
+  - a wall-clock deadline per file: a worker that overruns is killed,
+  - a memory cap per worker (RLIMIT_AS on top of the forked baseline),
+  - page-range fan-out for very large documents.
+
+A PDF that times out, blows the memory cap or crashes the parser yields ""
+and a warning, exactly like an unreadable PDF did before.
+"""
+
+import io
+import os
+import time
+import multiprocessing as mp
+from multiprocessing.connection import wait as wait_connections
+from typing import List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# fork keeps start-up cheap and avoids re-importing the agent package in workers
+START_METHOD = os.getenv("PDF_EXTRACT_START_METHOD", "fork" if hasattr(os, "fork") else "spawn")
+
+
+def _apply_memory_cap(max_memory_mb: Optional[int]) -> None:
+    """Cap the worker's address space at its forked size plus `max_memory_mb`."""
+    if not max_memory_mb or resource is None:
+        return
+    base = 0
+    try:
+        with open("/proc/self/statm", "r") as f:
+            base = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    limit = base + int(max_memory_mb) * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _extract_worker(conn, pdf_bytes: bytes, page_range: Optional[Tuple[int, int]],
+                    split_pages: Optional[int], max_memory_mb: Optional[int]) -> None:
+    """
+    Child entry point. Sends one message back:
+      ("text", str)   extracted text of the whole file or of `page_range`
+      ("pages", n)    file has more than `split_pages` pages; caller should fan out
+      ("error", msg)
+    """
+    try:
+        _apply_memory_cap(max_memory_mb)
+        from PyPDF2 import PdfReader
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        n = len(reader.pages)
+        if page_range is None and split_pages and n > split_pages:
+            conn.send(("pages", n))
+            return
+        lo, hi = page_range or (0, n)
+        pages = []
+        for i in range(lo, min(hi, n)):
+            try:
+                pages.append(reader.pages[i].extract_text() or "")
+            except Exception:
+                pages.append("")
+        conn.send(("text", "\n".join(pages)))
+    except MemoryError:
+        conn.send(("error", f"memory cap of {max_memory_mb} MB exceeded"))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def _run_jobs(jobs: List[tuple], max_workers: int, deadline: Optional[float]) -> List[tuple]:
+    """
+    Run `_extract_worker(*job)` for each job in its own process, at most
+    `max_workers` at a time. Jobs still running (or not started) at `deadline`
+    (time.monotonic()) are killed and reported as errors. Results keep job order.
+    """
+    ctx = mp.get_context(START_METHOD)
+    results: List[tuple] = [None] * len(jobs)
+    pending = list(enumerate(jobs))[::-1]
+    running = {}  # parent conn -> (job index, process)
+
+    def reap(conn, outcome):
+        i, proc = running.pop(conn)
+        if outcome is None:
+            try:
+                outcome = conn.recv()
+            except (EOFError, OSError):
+                proc.join()
+                outcome = ("error", f"worker exited with code {proc.exitcode}")
+        conn.close()
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        results[i] = outcome
+
+    while pending or running:
+        while pending and len(running) < max(1, max_workers):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            i, job = pending.pop()
+            parent_conn, child_conn = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_extract_worker, args=(child_conn, *job), daemon=True)
+            proc.start()
+            child_conn.close()
+            running[parent_conn] = (i, proc)
+
+        if not running:
+            break
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        for conn in wait_connections(list(running), timeout=timeout):
+            reap(conn, None)
+        if deadline is not None and time.monotonic() >= deadline:
+            for conn in list(running):
+                reap(conn, ("error", "timed out"))
+
+    for i, _ in pending:
+        results[i] = ("error", "timed out before start")
+    return results
+
+
+def extract_pdf_text(
+    pdf_bytes: bytes,
+    timeout: Optional[float] = None,
+    max_memory_mb: Optional[int] = None,
+    split_pages: Optional[int] = None,
+    page_workers: int = 1,
+    label: str = "",
+) -> str:
+    """
+    Extract a PDF's text in a child process. PDFs with more than `split_pages`
+    pages are extracted as page ranges by up to `page_workers` processes.
+    `timeout` is the wall-clock budget for the whole file.
+    """
+    import PyPDF2  # noqa: F401  (import in the parent so forked workers never take the import lock)
+
+    deadline = time.monotonic() + timeout if timeout else None
+    kind, value = _run_jobs([(pdf_bytes, None, split_pages, max_memory_mb)], 1, deadline)[0]
+
+    if kind == "pages":
+        n = value
+        ranges = [(lo, min(lo + split_pages, n)) for lo in range(0, n, split_pages)]
+        print(f"[INFO] {label or 'PDF'}: {n} pages, extracting in {len(ranges)} ranges")
+        parts = _run_jobs([(pdf_bytes, r, None, max_memory_mb) for r in ranges], page_workers, deadline)
+        failed = [msg for k, msg in parts if k != "text"]
+        if failed:
+            print(f"[WARN] {label or 'PDF'}: {len(failed)}/{len(parts)} page ranges failed ({failed[0]})")
+        kind, value = "text", "\n".join(text if k == "text" else "" for k, text in parts)
+
+    if kind != "text":
+        print(f"[WARN] PDF extract failed for {label or 'PDF'}: {value}")
+        return ""
+    return value
@@ -0,0 +1,131 @@
+"""
+Minimal threaded stage pipeline with bounded queues.
+
+    run_pipeline(source, [Stage("download", fn, workers=8), Stage("embed", fn2), ...])
+
+Every stage reads from a bounded queue and writes to the next one, so a slow
+stage applies backpressure all the way to the source and the number of items
+in flight never exceeds roughly (queue_size + workers) per stage. Stage
+functions return an iterable of outputs (zero, one or many per input);
+`flush` is called once after the last input, for stages that buffer (e.g. a
+batcher). The first exception raised by any stage stops the pipeline and is
+re-raised in the caller.
+"""
+
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+_DONE = object()
+_POLL_SECONDS = 0.2
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[object], Optional[Iterable]],
+        workers: int = 1,
+        flush: Callable[[], Optional[Iterable]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(int(workers), 1)
+        self.flush = flush
+
+
+class _Run:
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if self.error is None:
+                self.error = exc
+        self.stop.set()
+
+    def put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the run is stopping."""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+
+def run_pipeline(source: Iterable, stages: List[Stage], queue_size: int = 4) -> None:
+    run = _Run()
+    queues = [queue.Queue(maxsize=max(queue_size, 1)) for _ in stages]
+
+    def feed():
+        try:
+            for item in source:
+                if not run.put(queues[0], item):
+                    return
+        except BaseException as e:
+            run.fail(e)
+        finally:
+            run.put(queues[0], _DONE)
+
+    threads = [threading.Thread(target=feed, name="pipeline-source", daemon=True)]
+
+    for idx, stage in enumerate(stages):
+        in_q = queues[idx]
+        out_q = queues[idx + 1] if idx + 1 < len(stages) else None
+        remaining = {"workers": stage.workers}
+        remaining_lock = threading.Lock()
+
+        def emit(outputs, out_q=out_q):
+            if outputs is None or out_q is None:
+                if outputs is not None:
+                    for _ in outputs:  # drain generators of the last stage
+                        pass
+                return True
+            for out in outputs:
+                if not run.put(out_q, out):
+                    return False
+            return True
+
+        def work(stage=stage, in_q=in_q, out_q=out_q, emit=emit,
+                 remaining=remaining, remaining_lock=remaining_lock):
+            try:
+                while True:
+                    item = run.get(in_q)
+                    if item is _DONE:
+                        run.put(in_q, _DONE)  # let sibling workers see it too
+                        break
+                    if not emit(stage.fn(item)):
+                        return
+                with remaining_lock:
+                    remaining["workers"] -= 1
+                    last = remaining["workers"] == 0
+                if last and not run.stop.is_set():
+                    if stage.flush is not None:
+                        emit(stage.flush())
+                    if out_q is not None:
+                        run.put(out_q, _DONE)
+            except BaseException as e:
+                run.fail(e)
+
+        for w in range(stage.workers):
+            threads.append(threading.Thread(target=work, name=f"pipeline-{stage.name}-{w}", daemon=True))
+
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if run.error is not None:
+        raise run.error
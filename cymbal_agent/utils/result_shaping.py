@@ -0,0 +1,98 @@
+"""
+Post-processing of retrieval hits before they are handed to the model.
+
+  filter_by_score(neighbors, min_score, max_gap)   -> drop weak hits; stop at the first large score drop
+  mmr(neighbors, k, lambda_)                       -> maximal marginal relevance over the hit vectors
+  apply_token_budget(neighbors, max_tokens)        -> keep hits until the estimated token budget is used
+
+All functions take and return lists of `Neighbor` in rank order (best first).
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from .embed_batching import CHARS_PER_TOKEN, estimate_tokens
+from .local_vector_index import Neighbor
+
+
+def filter_by_score(neighbors: List[Neighbor], min_score: Optional[float] = None,
+                    max_gap: Optional[float] = None) -> List[Neighbor]:
+    """
+    Keep hits scoring at least `min_score`, and cut the list after the first
+    hit whose score is more than `max_gap` below the previous one (adaptive k).
+    The best hit is kept by the gap rule even if later ones fall off.
+    """
+    ranked = sorted(neighbors, key=lambda n: -n.score)
+    if min_score is not None:
+        ranked = [n for n in ranked if n.score >= min_score]
+    if max_gap is not None and max_gap > 0:
+        for i in range(1, len(ranked)):
+            if ranked[i - 1].score - ranked[i].score > max_gap:
+                return ranked[:i]
+    return ranked
+
+
+def mmr(neighbors: List[Neighbor], k: int, lambda_: float = 0.7) -> List[Neighbor]:
+    """
+    Pick `k` hits by maximal marginal relevance: lambda * relevance -
+    (1 - lambda) * max cosine similarity to the hits already picked.
+    Relevance is scaled so the best hit is 1, which keeps fused (RRF) scores
+    comparable to cosine similarities. Hits without a vector are treated as
+    unlike every other hit.
+    """
+    if len(neighbors) <= 1 or k <= 0:
+        return neighbors[:max(k, 0)]
+    dims = {len(n.vector) for n in neighbors if n.vector is not None}
+    if len(dims) != 1:
+        return neighbors[:k]
+    dim = dims.pop()
+
+    vecs = np.zeros((len(neighbors), dim), dtype=np.float32)
+    has_vec = np.zeros(len(neighbors), dtype=bool)
+    for i, n in enumerate(neighbors):
+        if n.vector is not None:
+            v = np.asarray(n.vector, dtype=np.float32)
+            norm = float(np.linalg.norm(v))
+            if norm > 0:
+                vecs[i] = v / norm
+                has_vec[i] = True
+    sims = vecs @ vecs.T
+    sims[~has_vec, :] = 0.0
+    sims[:, ~has_vec] = 0.0
+
+    relevance = np.array([n.score for n in neighbors], dtype=np.float32)
+    top = float(np.max(np.abs(relevance)))
+    if top > 0:
+        relevance /= top
+    selected: List[int] = []
+    max_sim = np.full(len(neighbors), -np.inf, dtype=np.float32)
+    remaining = np.ones(len(neighbors), dtype=bool)
+    for _ in range(min(k, len(neighbors))):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        gain = lambda_ * relevance - (1.0 - lambda_) * redundancy
+        gain[~remaining] = -np.inf
+        best = int(np.argmax(gain))
+        selected.append(best)
+        remaining[best] = False
+        max_sim = np.maximum(max_sim, sims[best])
+    return [neighbors[i] for i in selected]
+
+
+def apply_token_budget(neighbors: List[Neighbor], max_tokens: Optional[int]) -> List[Neighbor]:
+    """
+    Keep hits in order while their estimated tokens fit in `max_tokens`. If
+    even the first hit does not fit, it is truncated to the budget.
+    """
+    if not max_tokens or max_tokens <= 0:
+        return neighbors
+    out, used = [], 0
+    for n in neighbors:
+        cost = estimate_tokens(n.text)
+        if used + cost > max_tokens:
+            if not out:
+                out.append(n._replace(text=n.text[:max_tokens * CHARS_PER_TOKEN]))
+            break
+        out.append(n)
+        used += cost
+    return out
@@ -0,0 +1,73 @@
+"""
+Base class for the single-file SQLite stores ingestion mirrors to GCS
+("sidecars": embedding cache, extracted-text cache, chunk-text store).
+
+A subclass only declares its TABLE and SCHEMA and adds accessors; the
+connection setup (WAL, relaxed fsync), locking, merging another copy of the
+store, WAL checkpointing before an upload, row count and close live here.
+"""
+
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List
+
+# SQLite's default limit on bound parameters is 999
+LOOKUP_BATCH = 500
+
+
+class SqliteSidecar:
+    """Thread-safe SQLite store in one file; subclasses set TABLE and SCHEMA (CREATE TABLE IF NOT EXISTS ...)."""
+
+    TABLE = ""
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(self.SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _batches(values: Iterable[str]) -> Iterator[List[str]]:
+        """Distinct values in slices small enough for one `IN (...)` clause."""
+        values = list(dict.fromkeys(values))
+        for i in range(0, len(values), LOOKUP_BATCH):
+            yield values[i:i + LOOKUP_BATCH]
+
+    @staticmethod
+    def _placeholders(batch: List[str]) -> str:
+        return ",".join("?" * len(batch))
+
+    def merge_from(self, path: str) -> int:
+        """Copy every row of another file of the same store into this one (its rows win); returns rows copied."""
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                copied = self._merge_attached()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+        return copied
+
+    def _merge_attached(self) -> int:
+        """Fold the attached database `other` into this one (inside the caller's transaction)."""
+        return self._conn.execute(f"INSERT OR REPLACE INTO {self.TABLE} SELECT * FROM other.{self.TABLE}").rowcount
+
+    def checkpoint(self) -> None:
+        """Fold the WAL into the main file so the .db can be copied on its own."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
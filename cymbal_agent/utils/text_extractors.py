@@ -0,0 +1,165 @@
+"""
+Pluggable text-extraction engines, selected per file extension.
+
+    extractors = ExtractorRegistry.from_spec(".pdf=pypdf2,.txt=text,.html=html",
+                                             options={"pypdf2": {"timeout": 300}})
+    extractor = extractors.for_uri("gs://bucket/a.pdf")
+    text = extractor.extract(raw_bytes, label="gs://bucket/a.pdf")
+
+Engines:
+  text     -> utf-8 decode (.txt, .md, ...)
+  pypdf2   -> PyPDF2 in isolated worker processes (see pdf_extraction)
+  pymupdf  -> PyMuPDF (fitz), in-process; much faster on large PDFs (optional dependency)
+  html     -> BeautifulSoup visible text, without scripts/styles/navigation
+  docx     -> python-docx paragraphs and table cells (optional dependency)
+
+Every engine has a `cache_id` (engine name + library version), which is part of
+the extracted-text cache key, so switching or upgrading an engine never
+serves text produced by another one.
+"""
+
+import io
+from importlib import metadata
+from typing import Dict, Iterable, Optional, Set
+
+from .pdf_extraction import extract_pdf_text
+
+
+def _dist_version(dist: str) -> str:
+    try:
+        return metadata.version(dist)
+    except metadata.PackageNotFoundError:
+        return "missing"
+
+
+class Extractor:
+    """Base class: turn the raw bytes of one object into text ("" if nothing can be read)."""
+    name = ""
+    dist: Optional[str] = None   # distribution whose version goes into cache_id
+
+    def __init__(self, **options):
+        self.options = options
+
+    @property
+    def cache_id(self) -> str:
+        return f"{self.name}-{_dist_version(self.dist)}" if self.dist else self.name
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        raise NotImplementedError
+
+
+class PlainTextExtractor(Extractor):
+    name = "text"
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        return raw.decode(self.options.get("encoding", "utf-8"), errors="ignore")
+
+
+class PyPdf2Extractor(Extractor):
+    """Options: timeout, max_memory_mb, split_pages, page_workers (see extract_pdf_text)."""
+    name = "pypdf2"
+    dist = "PyPDF2"
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        return extract_pdf_text(raw, label=label, **self.options)
+
+
+class PyMuPdfExtractor(Extractor):
+    name = "pymupdf"
+    dist = "PyMuPDF"
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        try:
+            import fitz
+        except ImportError:
+            print(f"[WARN] PyMuPDF is not installed; cannot extract {label or 'PDF'}")
+            return ""
+        try:
+            with fitz.open(stream=raw, filetype="pdf") as doc:
+                return "\n".join(page.get_text() for page in doc)
+        except Exception as e:
+            print(f"[WARN] PDF extract failed for {label or 'PDF'}: {e}")
+            return ""
+
+
+class HtmlExtractor(Extractor):
+    name = "html"
+    dist = "beautifulsoup4"
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(raw, "html.parser")
+        for tag in soup(["script", "style", "noscript", "nav", "footer", "form"]):
+            tag.decompose()
+        lines = (line.strip() for line in soup.get_text(separator="\n").splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+class DocxExtractor(Extractor):
+    name = "docx"
+    dist = "python-docx"
+
+    def extract(self, raw: bytes, label: str = "") -> str:
+        try:
+            import docx
+        except ImportError:
+            print(f"[WARN] python-docx is not installed; cannot extract {label or 'DOCX'}")
+            return ""
+        try:
+            document = docx.Document(io.BytesIO(raw))
+        except Exception as e:
+            print(f"[WARN] DOCX extract failed for {label or 'DOCX'}: {e}")
+            return ""
+        parts = [p.text for p in document.paragraphs if p.text]
+        for table in document.tables:
+            for row in table.rows:
+                parts.append(" | ".join(cell.text for cell in row.cells))
+        return "\n".join(parts)
+
+
+ENGINES = {cls.name: cls for cls in (PlainTextExtractor, PyPdf2Extractor, PyMuPdfExtractor, HtmlExtractor, DocxExtractor)}
+
+
+class ExtractorRegistry:
+    """File extension (lower case, with the dot) -> extractor."""
+
+    def __init__(self, extractors: Optional[Dict[str, Extractor]] = None):
+        self._by_ext: Dict[str, Extractor] = dict(extractors or {})
+
+    @classmethod
+    def from_spec(cls, spec: str, options: Optional[Dict[str, Dict]] = None) -> "ExtractorRegistry":
+        """'.pdf=pypdf2,.txt=text' -> registry; `options` holds per-engine keyword arguments."""
+        options = options or {}
+        instances: Dict[str, Extractor] = {}
+        registry = cls()
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            ext, _, engine = item.partition("=")
+            engine = engine.strip().lower()
+            if engine not in ENGINES:
+                raise ValueError(f"Unknown text extractor {engine!r} for {ext!r} (known: {', '.join(ENGINES)})")
+            if engine not in instances:
+                instances[engine] = ENGINES[engine](**options.get(engine, {}))
+            registry.register(ext, instances[engine])
+        return registry
+
+    def register(self, ext: str, extractor: Extractor) -> None:
+        ext = ext.strip().lower()
+        self._by_ext[ext if ext.startswith(".") else f".{ext}"] = extractor
+
+    def for_uri(self, uri: str) -> Optional[Extractor]:
+        name = uri.lower()
+        for ext in sorted(self._by_ext, key=len, reverse=True):
+            if name.endswith(ext):
+                return self._by_ext[ext]
+        return None
+
+    @property
+    def extensions(self) -> Set[str]:
+        return set(self._by_ext)
+
+    def engines(self) -> Iterable[Extractor]:
+        return list({id(e): e for e in self._by_ext.values()}.values())
@@ -0,0 +1,80 @@
+"""
+Small thread-safe LRU cache with per-entry TTL and hit/miss counters.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUTTLCache:
+    """
+    Bounded mapping that evicts the least recently used entry once `maxsize`
+    is reached and treats entries older than `ttl_seconds` as missing.
+    A `ttl_seconds` of 0 or less disables expiry.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 3600.0):
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._expired(item[1], now):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key: Hashable) -> bool:
+        """True if `key` holds a live entry; does not touch LRU order or counters."""
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._expired(item[1], time.monotonic())
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else None,
+            }
@@ -0,0 +1,173 @@
+"""
+Compressed vector codes for a coarse first search stage.
+
+A code set is built from the L2-normalized float32 rows of an index version:
+
+  mode "int8"    -> per-dimension symmetric int8 quantization (1 byte / dim)
+  mode "binary"  -> sign bits packed 8 per byte (1 bit / dim), scored by Hamming distance
+  mode "float32" -> no quantization (only useful together with a prefix)
+
+`prefix_dim` keeps only the first dimensions of every vector (Matryoshka
+truncation; the Gemini embedding models are trained so that prefixes remain
+meaningful), re-normalized. The coarse stage scans the codes for
+`k * rescore` candidates, which are then rescored against the full-precision
+rows.
+
+Codes are cached next to the vectors as coarse-<mode>-<dim>.codes (+ .json)
+so that every process on an instance maps the same file.
+"""
+
+import json
+import os
+import uuid
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+BUILD_BLOCK_ROWS = 65536
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class CompressionConfig(NamedTuple):
+    mode: str = "int8"        # "int8" | "binary" | "float32"
+    prefix_dim: int = 0       # 0 = all dimensions
+    rescore: int = 10         # candidates per requested result for the exact stage
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> Optional["CompressionConfig"]:
+        """'int8', 'binary:256', 'float32:768:20' -> config; empty/'none' -> None."""
+        if not spec or spec.lower().split(":")[0] in ("", "none"):
+            return None
+        parts = spec.lower().split(":")
+        mode = parts[0]
+        if mode not in ("int8", "binary", "float32"):
+            raise ValueError(f"Unknown vector compression mode {mode!r}")
+        prefix = int(parts[1]) if len(parts) > 1 and parts[1] else 0
+        rescore = int(parts[2]) if len(parts) > 2 and parts[2] else 10
+        return cls(mode, prefix, rescore)
+
+
+def _prefix_rows(block: np.ndarray, dim: int) -> np.ndarray:
+    block = np.asarray(block[:, :dim], dtype=np.float32)
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return block / norms
+
+
+def bytes_per_vector(config: CompressionConfig, dim: int) -> float:
+    d = config.prefix_dim or dim
+    return {"int8": d, "binary": (d + 7) // 8, "float32": 4 * d}[config.mode]
+
+
+class CoarseCodes:
+    """Memory-mapped code matrix for one index version."""
+
+    def __init__(self, codes: np.ndarray, config: CompressionConfig, dim: int, scale: Optional[np.ndarray]):
+        self.codes = codes
+        self.config = config
+        self.dim = dim               # code dimensionality (after the prefix cut)
+        self.scale = scale           # int8: per-dimension dequantization scale
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.size * self.codes.itemsize)
+
+    def _prepare(self, q: np.ndarray) -> np.ndarray:
+        q = _prefix_rows(q, self.dim)
+        if self.config.mode == "binary":
+            return np.packbits(q > 0, axis=1)
+        if self.config.mode == "int8":
+            return q * self.scale[None, :]
+        return q
+
+    def scores(self, prepared: np.ndarray, block: np.ndarray) -> np.ndarray:
+        """Coarse scores (higher is closer) of prepared queries against a block of codes."""
+        if self.config.mode == "binary":
+            # negative Hamming distance
+            xor = np.bitwise_xor(prepared[:, None, :], block[None, :, :])
+            return -_POPCOUNT[xor].sum(axis=2, dtype=np.int32).astype(np.float32)
+        return prepared @ block.astype(np.float32).T
+
+    def candidates(self, queries: np.ndarray, n: int, block_rows: int = BUILD_BLOCK_ROWS) -> np.ndarray:
+        """Row numbers of the `n` best coarse matches per query, shape (nq, <=n)."""
+        total = len(self.codes)
+        n = min(n, total)
+        prepared = self._prepare(queries)
+        # binary scoring materializes (nq, rows, bytes) and int8 blocks are cast to float32
+        # before the matmul; cache-sized blocks keep both cheap
+        if self.config.mode == "binary":
+            block_rows = max(1024, block_rows // max(len(queries), 1) // 8)
+        elif self.config.mode == "int8":
+            block_rows = min(block_rows, 4096)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, total, block_rows):
+            stop = min(start + block_rows, total)
+            scores = self.scores(prepared, self.codes[start:stop])
+            kk = min(n, scores.shape[1])
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > n:
+                keep = np.argpartition(-best_scores, n - 1, axis=1)[:, :n]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        return best_rows
+
+    def candidates_in(self, query: np.ndarray, rows: np.ndarray, n: int) -> np.ndarray:
+        """The `n` best coarse matches of one query among the given (sorted) rows."""
+        if len(rows) <= n:
+            return rows
+        scores = self.scores(self._prepare(query[None, :]), self.codes[rows])[0]
+        return rows[np.argpartition(-scores, n - 1)[:n]]
+
+
+def build_codes(vectors: np.ndarray, config: CompressionConfig) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode all rows of `vectors` (count x dim, unit rows). Returns (codes, int8 scale or None)."""
+    count, full_dim = vectors.shape
+    dim = min(config.prefix_dim or full_dim, full_dim)
+    scale = None
+    if config.mode == "int8":
+        max_abs = np.zeros(dim, dtype=np.float32)
+        for start in range(0, count, BUILD_BLOCK_ROWS):
+            block = _prefix_rows(vectors[start:start + BUILD_BLOCK_ROWS], dim)
+            max_abs = np.maximum(max_abs, np.abs(block).max(axis=0))
+        max_abs[max_abs == 0] = 1.0
+        scale = (max_abs / 127.0).astype(np.float32)
+
+    width = (dim + 7) // 8 if config.mode == "binary" else dim
+    dtype = {"int8": np.int8, "binary": np.uint8, "float32": np.float32}[config.mode]
+    codes = np.empty((count, width), dtype=dtype)
+    for start in range(0, count, BUILD_BLOCK_ROWS):
+        block = _prefix_rows(vectors[start:start + BUILD_BLOCK_ROWS], dim)
+        if config.mode == "int8":
+            codes[start:start + len(block)] = np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+        elif config.mode == "binary":
+            codes[start:start + len(block)] = np.packbits(block > 0, axis=1)
+        else:
+            codes[start:start + len(block)] = block
+    return codes, scale
+
+
+def open_codes(version_dir: str, vectors: np.ndarray, config: CompressionConfig) -> CoarseCodes:
+    """Map the cached codes of `version_dir` for `config`, building and caching them first if needed."""
+    count, full_dim = vectors.shape
+    dim = min(config.prefix_dim or full_dim, full_dim)
+    base = os.path.join(version_dir, f"coarse-{config.mode}-{dim}")
+    if not os.path.exists(base + ".json"):
+        codes, scale = build_codes(vectors, config)
+        tmp = f"{base}.{uuid.uuid4().hex}"
+        codes.tofile(tmp + ".codes")
+        os.replace(tmp + ".codes", base + ".codes")
+        with open(tmp + ".json", "w", encoding="utf-8") as f:
+            json.dump({"count": count, "dim": dim, "scale": scale.tolist() if scale is not None else None}, f)
+        os.replace(tmp + ".json", base + ".json")   # written last: marks the codes complete
+
+    with open(base + ".json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    width = (dim + 7) // 8 if config.mode == "binary" else dim
+    dtype = {"int8": np.int8, "binary": np.uint8, "float32": np.float32}[config.mode]
+    codes = np.memmap(base + ".codes", dtype=dtype, mode="r", shape=(count, width)) if count else \
+        np.zeros((0, width), dtype=dtype)
+    scale = np.asarray(meta["scale"], dtype=np.float32) if meta.get("scale") is not None else None
+    return CoarseCodes(codes, config, dim, scale)
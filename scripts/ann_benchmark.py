@@ -0,0 +1,126 @@
+"""
+IVF approximate search vs exact search on the local vector index.
+
+  python scripts/ann_benchmark.py                 # copy of the index in VECTOR_LOCAL_INDEX_DIR
+  python scripts/ann_benchmark.py /path/to/index  # copy of a specific local index
+  python scripts/ann_benchmark.py --synthetic     # clustered random vectors
+
+Reports the IVF build time, recall@k and per-query latency for every nprobe
+in BENCH_NPROBES, and the cost of an incremental upsert (new rows assigned
+to the existing centroids, some rows deleted). The benchmark works on a
+temporary copy, so the original index is never modified.
+"""
+
+import os, sys, shutil, tempfile, time
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cymbal_agent"))
+from utils.ivf_index import IvfConfig, auto_nlist, build_ivf  # noqa: E402
+from utils.local_vector_index import LocalVectorIndex, _current_version_dir, upsert, write_index  # noqa: E402
+
+load_dotenv()
+
+K = int(os.getenv("BENCH_K", "5"))
+NUM_QUERIES = int(os.getenv("BENCH_QUERIES", "200"))
+QUERY_NOISE = float(os.getenv("BENCH_QUERY_NOISE", "0.05"))
+NLIST = int(os.getenv("VECTOR_LOCAL_IVF_NLIST", "0"))
+NPROBES = [int(x) for x in os.getenv("BENCH_NPROBES", "1,4,8,16,32,64").split(",")]
+UPDATE_FRACTION = float(os.getenv("BENCH_UPDATE_FRACTION", "0.01"))
+SYNTHETIC_ROWS = int(os.getenv("BENCH_SYNTHETIC_ROWS", "100000"))
+SYNTHETIC_DIM = int(os.getenv("BENCH_SYNTHETIC_DIM", "768"))
+
+
+def synthetic_vectors(rows: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = np.random.default_rng(0).standard_normal((max(SYNTHETIC_ROWS // 100, 1), SYNTHETIC_DIM))
+    labels = rng.integers(0, len(centers), rows)
+    return (centers[labels] + 0.6 * rng.standard_normal((rows, SYNTHETIC_DIM))).astype(np.float32)
+
+
+def timed_search(index: LocalVectorIndex, queries: np.ndarray):
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(index.search(q, K))
+        latencies.append(time.perf_counter() - t0)
+    return results, np.array(latencies) * 1000.0
+
+
+def recall(truth, results) -> float:
+    return float(np.mean([len({n.id for n in t} & {n.id for n in r}) / max(len(t), 1)
+                          for t, r in zip(truth, results)]))
+
+
+def main():
+    synthetic = "--synthetic" in sys.argv
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    source = args[0] if args else os.getenv("VECTOR_LOCAL_INDEX_DIR")
+    work = tempfile.mkdtemp(prefix="ann-bench-")
+    index_dir = os.path.join(work, "index")
+    try:
+        if synthetic or not source:
+            print(f"Building synthetic index ({SYNTHETIC_ROWS} x {SYNTHETIC_DIM}) ...")
+            write_index(index_dir, [f"syn-{i}" for i in range(SYNTHETIC_ROWS)], [""] * SYNTHETIC_ROWS,
+                        synthetic_vectors(SYNTHETIC_ROWS, 1))
+        else:
+            current = _current_version_dir(source)
+            if current is None:
+                print(f"[error] no local vector index in {source}")
+                raise SystemExit(1)
+            os.makedirs(index_dir)
+            shutil.copytree(current, os.path.join(index_dir, os.path.basename(current)),
+                            ignore=shutil.ignore_patterns("ivf.*", "coarse-*"))
+            with open(os.path.join(index_dir, "CURRENT"), "w", encoding="utf-8") as f:
+                f.write(os.path.basename(current))
+        version_dir = _current_version_dir(index_dir)
+
+        exact = LocalVectorIndex(version_dir)
+        config = IvfConfig(nlist=NLIST)
+        t0 = time.perf_counter()
+        ivf = build_ivf(version_dir, exact.vectors, config)
+        build_s = time.perf_counter() - t0
+        sizes = np.diff(ivf.offsets)
+        print(f"\nIndex: rows={exact.count} dim={exact.dim}  nlist={ivf.nlist} "
+              f"(auto {auto_nlist(exact.count)})  list sizes min/median/max="
+              f"{sizes.min()}/{int(np.median(sizes))}/{sizes.max()}")
+        print(f"IVF build (k-means + assignment): {build_s:.2f}s\n")
+
+        rng = np.random.default_rng(2)
+        rows = np.sort(rng.choice(exact.count, size=min(NUM_QUERIES, exact.count), replace=False))
+        queries = np.asarray(exact.vectors[rows], dtype=np.float32)
+        queries = queries + QUERY_NOISE * rng.standard_normal(queries.shape).astype(np.float32)
+
+        truth, lat = timed_search(exact, queries)
+        header = f"{'search':<16}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}{'rows scored':>13}"
+        print(header)
+        print("-" * len(header))
+        print(f"{'exact':<16}{1.0:>10.3f}{np.percentile(lat, 50):>9.2f}{np.percentile(lat, 95):>9.2f}"
+              f"{exact.count:>13}")
+        for nprobe in NPROBES:
+            index = LocalVectorIndex(version_dir, ann=config._replace(nprobe=nprobe))
+            results, lat = timed_search(index, queries)
+            scored = int(np.mean([len(ivf.probe(q / np.linalg.norm(q), nprobe)) for q in queries]))
+            print(f"{'ivf nprobe=' + str(nprobe):<16}{recall(truth, results):>10.3f}"
+                  f"{np.percentile(lat, 50):>9.2f}{np.percentile(lat, 95):>9.2f}{scored:>13}")
+
+        # incremental update: add new rows, delete as many old ones, keep the centroids
+        n_new = max(1, int(exact.count * UPDATE_FRACTION))
+        if synthetic or not source:
+            new_vecs = synthetic_vectors(n_new, 3)
+        else:
+            new_vecs = np.asarray(exact.vectors[:n_new], dtype=np.float32)
+            new_vecs = new_vecs + 0.1 * rng.standard_normal(new_vecs.shape).astype(np.float32)
+        deleted = [exact.ids[int(r)] for r in rng.choice(exact.count, size=n_new, replace=False)]
+        t0 = time.perf_counter()
+        upsert(index_dir, [f"new-{i}" for i in range(n_new)], [""] * n_new, new_vecs,
+               delete_ids=deleted, ann=config)
+        print(f"\nIncremental upsert (+{n_new} rows, -{len(deleted)} rows, centroids kept): "
+              f"{time.perf_counter() - t0:.2f}s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
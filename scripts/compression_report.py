@@ -0,0 +1,102 @@
+"""
+Recall vs memory vs latency of compressed local-index search.
+
+  python scripts/compression_report.py                 # index in VECTOR_LOCAL_INDEX_DIR
+  python scripts/compression_report.py /path/to/index  # a specific local index
+  python scripts/compression_report.py --synthetic     # clustered random vectors
+
+Queries are perturbed copies of sampled index rows. For every config in
+REPORT_CONFIGS ("mode:prefix_dim:rescore", comma separated) it prints bytes
+per vector, code size, recall@k against exact search and per-query latency.
+Codes built for a real index are cached in its version directory, where the
+agent will reuse them.
+"""
+
+import os, sys, tempfile, time
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cymbal_agent"))
+from utils.local_vector_index import LocalVectorIndex, _current_version_dir, write_index  # noqa: E402
+from utils.vector_compression import CompressionConfig, bytes_per_vector  # noqa: E402
+
+load_dotenv()
+
+K = int(os.getenv("REPORT_K", "5"))
+NUM_QUERIES = int(os.getenv("REPORT_QUERIES", "200"))
+QUERY_NOISE = float(os.getenv("REPORT_QUERY_NOISE", "0.05"))
+CONFIGS = os.getenv(
+    "REPORT_CONFIGS",
+    "float32:256:10,int8:0:5,int8:0:10,int8:256:10,binary:0:10,binary:0:40,binary:256:40",
+).split(",")
+SYNTHETIC_ROWS = int(os.getenv("REPORT_SYNTHETIC_ROWS", "50000"))
+SYNTHETIC_DIM = int(os.getenv("REPORT_SYNTHETIC_DIM", "768"))
+
+
+def synthetic_index(path: str) -> str:
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(SYNTHETIC_ROWS // 100, 1), SYNTHETIC_DIM)).astype(np.float32)
+    labels = rng.integers(0, len(centers), SYNTHETIC_ROWS)
+    vecs = centers[labels] + 0.6 * rng.standard_normal((SYNTHETIC_ROWS, SYNTHETIC_DIM)).astype(np.float32)
+    ids = [f"syn-{i}" for i in range(SYNTHETIC_ROWS)]
+    write_index(path, ids, [""] * SYNTHETIC_ROWS, vecs)
+    return _current_version_dir(path)
+
+
+def timed_search(index: LocalVectorIndex, queries: np.ndarray):
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(index.search(q, K))
+        latencies.append(time.perf_counter() - t0)
+    return results, np.array(latencies) * 1000.0
+
+
+def main():
+    synthetic = "--synthetic" in sys.argv
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    index_dir = args[0] if args else os.getenv("VECTOR_LOCAL_INDEX_DIR")
+    tmp = None
+    if synthetic or not index_dir:
+        tmp = tempfile.TemporaryDirectory()
+        print(f"Building synthetic index ({SYNTHETIC_ROWS} x {SYNTHETIC_DIM}) ...")
+        version_dir = synthetic_index(tmp.name)
+    else:
+        version_dir = _current_version_dir(index_dir)
+        if version_dir is None:
+            print(f"[error] no local vector index in {index_dir}")
+            raise SystemExit(1)
+
+    exact = LocalVectorIndex(version_dir)
+    rng = np.random.default_rng(1)
+    rows = rng.choice(exact.count, size=min(NUM_QUERIES, exact.count), replace=False)
+    queries = np.asarray(exact.vectors[np.sort(rows)], dtype=np.float32)
+    queries = queries + QUERY_NOISE * rng.standard_normal(queries.shape).astype(np.float32)
+
+    truth, lat = timed_search(exact, queries)
+    truth_ids = [{n.id for n in hits} for hits in truth]
+    print(f"\nIndex: {version_dir}  rows={exact.count} dim={exact.dim}  queries={len(queries)} k={K}\n")
+    header = f"{'config':<22}{'bytes/vec':>10}{'codes MB':>10}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    print(f"{'exact float32':<22}{exact.dim * 4:>10}{exact.count * exact.dim * 4 / 1e6:>10.1f}"
+          f"{1.0:>10.3f}{np.percentile(lat, 50):>9.2f}{np.percentile(lat, 95):>9.2f}")
+
+    for spec in CONFIGS:
+        config = CompressionConfig.parse(spec.strip())
+        if config is None:
+            continue
+        index = LocalVectorIndex(version_dir, compression=config)
+        codes = index.coarse_codes()
+        results, lat = timed_search(index, queries)
+        recall = np.mean([len(t & {n.id for n in hits}) / max(len(t), 1) for t, hits in zip(truth_ids, results)])
+        print(f"{spec.strip():<22}{bytes_per_vector(config, exact.dim):>10}{codes.nbytes / 1e6:>10.1f}"
+              f"{recall:>10.3f}{np.percentile(lat, 50):>9.2f}{np.percentile(lat, 95):>9.2f}")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
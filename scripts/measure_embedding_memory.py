@@ -0,0 +1,103 @@
+"""
+Peak memory of holding ingestion embeddings as Python float lists vs float32 arrays.
+
+  python scripts/measure_embedding_memory.py               # 5000 chunks x 3072 dims
+  MEASURE_CHUNKS=100000 MEASURE_DIM=768 python scripts/measure_embedding_memory.py
+
+Replays the ingestion data flow without calling the embedding model. Each
+embedding "response" is a batch of Python float lists, as the genai client
+returns them. Two corpora are compared:
+  lists   -> every response row kept as a list (the old List[List[float]] flow)
+  float32 -> rows copied into one contiguous float32 array (the current flow)
+Both are also round-tripped through the EmbeddingStore cache. Peak memory is
+measured with tracemalloc.
+"""
+
+import os, sys, tempfile, tracemalloc
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cymbal_agent"))
+from utils.embedding_store import EmbeddingStore  # noqa: E402
+
+load_dotenv()
+
+CHUNKS = int(os.getenv("MEASURE_CHUNKS", "5000"))
+DIM = int(os.getenv("MEASURE_DIM", "3072"))
+BATCH = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "250"))
+
+
+def responses(rng):
+    """Yields embedding responses: lists of per-text Python float lists."""
+    for start in range(0, CHUNKS, BATCH):
+        n = min(BATCH, CHUNKS - start)
+        yield [rng.standard_normal(DIM).tolist() for _ in range(n)]
+
+
+def as_lists(rng):
+    out = []
+    for resp in responses(rng):
+        out.extend(resp)
+    return out
+
+
+def as_float32(rng):
+    out = np.empty((CHUNKS, DIM), dtype=np.float32)
+    row = 0
+    for resp in responses(rng):
+        for values in resp:
+            out[row] = values
+            row += 1
+    return out
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    result = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def store_roundtrip(store: EmbeddingStore, keys, as_list: bool):
+    found = store.get_many(keys)
+    if as_list:
+        return [found[k].tolist() for k in keys]
+    out = np.empty((len(keys), DIM), dtype=np.float32)
+    for i, k in enumerate(keys):
+        out[i] = found[k]
+    return out
+
+
+def main():
+    print(f"{CHUNKS} chunks x {DIM} dims, {BATCH} texts per embedding request\n")
+    raw_mb = CHUNKS * DIM * 4 / 1e6
+
+    lists, peak_lists = measure(as_lists, np.random.default_rng(0))
+    del lists
+    vecs, peak_f32 = measure(as_float32, np.random.default_rng(0))
+
+    print(f"{'embedding results':<28}{'peak MB':>10}{'per vector KB':>15}")
+    print(f"{'  List[List[float]]':<28}{peak_lists / 1e6:>10.1f}{peak_lists / CHUNKS / 1e3:>15.1f}")
+    print(f"{'  float32 array':<28}{peak_f32 / 1e6:>10.1f}{peak_f32 / CHUNKS / 1e3:>15.1f}")
+    print(f"  -> {peak_lists / max(peak_f32, 1):.1f}x less (raw float32 payload is {raw_mb:.1f} MB)\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(os.path.join(tmp, "embeddings.sqlite"))
+        keys = [f"k{i}" for i in range(CHUNKS)]
+        for start in range(0, CHUNKS, BATCH):
+            store.put_many(dict(zip(keys[start:start + BATCH], vecs[start:start + BATCH])))
+        del vecs
+        _, peak_cache_lists = measure(store_roundtrip, store, keys, True)
+        _, peak_cache_f32 = measure(store_roundtrip, store, keys, False)
+        store.close()
+
+    print(f"{'embedding cache read':<28}{'peak MB':>10}")
+    print(f"{'  as Python lists':<28}{peak_cache_lists / 1e6:>10.1f}")
+    print(f"{'  as float32':<28}{peak_cache_f32 / 1e6:>10.1f}")
+    print(f"  -> {peak_cache_lists / max(peak_cache_f32, 1):.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Import-time profile of the agent package (the cold-start path on Cloud Run).
+
+  python scripts/profile_startup.py                        # import cymbal_agent
+  python scripts/profile_startup.py cymbal_agent.tools     # any module
+  python scripts/profile_startup.py cymbal_agent --top 40
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+prints the wall time, the slowest top-level imports (cumulative and self),
+and which heavy client libraries were loaded during the import versus left
+for their first use. Client warm-up is disabled for the run so only import
+cost is measured (set PROFILE_KEEP_WARMUP=1 to keep it).
+"""
+
+import os, sys, subprocess
+
+from dotenv import load_dotenv
+load_dotenv()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Libraries that should not be needed until a tool actually runs
+DEFERRED = [
+    "vertexai",
+    "google.cloud.aiplatform",
+    "google.cloud.aiplatform_v1",
+    "google.genai",
+    "google.cloud.storage",
+    "bs4",
+    "requests",
+    "PyPDF2",
+]
+
+
+def parse_importtime(stderr: str):
+    """-> list of (module, self_us, cumulative_us, depth)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def main():
+    argv = sys.argv[1:]
+    top = 25
+    if "--top" in argv:
+        i = argv.index("--top")
+        top = int(argv[i + 1])
+        del argv[i:i + 2]
+    module = argv[0] if argv else "cymbal_agent"
+
+    env = dict(os.environ)
+    if env.get("PROFILE_KEEP_WARMUP") != "1":
+        env["CLIENT_WARM_ON_STARTUP"] = "0"
+    code = (
+        "import time; t0 = time.perf_counter(); "
+        f"import {module}; "
+        "print(f'WALL {time.perf_counter() - t0:.3f}')"
+    )
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:])
+        print(f"[error] import {module} failed (exit {proc.returncode})")
+        raise SystemExit(proc.returncode)
+
+    rows = parse_importtime(proc.stderr)
+    wall = next((line.split()[1] for line in proc.stdout.splitlines() if line.startswith("WALL ")), "?")
+
+    print(f"import {module}: {wall}s wall, {len(rows)} modules loaded\n")
+    print("Slowest top-level imports (cumulative ms):")
+    for name, _, cum, _ in sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])[:top]:
+        print(f"  {cum / 1000:9.1f}  {name}")
+    print("\nSlowest modules by own time (self ms):")
+    for name, self_us, _, _ in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"  {self_us / 1000:9.1f}  {name}")
+
+    print("\nClient libraries:")
+    for name in DEFERRED:
+        cum = max((r[2] for r in rows if r[0] == name), default=None)
+        state = f"loaded at import ({cum / 1000:.1f} ms)" if cum is not None else "deferred to first use"
+        print(f"  {name:<28} {state}")
+
+
+if __name__ == "__main__":
+    main()
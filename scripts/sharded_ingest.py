@@ -0,0 +1,66 @@
+"""
+Sharded ingestion, for corpus rebuilds that one build_and_upsert process cannot finish in time.
+
+  python scripts/sharded_ingest.py plan   gs://bucket/docs/ <index resource> gs://bucket/_index/mapping/ 16 [--full]
+  python scripts/sharded_ingest.py work   gs://bucket/_index/mapping/ [--processes 4]   # on any number of nodes
+  python scripts/sharded_ingest.py status gs://bucket/_index/mapping/
+  python scripts/sharded_ingest.py merge  gs://bucket/_index/mapping/
+
+`plan` lists the prefix once and hash-partitions the objects into shards.
+Every `work` process claims shards through lease records (under the work
+area, or INGEST_SHARD_LEASE_URI: a gs:// prefix or a local directory) and
+ingests them into per-shard partial mappings; a worker that dies lets its
+lease expire (INGEST_SHARD_LEASE_SECONDS) and another one resumes the shard
+from its checkpoint. `merge`, run once every shard is done, folds the partial
+mappings and manifests into the main ones and removes stale datapoints.
+Workers need the same .env as a normal ingestion run.
+"""
+
+import argparse, os, sys, subprocess
+
+from dotenv import load_dotenv
+load_dotenv()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sharded ingestion: plan -> work (any number) -> merge")
+    sub = parser.add_subparsers(dest="command", required=True)
+    plan = sub.add_parser("plan", help="list the prefix and partition it into shards")
+    plan.add_argument("gcs_prefix")
+    plan.add_argument("index_resource_name")
+    plan.add_argument("mapping_uri")
+    plan.add_argument("shards", type=int)
+    plan.add_argument("--full", action="store_true", help="re-ingest every object")
+    work = sub.add_parser("work", help="claim and ingest shards until none is left")
+    work.add_argument("mapping_uri")
+    work.add_argument("--processes", type=int, default=1, help="worker processes on this node")
+    for name in ("status", "merge"):
+        sub.add_parser(name).add_argument("mapping_uri")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.command == "work" and args.processes > 1:
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", args.mapping_uri])
+                 for _ in range(args.processes)]
+        raise SystemExit(max(p.wait() for p in procs))
+
+    from cymbal_agent.tools import knowledge_search_tools as kst
+
+    if args.command == "plan":
+        kst.plan_sharded_ingest(args.gcs_prefix, args.index_resource_name, args.mapping_uri, args.shards,
+                                full_rebuild=args.full)
+    elif args.command == "work":
+        kst.run_shard_worker(args.mapping_uri)
+    elif args.command == "status":
+        kst.sharded_ingest_status(args.mapping_uri)
+    else:
+        kst.merge_sharded_ingest(args.mapping_uri)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,14 @@
+"""
+Settings the cymbal_agent package needs at import time (read by module-level
+os.getenv calls), so the tests run without a .env file. Real values win.
+"""
+
+import os
+
+os.environ.setdefault("VECTOR_DEFAULT_EMBED_DIM", "8")
+os.environ.setdefault("GCS_LIST_BUCKETS_MAX_RESULTS", "100")
+os.environ.setdefault("GCS_LIST_BLOBS_MAX_RESULTS", "100")
+os.environ.setdefault("ADK_DB_URL", "sqlite:///:memory:")
+os.environ.setdefault("AGENT_NAME", "cymbal_agent_test")
+os.environ.setdefault("AGENT_MODEL", "gemini-2.0-flash")
+os.environ.setdefault("CLIENT_WARM_ON_STARTUP", "0")
@@ -0,0 +1,139 @@
+"""AIMD limits and AdaptiveControl: growth and backoff, error classification and the retry cap."""
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.utils.adaptive_control import (  # noqa: E402
+    THROTTLE, TRANSIENT, AdaptiveControl, AimdLimit, classify_error,
+)
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class ServerError(Exception):
+    pass
+
+
+class _Code:
+    def __init__(self, name):
+        self.name = name
+
+
+class _RpcError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self._status = status
+
+    def code(self):
+        return _Code(self._status)
+
+
+class _HttpError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def _control(**kwargs):
+    sleeps = []
+    control = AdaptiveControl(
+        "test",
+        concurrency=AimdLimit(initial=4, minimum=1, maximum=8, step=1, window=2),
+        batch=AimdLimit(initial=1000, minimum=100, maximum=2000, step=100, window=2),
+        cooldown=0, sleep=sleeps.append, **kwargs,
+    )
+    return control, sleeps
+
+
+def _flaky(*errors):
+    """A call that raises `errors` in order, then returns "ok"."""
+    pending = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if pending:
+            raise pending.pop(0)
+        return "ok"
+    return fn, calls
+
+
+def test_limit_grows_additively_and_backs_off_multiplicatively():
+    limit = AimdLimit(initial=4, minimum=1, maximum=6, step=1, window=3)
+    for _ in range(5):
+        limit.increase()
+    assert limit.value == 5   # one step per full window of successes
+    limit.decrease()
+    assert limit.value == 2.5
+    limit.increase()
+    limit.increase()
+    assert limit.value == 2.5   # the window restarts after a decrease
+    for _ in range(30):
+        limit.increase()
+    assert limit.value == 6
+    for _ in range(10):
+        limit.decrease()
+    assert limit.value == 1 and int(limit) == 1
+
+
+def test_classify_error():
+    assert classify_error(ResourceExhausted()) == THROTTLE
+    assert classify_error(ServerError()) == TRANSIENT
+    assert classify_error(_RpcError("UNAVAILABLE")) == THROTTLE
+    assert classify_error(_RpcError("INTERNAL")) == TRANSIENT
+    assert classify_error(_RpcError("INVALID_ARGUMENT")) is None
+    assert classify_error(_HttpError(429)) == THROTTLE
+    assert classify_error(_HttpError(502)) == TRANSIENT
+    assert classify_error(_HttpError(400)) is None
+    assert classify_error(TimeoutError()) == THROTTLE
+    assert classify_error(ConnectionResetError()) == TRANSIENT
+    assert classify_error(ValueError()) is None
+
+
+def test_throttling_is_retried_and_halves_the_limits():
+    control, sleeps = _control()
+    fn, calls = _flaky(ResourceExhausted("429"))
+    assert control.call(fn) == "ok"
+    assert len(calls) == 2 and len(sleeps) == 1
+    snap = control.snapshot()
+    assert (snap["concurrency"], snap["batch"], snap["throttled"], snap["retries"]) == (2, 500, 1, 1)
+    assert control.batch_limit() == 500 and control.max_concurrency == 8
+
+
+def test_transient_errors_are_retried_without_backing_off():
+    control, sleeps = _control()
+    fn, calls = _flaky(ServerError(), ConnectionResetError())
+    assert control.call(fn) == "ok"
+    snap = control.snapshot()
+    assert len(calls) == 3 and len(sleeps) == 2
+    assert (snap["concurrency"], snap["batch"], snap["throttled"]) == (4, 1000, 0)
+
+
+def test_other_errors_are_raised_immediately():
+    control, sleeps = _control()
+    fn, calls = _flaky(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        control.call(fn)
+    assert len(calls) == 1 and sleeps == [] and control.snapshot()["failures"] == 1
+
+
+def test_max_attempts_caps_retries_and_backoff():
+    control, sleeps = _control(max_attempts=3, base_delay=1.0, max_delay=3.0)
+    fn, calls = _flaky(*[ResourceExhausted()] * 10)
+    with pytest.raises(ResourceExhausted):
+        control.call(fn)
+    assert len(calls) == 3 and len(sleeps) == 2
+    assert all(0 <= s <= 3.0 for s in sleeps)
+    assert all(0 <= control.backoff_delay(a) <= 3.0 for a in range(10))
+    assert control.snapshot()["failures"] == 1
+
+
+def test_successes_grow_both_limits():
+    control, _ = _control()
+    for _ in range(4):
+        control.call(lambda: None)
+    snap = control.snapshot()
+    assert (snap["concurrency"], snap["batch"], snap["succeeded"]) == (6, 1200, 4)
@@ -0,0 +1,126 @@
+"""build_and_upsert with content-addressed chunk IDs (INGEST_ID_MODE=content) against an in-memory bucket."""
+
+import hashlib
+import random
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.tools import knowledge_search_tools as kst  # noqa: E402
+from cymbal_agent.utils.content_chunking import content_defined_chunks  # noqa: E402
+
+PREFIX = "gs://bucket/docs/"
+
+
+def _doc(seed: int, words: int = 900) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(500)}" for _ in range(words))
+
+
+@pytest.fixture
+def bucket(monkeypatch, tmp_path):
+    """uri -> (generation, text); build_and_upsert lists and downloads from it."""
+    objects = {}
+    embedded = []
+
+    def iter_objects(prefix, exts=None):
+        for uri, (generation, text) in sorted(objects.items()):
+            if uri.startswith(prefix):
+                yield {"uri": uri, "generation": generation, "size": len(text),
+                       "crc32c": hashlib.md5(text.encode("utf-8")).hexdigest()}
+
+    def embed(texts, dim):
+        embedded.extend(texts)
+        return np.stack([np.random.default_rng(zlib.crc32(t.encode("utf-8"))).standard_normal(dim)
+                         for t in texts]).astype(np.float32)
+
+    monkeypatch.setattr(kst, "iter_gcs_objects", iter_objects)
+    monkeypatch.setattr(kst, "download_gcs_bytes", lambda uri: objects[uri][1].encode("utf-8"))
+    monkeypatch.setattr(kst, "extract_text", lambda uri, raw: raw.decode("utf-8"))
+    monkeypatch.setattr(kst, "_embed_batch", embed)
+    monkeypatch.setattr(kst, "INGEST_ID_MODE", "content")
+    for name in ("VECTOR_LOCAL_INDEX_DIR", "CHUNK_STORE_PATH", "NEAR_DUP_INDEX_URI", "EMBED_CACHE_PATH",
+                 "EMBED_CACHE_GCS_URI", "EXTRACT_CACHE_PATH", "EXTRACT_CACHE_GCS_URI", "LEXICAL_INDEX_URI",
+                 "KNOWLEDGE_INDEX_VERSION_URI", "INGEST_CHECKPOINT_URI"):
+        monkeypatch.setattr(kst, name, None)
+    monkeypatch.chdir(tmp_path)
+    return objects, embedded, str(tmp_path / "mapping") + "/"
+
+
+def _state(mapping_uri):
+    manifest = kst.load_manifest_from_gcs(kst.manifest_uri_for(mapping_uri))
+    return manifest, dict(kst.open_mapping_store(mapping_uri).iter_items())
+
+
+def test_copied_file_in_one_run_is_embedded_once(bucket):
+    objects, embedded, mapping_uri = bucket
+    text = _doc(0)
+    objects[PREFIX + "orig.txt"] = (1, text)
+    objects[PREFIX + "copy.txt"] = (1, text)
+
+    kst.build_and_upsert(PREFIX, None, mapping_uri)
+
+    manifest, mapping = _state(mapping_uri)
+    assert sorted(manifest.entries) == [PREFIX + "copy.txt", PREFIX + "orig.txt"]
+    assert set(mapping) == set(manifest.ids_for(PREFIX + "orig.txt")) == set(manifest.ids_for(PREFIX + "copy.txt"))
+    assert len(embedded) == len(mapping)
+    assert all(set(entry["sources"]) == {PREFIX + "orig.txt", PREFIX + "copy.txt"} for entry in mapping.values())
+
+
+def test_moved_file_is_not_embedded_again(bucket):
+    objects, embedded, mapping_uri = bucket
+    objects[PREFIX + "old/a.txt"] = (1, _doc(1))
+    kst.build_and_upsert(PREFIX, None, mapping_uri)
+    embedded.clear()
+
+    objects[PREFIX + "new/a.txt"] = objects.pop(PREFIX + "old/a.txt")
+    kst.build_and_upsert(PREFIX, None, mapping_uri)
+
+    manifest, mapping = _state(mapping_uri)
+    assert embedded == []
+    assert list(manifest.entries) == [PREFIX + "new/a.txt"]
+    assert set(mapping) == set(manifest.ids_for(PREFIX + "new/a.txt"))
+    assert all(entry["sources"].keys() == {PREFIX + "new/a.txt"} for entry in mapping.values())
+
+
+def test_near_duplicate_copies_in_one_run(bucket, monkeypatch, tmp_path):
+    objects, embedded, mapping_uri = bucket
+    monkeypatch.setattr(kst, "NEAR_DUP_INDEX_URI", str(tmp_path / "near_dup.bin"))
+    text = _doc(2)
+    words = text.split()
+    near = " ".join(words[:5] + ["edited"] + words[6:])   # differs from text in one word of the first chunk
+    objects[PREFIX + "a.txt"] = (1, text)
+    objects[PREFIX + "b.txt"] = (1, near)   # collapses onto a.txt's chunk
+    objects[PREFIX + "c.txt"] = (1, near)   # same content IDs as b.txt, including the collapsed one
+
+    kst.build_and_upsert(PREFIX, None, mapping_uri)
+
+    manifest, mapping = _state(mapping_uri)
+    assert sorted(manifest.entries) == [PREFIX + "a.txt", PREFIX + "b.txt", PREFIX + "c.txt"]
+    assert set(mapping) == {cid for uri in manifest.entries for cid in manifest.ids_for(uri)}
+    assert any("duplicate_of" in entry for entry in mapping.values())
+
+
+def test_chunking_normalizes_whitespace():
+    words = _doc(3).split()
+    spaced = " ".join(words)
+    lines = "\n".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12))   # extracted PDF lines
+    assert content_defined_chunks(lines) == content_defined_chunks(spaced)
+    assert content_defined_chunks("  \t ") == content_defined_chunks("\n\n") == []
+
+
+def test_newline_text_and_blank_objects(bucket):
+    objects, embedded, mapping_uri = bucket
+    words = _doc(4).split()
+    objects[PREFIX + "lines.txt"] = (1, "\n".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12)))
+    objects[PREFIX + "blank.txt"] = (1, " \n\n  ")
+
+    kst.build_and_upsert(PREFIX, None, mapping_uri)
+
+    manifest, mapping = _state(mapping_uri)
+    assert manifest.ids_for(PREFIX + "blank.txt") == []
+    assert sorted(embedded) == sorted(content_defined_chunks(" ".join(words), target_chars=1000, overlap=100))
+    assert all(entry["text"].strip() and "\n" not in entry["text"] for entry in mapping.values())
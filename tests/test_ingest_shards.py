@@ -0,0 +1,101 @@
+"""Shard leases over a local directory: claim, expiry and takeover, release, complete and fencing."""
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.utils.ingest_shards import (  # noqa: E402
+    LeaseKeeper, LeaseLost, LocalLeaseBackend, ShardLeases, shard_of,
+)
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def workers(tmp_path, clock):
+    """Two workers sharing one lease directory and one clock."""
+    def worker(owner: str, shards: int = 2) -> ShardLeases:
+        return ShardLeases(LocalLeaseBackend(str(tmp_path)), shards, ttl_seconds=60, owner=owner, clock=clock)
+    return worker
+
+
+def test_shard_of_is_stable_and_in_range():
+    uris = [f"gs://b/docs/{i}.pdf" for i in range(200)]
+    assert [shard_of(u, 7) for u in uris] == [shard_of(u, 7) for u in uris]
+    assert set(shard_of(u, 7) for u in uris) == set(range(7))
+    assert shard_of("gs://b/x", 0) == 0
+
+
+def test_each_shard_is_claimed_once(workers):
+    a, b = workers("a"), workers("b")
+    claimed = {a.claim(), b.claim()}
+    assert claimed == {0, 1}
+    assert a.claim() is None and b.claim() is None
+    assert {r["owner"] for r in a.status().values()} == {"a", "b"}
+
+
+def test_expired_lease_is_taken_over(workers, clock):
+    a, b = workers("a", shards=1), workers("b", shards=1)
+    assert a.claim() == 0
+    clock.now += 59
+    assert b.claim() is None   # still leased
+    assert a.renew(0)
+    clock.now += 50
+    assert b.claim() is None   # renewed at +59, so it runs to +119
+    clock.now += 11
+    assert b.claim() == 0
+    record = b.status()[0]
+    assert (record["owner"], record["attempt"]) == ("b", 2)
+    assert not a.renew(0) and not a.complete(0) and not a.release(0)   # the old owner can no longer write
+    assert b.status()[0]["owner"] == "b"
+
+
+def test_release_frees_the_shard_at_once(workers):
+    a, b = workers("a", shards=1), workers("b", shards=1)
+    assert a.claim() == 0
+    assert a.release(0)
+    assert b.claim() == 0
+    assert b.status()[0]["attempt"] == 2
+
+
+def test_complete_is_final(workers, clock):
+    a, b = workers("a", shards=1), workers("b", shards=1)
+    assert a.claim() == 0
+    assert a.complete(0, files=3)
+    clock.now += 10_000
+    assert b.claim() is None
+    assert a.status()[0]["state"] == "done" and a.status()[0]["files"] == 3
+    assert a.all_done()
+    a.clear()
+    assert a.status()[0]["state"] == "pending"
+
+
+def test_keeper_fences_writes_once_the_lease_is_lost(workers, clock):
+    a, b = workers("a", shards=1), workers("b", shards=1)
+    assert a.claim() == 0
+    keeper = LeaseKeeper(a, 0)
+    keeper.check()
+    clock.now += 50
+    assert keeper.renew()
+    clock.now += 50
+    keeper.check()   # renewed at +50: good until +110
+    clock.now += 20
+    with pytest.raises(LeaseLost):
+        keeper.check()   # lapsed by the local clock, before any renewal failed
+
+    keeper = LeaseKeeper(a, 0)
+    assert b.claim() == 0   # expired: taken over
+    assert not keeper.renew()
+    with pytest.raises(LeaseLost):
+        keeper.check()
@@ -0,0 +1,85 @@
+"""BM25 lexical index: ranking, confidence, serialization and reciprocal rank fusion."""
+
+import math
+import random
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.utils import lexical_index as lx  # noqa: E402
+
+DOCS = [
+    ("hs", "HS code classification for imported steel. The HS code decides the duty rate."),
+    ("duty", "Duty rates depend on the origin of the goods and trade agreements."),
+    ("steel", "Steel shipments need a mill certificate and an inspection report."),
+    ("leave", "Employees request annual leave in the HR portal two weeks ahead."),
+    ("empty", ""),
+]
+
+
+def _bm25(docs, query):
+    """Textbook BM25 over whole token lists, for comparison."""
+    tokenized = {cid: lx.tokenize(text) for cid, text in docs}
+    avgdl = sum(map(len, tokenized.values())) / len(tokenized)
+    scores = {}
+    for term in set(lx.tokenize(query)):
+        df = sum(term in toks for toks in tokenized.values())
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for cid, toks in tokenized.items():
+            tf = toks.count(term)
+            if tf:
+                norm = lx.BM25_K1 * (1 - lx.BM25_B + lx.BM25_B * len(toks) / avgdl)
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (lx.BM25_K1 + 1) / (tf + norm)
+    return scores
+
+
+def test_search_ranks_like_bm25():
+    index = lx.LexicalIndex.build(DOCS)
+    hits = index.search("What is the HS code for steel?", k=3)
+    assert [h.id for h in hits] == ["hs", "steel"]
+    expected = _bm25(DOCS, "What is the HS code for steel?")
+    assert all(math.isclose(h.score, expected[h.id]) for h in hits)
+    assert index.search("the of and", k=3) == []   # stopwords only
+    assert index.search("unknownterm", k=3) == []
+
+
+def test_random_corpus_matches_reference():
+    rng = random.Random(0)
+    docs = [(f"d{i}", " ".join(f"t{rng.randrange(40)}" for _ in range(rng.randrange(1, 30)))) for i in range(200)]
+    index = lx.LexicalIndex.build(docs)
+    for query in ("t1 t2", "t7", "t3 t3 t30 t39"):
+        expected = _bm25(docs, query)
+        hits = index.search(query, k=len(docs))
+        assert {h.id for h in hits} == set(expected)
+        assert all(math.isclose(h.score, expected[h.id]) for h in hits)
+        assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+
+def test_is_confident():
+    index = lx.LexicalIndex.build(DOCS)
+    assert index.is_confident("HS code", index.search("HS code", k=5))
+    assert not index.is_confident("HS code leave", index.search("HS code leave", k=5))   # top hit lacks "leave"
+    assert not index.is_confident("HS code", index.search("HS code", k=5), max_terms=1)
+    assert not index.is_confident("nothing here", [])
+
+
+def test_serialization_round_trip():
+    index = lx.LexicalIndex.build(DOCS, keep_texts=True)
+    restored = lx.LexicalIndex.from_bytes(index.to_bytes())
+    assert restored.ids == index.ids and len(restored) == len(DOCS)
+    assert restored.search("duty rate", k=5) == index.search("duty rate", k=5)
+    assert restored.text_of("leave") == DOCS[3][1] and restored.text_of("missing") == ""
+    assert lx.LexicalIndex.from_bytes(lx.LexicalIndex.build(DOCS).to_bytes()).text_of("hs") == ""
+
+    raw = bytearray(index.to_bytes())
+    raw[8:8 + len(b'{"version": 1')] = b'{"version": 9'
+    with pytest.raises(ValueError):
+        lx.LexicalIndex.from_bytes(bytes(raw))
+
+
+def test_reciprocal_rank_fusion():
+    fused = lx.reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [cid for cid, _ in fused] == ["b", "a", "d", "c"]
+    assert math.isclose(dict(fused)["b"], 1 / 62 + 1 / 61)
+    assert lx.reciprocal_rank_fusion([]) == []
@@ -0,0 +1,88 @@
+"""Memory-mapped local vector index: exact search, CURRENT switching and version pruning."""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.utils import local_vector_index as lvi  # noqa: E402
+
+
+def _rows(n: int, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = [f"id{i}" for i in range(n)]
+    return ids, [f"text {i}" for i in range(n)], rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def _versions(index_dir: str):
+    return sorted(d for d in os.listdir(index_dir) if d.startswith("v-"))
+
+
+def test_top_k_matches_brute_force(tmp_path):
+    ids, texts, vecs = _rows(500)
+    lvi.write_index(str(tmp_path), ids, texts, vecs)
+    index = lvi.LocalVectorIndex(lvi._current_version_dir(str(tmp_path)))
+    queries = np.random.default_rng(1).standard_normal((5, 16)).astype(np.float32)
+
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    for q, hits in zip(queries, index.search_many(queries, k=10)):
+        scores = unit @ (q / np.linalg.norm(q))
+        expected = np.argsort(-scores)[:10]
+        assert [h.id for h in hits] == [ids[i] for i in expected]
+        assert [h.text for h in hits] == [texts[i] for i in expected]
+        assert np.allclose([h.score for h in hits], scores[expected], atol=1e-5)
+
+
+def test_search_rejects_wrong_dimension(tmp_path):
+    ids, texts, vecs = _rows(10)
+    lvi.write_index(str(tmp_path), ids, texts, vecs)
+    index = lvi.LocalVectorIndex(lvi._current_version_dir(str(tmp_path)))
+    with pytest.raises(ValueError):
+        index.search(np.ones(8, dtype=np.float32), k=3)
+
+
+def test_open_index_follows_current(tmp_path):
+    index_dir = str(tmp_path)
+    ids, texts, vecs = _rows(20)
+    lvi.write_index(index_dir, ids, texts, vecs)
+    first = lvi.open_index(index_dir, reload_seconds=0)
+    assert lvi.open_index(index_dir, reload_seconds=0) is first   # same version: same handle
+
+    lvi.upsert(index_dir, ["new"], ["new text"], vecs[:1] * -1, delete_ids=["id3"])
+    second = lvi.open_index(index_dir, reload_seconds=0)
+    assert second is not first and second.count == 20
+    assert "new" in list(second.ids) and "id3" not in list(second.ids)
+    assert first.count == 20 and "id3" in list(first.ids)   # the old version stays readable
+    assert lvi.open_index(index_dir, reload_seconds=3600) is second
+
+
+def test_old_versions_are_pruned(tmp_path):
+    index_dir = str(tmp_path)
+    ids, texts, vecs = _rows(5)
+    published = []
+    for i in range(lvi.KEEP_VERSIONS + 3):
+        published.append(lvi.upsert(index_dir, [f"extra{i}"], ["x"], vecs[:1]))
+        os.utime(os.path.join(index_dir, f"v-{published[-1]}"), (i, i))   # publish order, whatever the clock
+    remaining = _versions(index_dir)
+    assert len(remaining) == lvi.KEEP_VERSIONS
+    assert f"v-{published[-1]}" in remaining
+    assert lvi._current_version_dir(index_dir).endswith(f"v-{published[-1]}")
+
+
+def test_one_update_for_many_batches_publishes_once(tmp_path):
+    index_dir = str(tmp_path)
+    ids, texts, vecs = _rows(30)
+    lvi.write_index(index_dir, ids[:10], texts[:10], vecs[:10])
+    before = _versions(index_dir)
+
+    update = lvi.IndexUpdate(index_dir)
+    for start in (10, 20):
+        update.add(ids[start:start + 10], texts[start:start + 10], vecs[start:start + 10])
+    update.delete(["id0", "id25"])
+    version = update.commit()
+
+    assert _versions(index_dir) == sorted(before + [f"v-{version}"])
+    index = lvi.open_index(index_dir, reload_seconds=0)
+    assert sorted(index.ids) == sorted(i for i in ids if i not in ("id0", "id25"))
@@ -0,0 +1,109 @@
+"""SegmentedMappingStore over an in-memory object store: round-trips, deletes, compaction and bloom filters."""
+
+import pytest
+
+pytest.importorskip("google.adk")
+
+from cymbal_agent.utils.mapping_store import SegmentedMappingStore  # noqa: E402
+
+ROOT = "gs://bucket/mapping/"
+
+
+class _Objects:
+    """uri -> bytes, recording every read."""
+
+    def __init__(self):
+        self.data = {}
+        self.reads = []
+
+    def read(self, uri):
+        self.reads.append(uri)
+        return self.data.get(uri)
+
+    def write(self, uri, raw, content_type=None):
+        self.data[uri] = raw
+
+    def delete(self, uri):
+        self.data.pop(uri, None)
+
+    def open(self, **kwargs):
+        return SegmentedMappingStore(ROOT, self.read, self.write, self.delete, **kwargs)
+
+
+def _entry(i: int) -> dict:
+    return {"source": f"gs://docs/{i % 7}.pdf", "chunk_index": i, "text": f"chunk {i}"}
+
+
+def test_round_trip_across_runs():
+    objects = _Objects()
+    store = objects.open(segment_max_entries=40)
+    store.put_many({f"id{i}": _entry(i) for i in range(100)})
+    assert store.flush() == 100
+    store.put_many({"id5": {**_entry(5), "text": "edited"}, "new": _entry(500)})
+    store.flush()
+
+    reopened = objects.open()
+    assert len(reopened._index["segments"]) == 4   # 40 + 40 + 20, then the second run's segment
+    assert reopened.get("id5")["text"] == "edited"
+    assert reopened.get_many(["id0", "id99", "new", "missing"]) == {
+        "id0": _entry(0), "id99": _entry(99), "new": _entry(500)}
+    items = dict(reopened.iter_items())
+    assert len(items) == 101 and items["id5"]["text"] == "edited"
+
+
+def test_delete_and_compaction():
+    objects = _Objects()
+    store = objects.open(segment_max_entries=10)
+    store.put_many({f"id{i}": _entry(i) for i in range(30)})
+    store.flush()
+    store.delete_many(["id1", "id2", "id25"])
+    store.put_many({"id3": {**_entry(3), "text": "v2"}})
+    store.flush()
+    assert store.get("id1") is None and "id2" not in store
+    old_files = set(objects.data)
+
+    assert store.compact(max_segments=10) is False   # 4 segments: under the threshold
+    assert store.compact() is True
+    segments = store._index["segments"]
+    assert [s["count"] for s in segments] == [10, 10, 7]
+    assert not any(uri in objects.data for uri in old_files if "/seg-" in uri)
+
+    reopened = objects.open()
+    items = dict(reopened.iter_items())
+    assert sorted(items) == sorted(f"id{i}" for i in range(30) if i not in (1, 2, 25))
+    assert items["id3"]["text"] == "v2"
+
+
+def test_bloom_filter_skips_segments_without_the_id():
+    objects = _Objects()
+    store = objects.open(segment_max_entries=50)
+    for run in range(5):
+        store.put_many({f"r{run}-{i}": _entry(i) for i in range(50)})
+        store.flush()
+
+    reopened = objects.open()
+    objects.reads.clear()
+    assert reopened.get("r0-7") == _entry(7)
+    id_reads = [uri for uri in objects.reads if uri.endswith(".ids.gz")]
+    assert id_reads == [ROOT + "seg-000001.ids.gz"]   # the four newer filters miss
+
+    objects.reads.clear()
+    assert reopened.get_many([f"absent{i}" for i in range(20)]) == {}
+    assert len([uri for uri in objects.reads if uri.endswith(".ids.gz")]) <= 2   # ~1% false positives
+
+
+def test_segments_without_bloom_filters_still_resolve():
+    objects = _Objects()
+    store = objects.open()
+    store.put_many({"b": _entry(1), "a": _entry(2)})
+    store.flush()
+    seg = store._index["segments"][0]
+    del seg["bloom"]   # a segment written before filters existed
+    objects.delete(ROOT + "seg-000001.bloom")
+    store._write_index()
+
+    reopened = objects.open()
+    assert reopened.get("a") == _entry(2) and reopened.get("missing") is None
+    reopened.put_many({"c": _entry(3)})
+    reopened.flush()
+    assert dict(objects.open().iter_items()).keys() == {"a", "b", "c"}